@@ -0,0 +1,133 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Compare the pairwise IoU loop of PhotographerFacade.merge_control_list with the indexed merge of
+ufo.utils.control_merge over synthetic controls. Run it from the root of the repository with:
+
+    python -m benchmarks.control_merge
+"""
+
+import time
+from typing import List
+
+import numpy as np
+
+from ufo.utils.control_merge import merge_controls
+
+
+class _Rect:
+    """
+    A rectangle with the attributes of the pywinauto RECT.
+    """
+
+    def __init__(self, left: int, top: int, right: int, bottom: int) -> None:
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+
+class _FakeControl:
+    """
+    A control with only a rectangle.
+    """
+
+    def __init__(self, rect: _Rect) -> None:
+        self._rect = rect
+
+    def rectangle(self) -> _Rect:
+        return self._rect
+
+
+def _synthetic_controls(
+    num_controls: int, width: int, height: int, rng: np.random.Generator
+) -> List[_FakeControl]:
+    """
+    Generate synthetic controls.
+    :param num_controls: The number of controls.
+    :param width: The width of the window.
+    :param height: The height of the window.
+    :param rng: The random generator.
+    :return: The controls.
+    """
+    left = rng.integers(0, width - 300, num_controls)
+    top = rng.integers(0, height - 100, num_controls)
+    right = left + rng.integers(10, 300, num_controls)
+    bottom = top + rng.integers(10, 100, num_controls)
+    return [
+        _FakeControl(_Rect(*rect))
+        for rect in np.stack([left, top, right, bottom], axis=1).tolist()
+    ]
+
+
+def control_iou(control1: _FakeControl, control2: _FakeControl) -> float:
+    """
+    The IoU of two controls, as computed by PhotographerFacade.control_iou.
+    :param control1: The first control.
+    :param control2: The second control.
+    :return: The IoU.
+    """
+    rect1 = control1.rectangle()
+    rect2 = control2.rectangle()
+
+    left = max(rect1.left, rect2.left)
+    top = max(rect1.top, rect2.top)
+    right = min(rect1.right, rect2.right)
+    bottom = min(rect1.bottom, rect2.bottom)
+
+    intersection_area = max(0, right - left) * max(0, bottom - top)
+    area1 = (rect1.right - rect1.left) * (rect1.bottom - rect1.top)
+    area2 = (rect2.right - rect2.left) * (rect2.bottom - rect2.top)
+
+    return intersection_area / (area1 + area2 - intersection_area)
+
+
+def benchmark(
+    num_main: int = 500,
+    num_additional: int = 200,
+    width: int = 1920,
+    height: int = 1080,
+    repeat: int = 5,
+) -> None:
+    """
+    Compare the pairwise IoU loop with the indexed merge.
+    :param num_main: The number of UI Automation controls.
+    :param num_additional: The number of grounding controls.
+    :param width: The width of the window.
+    :param height: The height of the window.
+    :param repeat: The number of repetitions.
+    """
+    rng = np.random.default_rng(0)
+    main_controls = _synthetic_controls(num_main, width, height, rng)
+    additional_controls = _synthetic_controls(num_additional, width, height, rng)
+
+    def legacy() -> List[_FakeControl]:
+        merged = main_controls.copy()
+        for additional_control in additional_controls:
+            if not any(
+                control_iou(additional_control, main_control) > 0.1
+                for main_control in main_controls
+            ):
+                merged.append(additional_control)
+        return merged
+
+    def indexed() -> List[_FakeControl]:
+        return merge_controls(main_controls, additional_controls)
+
+    results = {}
+    for name, func in [("Pairwise IoU loop", legacy), ("Indexed merge", indexed)]:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            results[name] = func()
+        print(f"{name}: {(time.perf_counter() - start) / repeat * 1000:.2f} ms")
+
+    assert results["Pairwise IoU loop"] == results["Indexed merge"]
+    print(
+        f"{num_main} main and {num_additional} additional controls, "
+        f"{len(results['Indexed merge']) - num_main} additional controls kept."
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
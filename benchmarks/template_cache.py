@@ -0,0 +1,88 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Compare the loading of the templates of new agents and the formatting of the system prompts at every step, with and
+without the PromptTemplateCache of ufo.prompter.template_cache, on the templates of the repository. Run it from the
+root of the repository with:
+
+    python -m benchmarks.template_cache
+"""
+
+import json
+import time
+from typing import Any, Dict
+
+import yaml
+
+from ufo.prompter.template_cache import PromptTemplateCache, content_digest
+
+PATHS = [
+    "ufo/prompts/share/base/app_agent.yaml",
+    "ufo/prompts/examples/visual/app_agent_example.yaml",
+    "ufo/prompts/share/base/api.yaml",
+]
+
+
+def format_system_prompt(templates: Dict[str, Dict[str, Any]]) -> str:
+    """
+    Format a system prompt from the templates, the examples and the APIs, as the AppAgent prompter does.
+    :param templates: The parsed templates by path.
+    :return: The system prompt.
+    """
+    template, examples, apis = (templates[path] for path in PATHS)
+    api_text = "\n".join(f"{api['summary']}\n{api['usage']}" for api in apis.values())
+    example_text = "\n".join(
+        json.dumps(examples[key]) for key in examples if key.startswith("example")
+    )
+    return template["system"].format(apis=api_text, examples=example_text)
+
+
+def benchmark(agents: int = 50, steps: int = 20) -> None:
+    """
+    Measure the savings of the cache.
+    :param agents: The number of agents created.
+    :param steps: The number of steps of every agent.
+    """
+    start = time.perf_counter()
+    for _ in range(agents):
+        templates = {}
+        for path in PATHS:
+            with open(path, "r", encoding="utf-8") as file:
+                templates[path] = yaml.safe_load(file)
+    uncached_load = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(steps):
+        uncached_prompt = format_system_prompt(templates)
+    uncached_step = (time.perf_counter() - start) / steps
+
+    cache = PromptTemplateCache()
+    start = time.perf_counter()
+    for _ in range(agents):
+        templates = {path: cache.load(path) for path in PATHS}
+    cached_load = time.perf_counter() - start
+
+    key = tuple(cache.digest(path) for path in PATHS)
+    cache.memoize(key, lambda: format_system_prompt(templates))
+    start = time.perf_counter()
+    for _ in range(steps):
+        cached_prompt = cache.memoize(
+            key + (True, content_digest([])),
+            lambda: format_system_prompt(templates),
+        )
+    cached_step = (time.perf_counter() - start) / steps
+
+    assert cached_prompt == uncached_prompt
+    print(
+        f"Templates of {agents} agents: {uncached_load * 1000:.1f} ms parsed every time, "
+        f"{cached_load * 1000:.1f} ms cached."
+    )
+    print(
+        f"System prompt per step: {uncached_step * 1e6:.1f} us formatted, "
+        f"{cached_step * 1e6:.1f} us memoized."
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
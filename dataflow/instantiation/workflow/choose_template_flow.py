@@ -7,11 +7,9 @@ from datetime import datetime
 from pathlib import Path
 from typing import Dict
 
-from langchain.embeddings import CacheBackedEmbeddings
-from langchain.storage import LocalFileStore
-from langchain_community.embeddings import HuggingFaceEmbeddings
 from langchain_community.vectorstores import FAISS
 from dataflow.instantiation.agent.template_agent import TemplateAgent
+from ufo.utils.embedding import ServiceEmbeddings, get_embedding_service
 
 from dataflow.config.config import Config
 
@@ -23,8 +21,6 @@ class ChooseTemplateFlow:
     Class to select and copy the most relevant template file based on the given task context.
     """
 
-    _SENTENCE_TRANSFORMERS_PREFIX = "sentence-transformers/"
-
     def __init__(self, app_name: str, task_file_name: str, file_extension: str):
         """
         Initialize the flow with the given task context.
@@ -225,17 +221,14 @@ class ChooseTemplateFlow:
         return file_name
 
     @staticmethod
-    def _load_embedding_model(model_name: str) -> CacheBackedEmbeddings:
+    def _load_embedding_model(model_name: str) -> ServiceEmbeddings:
         """
-        Load the embedding model.
+        Load the embedding model, shared by the tasks and with the control filters, with the embeddings cached on disk.
         :param model_name: The name of the embedding model to load.
         :return: The loaded embedding model.
         """
 
-        store = LocalFileStore(_configs["CONTROL_EMBEDDING_CACHE_PATH"])
-        if not model_name.startswith(ChooseTemplateFlow._SENTENCE_TRANSFORMERS_PREFIX):
-            model_name = ChooseTemplateFlow._SENTENCE_TRANSFORMERS_PREFIX + model_name
-        embedding_model = HuggingFaceEmbeddings(model_name=model_name)
-        return CacheBackedEmbeddings.from_bytes_store(
-            embedding_model, store, namespace=model_name
+        cache_path = os.path.join(
+            _configs["CONTROL_EMBEDDING_CACHE_PATH"], "embeddings.sqlite"
         )
+        return ServiceEmbeddings(get_embedding_service(model_name, cache_path))
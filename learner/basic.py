@@ -1,7 +1,12 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
-from learner import utils
+import hashlib
 from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+from langchain.docstore.document import Document
+
+from learner import utils
 
 
 class BasicDocumentLoader(ABC):
@@ -25,11 +30,67 @@ class BasicDocumentLoader(ABC):
         """
         return utils.find_files_with_extension(self.directory, self.extensions)
 
+    def source_files(self, file: str) -> List[str]:
+        """
+        Get the files a document is constructed from.
+        :param file: The file of the document.
+        :return: The list of the source files.
+        """
+        return [file]
+
+    def content_hash(self, file: str) -> str:
+        """
+        Hash the content of the source files of a document, to detect the changed documents.
+        :param file: The file of the document.
+        :return: The SHA-256 hex digest of the source files, a missing file counting as empty.
+        """
+        digest = hashlib.sha256()
+        for source in self.source_files(file):
+            digest.update(source.encode("utf-8") + b"\0")
+            try:
+                with open(source, "rb") as f:
+                    for chunk in iter(lambda: f.read(1 << 20), b""):
+                        digest.update(chunk)
+            except FileNotFoundError:
+                digest.update(b"\0missing")
+            digest.update(b"\0")
+        return digest.hexdigest()
+
     @abstractmethod
-    def construct_document(self):
+    def construct_file_documents(self, file: str) -> List[Document]:
+        """
+        Construct the langchain documents of a file.
+        :param file: The file to load.
+        :return: The list of the documents of the file.
+        """
+        pass
+
+    def load_files_documents(
+        self, files: List[Tuple[str, Optional[str]]]
+    ) -> List[Tuple[str, str, Optional[List[Document]]]]:
+        """
+        Construct the documents of a chunk of files, skipping the unchanged ones. Run in the worker processes of the
+        learner, so that the files are parsed in parallel.
+        :param files: The files with the content hash they were indexed with, None for the new files.
+        :return: The files with their content hash and their documents, None if the file is unchanged.
+        """
+        results = []
+        for file, known_hash in files:
+            content_hash = self.content_hash(file)
+            if content_hash == known_hash:
+                results.append((file, content_hash, None))
+            else:
+                results.append(
+                    (file, content_hash, self.construct_file_documents(file))
+                )
+        return results
+
+    def construct_document(self) -> List[Document]:
         """
         Load the documents from the given directory.
-        :param directory: The directory to load from.
         :return: The list of loaded documents.
         """
-        pass
+        documents = []
+        for file in self.load_file_name():
+            documents.extend(self.construct_file_documents(file))
+        return documents
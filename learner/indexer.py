@@ -2,13 +2,205 @@
 # Licensed under the MIT License.
 
 from ufo.utils import get_hugginface_embedding
+from ufo.rag.index_registry import index_files, save_index
 from . import xml_loader, json_loader, basic
 from .utils import load_json_file, save_json_file, print_with_color
+from langchain.docstore.document import Document
 from langchain_community.vectorstores import FAISS
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import hashlib
+import json
 import os
+import time
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 
+# The manifest of an indexer, saved in its folder, with the content hash and the vector ids of every indexed file.
+MANIFEST_FILE = "manifest.json"
+
+# The number of files parsed by a task of the worker processes.
+PARSE_CHUNK_SIZE = 16
+
+
+def document_id(document: Document) -> str:
+    """
+    Get the vector id of a document, the hash of its content, so that the id is stable across the re-indexing and
+    the identical documents are embedded once.
+    :param document: The document.
+    :return: The id.
+    """
+    content = json.dumps(
+        {"page_content": document.page_content, "metadata": document.metadata},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def load_manifest(path: str) -> Optional[Dict[str, Dict]]:
+    """
+    Load the manifest of an indexer.
+    :param path: The folder of the indexer.
+    :return: The entries of the indexed files by path, None if the indexer has no manifest.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    return load_json_file(manifest_path).get("files", {})
+
+
+def save_manifest(path: str, files: Dict[str, Dict]) -> None:
+    """
+    Save the manifest of an indexer, replacing the previous one atomically.
+    :param path: The folder of the indexer.
+    :param files: The entries of the indexed files by path.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    save_json_file(manifest_path + ".tmp", {"files": files})
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+
+def _is_under(path: str, directory: str) -> bool:
+    """
+    Check whether a path is in a directory.
+    :param path: The path.
+    :param directory: The directory.
+    :return: True if the path is in the directory.
+    """
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:
+        # The paths are on different drives.
+        return False
+
+
+def _iter_file_documents(
+    loader: basic.BasicDocumentLoader,
+    files: List[str],
+    manifest: Dict[str, Dict],
+    workers: int,
+) -> Iterator[Tuple[str, str, Optional[List[Document]]]]:
+    """
+    Parse the files in a pool of processes, in order, with a bounded number of chunks in flight.
+    :param loader: The loader of the files.
+    :param files: The files to parse.
+    :param manifest: The entries of the files indexed before, whose unchanged files are not parsed.
+    :param workers: The number of processes, 1 to parse the files in the current process.
+    :return: The files with their content hash and their documents, None if the file is unchanged.
+    """
+    chunks = [
+        [
+            (file, manifest[file]["hash"] if file in manifest else None)
+            for file in files[i : i + PARSE_CHUNK_SIZE]
+        ]
+        for i in range(0, len(files), PARSE_CHUNK_SIZE)
+    ]
+
+    if workers <= 1:
+        for chunk in chunks:
+            yield from loader.load_files_documents(chunk)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Bound the parsed documents waiting to be embedded.
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(loader.load_files_documents, chunk))
+            if len(pending) >= workers * 2:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+class IndexingProgress:
+    """
+    The progress and the throughput of the indexing, printed every few seconds.
+    """
+
+    def __init__(self, total_files: int, interval: float = 5.0) -> None:
+        """
+        Initialize the progress.
+        :param total_files: The number of files to index.
+        :param interval: The interval between the prints, in seconds.
+        """
+        self.total_files = total_files
+        self.interval = interval
+        self.files = 0
+        self.unchanged = 0
+        self.documents = 0
+        self.embed_time = 0.0
+        self.start = time.perf_counter()
+        self._last_print = self.start
+
+    def parsed(self, unchanged: bool) -> None:
+        """
+        Count a parsed file.
+        :param unchanged: Whether the file is unchanged since the last indexing.
+        """
+        self.files += 1
+        self.unchanged += unchanged
+        self._print_every_interval()
+
+    def embedded(self, documents: int, seconds: float) -> None:
+        """
+        Count a batch of embedded documents.
+        :param documents: The number of documents.
+        :param seconds: The time of the embedding and the insertion in the indexer.
+        """
+        self.documents += documents
+        self.embed_time += seconds
+        self._print_every_interval()
+
+    def _print_every_interval(self) -> None:
+        """
+        Print the progress if the interval has elapsed since the last print.
+        """
+        now = time.perf_counter()
+        if now - self._last_print < self.interval:
+            return
+        self._last_print = now
+        elapsed = now - self.start
+        print_with_color(
+            "Parsed {files}/{total} files ({rate:.1f} files/s), embedded {documents} documents.".format(
+                files=self.files,
+                total=self.total_files,
+                rate=self.files / elapsed,
+                documents=self.documents,
+            ),
+            "cyan",
+        )
+
+    def report(self, removed: int, deleted: int) -> None:
+        """
+        Print the statistics of the indexing.
+        :param removed: The number of files removed since the last indexing.
+        :param deleted: The number of documents deleted from the indexer.
+        """
+        elapsed = time.perf_counter() - self.start
+        print_with_color(
+            "{changed} new or changed files, {unchanged} unchanged, {removed} removed.".format(
+                changed=self.files - self.unchanged,
+                unchanged=self.unchanged,
+                removed=removed,
+            ),
+            "cyan",
+        )
+        print_with_color(
+            "Embedded {documents} documents and deleted {deleted} documents in {elapsed:.1f}s: "
+            "{rate:.1f} files/s, {embed_rate:.1f} documents/s embedded.".format(
+                documents=self.documents,
+                deleted=deleted,
+                elapsed=elapsed,
+                rate=self.files / elapsed if elapsed else 0.0,
+                embed_rate=(
+                    self.documents / self.embed_time if self.embed_time else 0.0
+                ),
+            ),
+            "yellow",
+        )
+
 
 class DocumentsIndexer:
     """
@@ -22,15 +214,28 @@ class DocumentsIndexer:
 
     @staticmethod
     def create_indexer(
-        app: str, docs: str, format: str, incremental: bool, save_path: str
+        app: str,
+        docs: str,
+        format: str,
+        incremental: bool,
+        save_path: str,
+        workers: Optional[int] = None,
+        batch_size: int = 256,
     ):
         """
-        Create an indexer for the given application.
+        Create an indexer for the given application. With incremental updates, only the new and changed files of the
+        documents dir are embedded, and the vectors of its removed files are deleted. The files of the other dirs
+        indexed before are kept.
+        The files are parsed in a pool of processes, and their documents embedded and added to the indexer in
+        batches as they are parsed, so that the documents are not all held in memory.
         :param app: The name of the application to create an indexer for.
         :param docs: The help documents dir for the application.
         :param format: The format of the help documents.
         :param incremental: Whether to enable incremental updates.
         :param save_path: The path to save the indexer to.
+        :param workers: The number of processes parsing the files, the number of CPUs by default, 1 to parse them in
+        the current process.
+        :param batch_size: The number of documents embedded and added to the indexer at once.
         :return: The created indexer.
         """
 
@@ -47,30 +252,115 @@ class DocumentsIndexer:
         loader: basic.BasicDocumentLoader = DocumentsIndexer._doc_loader_mapper[format](
             docs
         )
-        documents = loader.construct_document()
+
+        workers = max(workers or os.cpu_count() or 1, 1)
+
+        db_file_path = os.path.join(save_path, app)
+        db_file_path = os.path.abspath(db_file_path)
+
+        embeddings = get_hugginface_embedding()
+
+        db = None
+        manifest: Dict[str, Dict] = {}
+        prev_path = records.get(app, db_file_path)
+
+        if incremental and os.path.exists(index_files(prev_path)[0]):
+            print_with_color("Updating the previous indexer...", "yellow")
+            db = FAISS.load_local(
+                prev_path, embeddings, allow_dangerous_deserialization=True
+            )
+            prev_manifest = load_manifest(prev_path)
+            if prev_manifest is None:
+                print_with_color(
+                    "The previous indexer has no manifest, its documents are kept but not tracked.",
+                    "yellow",
+                )
+            else:
+                manifest = prev_manifest
+
+        # The ids in the previous indexer, tracked by its manifest or not.
+        existing_ids = (
+            set(db.index_to_docstore_id.values()) if db is not None else set()
+        )
+
+        docs_dir = os.path.realpath(docs)
+        files = loader.load_file_name()
+
+        # The files of the other dirs are kept, those of the documents dir are checked again.
+        new_manifest = {
+            file: entry
+            for file, entry in manifest.items()
+            if not _is_under(file, docs_dir)
+        }
+        current_files = set(files)
+        removed = [
+            file
+            for file in manifest
+            if _is_under(file, docs_dir) and file not in current_files
+        ]
 
         print_with_color(
-            "Creating indexer for {num} documents for {app}...".format(
-                num=len(documents), app=app
+            "Parsing {num} files with {workers} workers...".format(
+                num=len(files), workers=workers
             ),
-            "yellow",
+            "cyan",
         )
 
-        embeddings = get_hugginface_embedding()
-
-        db = FAISS.from_documents(documents, embeddings)
+        progress = IndexingProgress(len(files))
+        batch: Dict[str, Document] = {}
+        # The ids embedded in this run, so that the identical documents are embedded once.
+        added_ids = set()
 
-        if incremental:
-            if app in records:
-                print_with_color("Merging with previous indexer...", "yellow")
-                prev_db = FAISS.load_local(
-                    records[app], embeddings, allow_dangerous_deserialization=True
+        def embed_batch() -> None:
+            nonlocal db
+            start = time.perf_counter()
+            if db is None:
+                db = FAISS.from_documents(
+                    list(batch.values()), embeddings, ids=list(batch.keys())
                 )
-                db.merge_from(prev_db)
+            else:
+                db.add_documents(list(batch.values()), ids=list(batch.keys()))
+            progress.embedded(len(batch), time.perf_counter() - start)
+            batch.clear()
 
-        db_file_path = os.path.join(save_path, app)
-        db_file_path = os.path.abspath(db_file_path)
-        db.save_local(db_file_path)
+        for file, content_hash, documents in _iter_file_documents(
+            loader, files, manifest, workers
+        ):
+            if documents is None:
+                new_manifest[file] = manifest[file]
+                progress.parsed(unchanged=True)
+                continue
+
+            ids = [document_id(document) for document in documents]
+            new_manifest[file] = {"hash": content_hash, "ids": ids}
+            progress.parsed(unchanged=False)
+            for doc_id, document in zip(ids, documents):
+                if doc_id not in existing_ids and doc_id not in added_ids:
+                    added_ids.add(doc_id)
+                    batch[doc_id] = document
+            if len(batch) >= batch_size:
+                embed_batch()
+
+        if batch:
+            embed_batch()
+
+        tracked_ids = {doc_id for entry in manifest.values() for doc_id in entry["ids"]}
+        kept_ids = {
+            doc_id for entry in new_manifest.values() for doc_id in entry["ids"]
+        }
+        stale_ids: List[str] = sorted((tracked_ids & existing_ids) - kept_ids)
+
+        if db is not None and stale_ids:
+            db.delete(stale_ids)
+
+        progress.report(removed=len(removed), deleted=len(stale_ids))
+
+        if db is None:
+            raise ValueError("No documents found in " + docs)
+
+        if added_ids or stale_ids or prev_path != db_file_path:
+            save_index(db, db_file_path)
+        save_manifest(db_file_path, new_manifest)
 
         records[app] = db_file_path
 
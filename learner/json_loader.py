@@ -38,26 +38,21 @@ class JsonLoader(basic.BasicDocumentLoader):
 
         return document
 
-    def construct_document(self):
+    def construct_file_documents(self, file: str) -> List[Document]:
         """
-        Construct a langchain document list.
+        Construct the langchain documents of a file.
         Each json file is a document with the following structure:
         {
             "request": "The user request",
             "guidance": ["The step-by-step guidance to fulfill the request"]
         }
-        :return: The langchain document list.
+        :param file: The file to load.
+        :return: The list of the documents of the file.
         """
-        documents = []
-        for file in self.load_file_name():
+        document = self.load_json_document(file)
+        request = document.get("request", "")
+        guidance_steps = document.get("guidance", [])
+        guidance = "\n".join([step for step in guidance_steps])
 
-            document = self.load_json_document(file)
-            request = document.get("request", "")
-            guidance_steps = document.get("guidance", [])
-            guidance = "\n".join([step for step in guidance_steps])
-
-            metadata = {"title": request, "summary": request, "text": guidance}
-            document = Document(page_content=request, metadata=metadata)
-
-            documents.append(document)
-        return documents
+        metadata = {"title": request, "summary": request, "text": guidance}
+        return [Document(page_content=request, metadata=metadata)]
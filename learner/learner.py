@@ -24,6 +24,18 @@ args.add_argument(
     type=str,
     default="./vectordb/docs/",
 )
+args.add_argument(
+    "--workers",
+    help="The number of processes parsing the help docs, the number of CPUs by default.",
+    type=int,
+    default=None,
+)
+args.add_argument(
+    "--batch_size",
+    help="The number of help docs embedded at once.",
+    type=int,
+    default=256,
+)
 
 
 parsed_args = args.parse_args()
@@ -40,6 +52,8 @@ def main():
         parsed_args.format,
         parsed_args.incremental,
         parsed_args.save_path,
+        parsed_args.workers,
+        parsed_args.batch_size,
     )
 
 
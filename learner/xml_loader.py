@@ -3,6 +3,7 @@
 
 from . import basic
 import os
+from typing import List
 from langchain_community.document_loaders import UnstructuredXMLLoader
 from langchain.docstore.document import Document
 import xml.etree.ElementTree as ET
@@ -64,23 +65,25 @@ class XMLLoader(basic.BasicDocumentLoader):
 
         return doc_text
 
-    def construct_document(self):
+    def source_files(self, file: str) -> List[str]:
         """
-        Construct a langchain document list.
-        :return: The langchain document list.
+        Get the files a document is constructed from, the XML file and its metadata.
+        :param file: The file of the document.
+        :return: The list of the source files.
         """
-        documents = []
-        for file in self.load_file_name():
-            text = self.get_microsoft_document_text(file)
-            metadata = self.get_microsoft_document_metadata(file + ".meta")
-            title = metadata["title"]
-            summary = metadata["summary"]
-            page_content = """{title} - {summary}""".format(
-                title=title, summary=summary
-            )
-
-            metadata = {"title": title, "summary": summary, "text": text}
-            document = Document(page_content=page_content, metadata=metadata)
-
-            documents.append(document)
-        return documents
+        return [file, file + ".meta"]
+
+    def construct_file_documents(self, file: str) -> List[Document]:
+        """
+        Construct the langchain documents of a file.
+        :param file: The file to load.
+        :return: The list of the documents of the file.
+        """
+        text = self.get_microsoft_document_text(file)
+        metadata = self.get_microsoft_document_metadata(file + ".meta")
+        title = metadata["title"]
+        summary = metadata["summary"]
+        page_content = """{title} - {summary}""".format(title=title, summary=summary)
+
+        metadata = {"title": title, "summary": summary, "text": text}
+        return [Document(page_content=page_content, metadata=metadata)]
@@ -12,6 +12,7 @@ from record_processor.parser.demonstration_record import DemonstrationRecord
 from record_processor.utils import json_parser
 from ufo.llm.llm_call import get_completions
 from ufo.prompter.demonstration_prompter import DemonstrationPrompter
+from ufo.rag.index_registry import save_index
 from ufo.utils import get_hugginface_embedding
 
 
@@ -194,6 +195,6 @@ class DemonstrationSummarizer:
             )
             db.merge_from(prev_db)
 
-        db.save_local(db_path)
+        save_index(db, db_path)
 
         print(f"Updated vector DB successfully: {db_path}")
@@ -0,0 +1,167 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A fake provider of UI Automation trees, exposing the subset of the pywinauto UIAWrapper used to walk a UI tree.
+It lets the tests exercise the UI tree code without Windows.
+"""
+
+import random
+import time
+from typing import List, Optional, Tuple
+
+
+class FakeRect:
+    """
+    A rectangle with the attributes of the pywinauto RECT.
+    """
+
+    def __init__(self, left: int, top: int, right: int, bottom: int) -> None:
+        self.left = left
+        self.top = top
+        self.right = right
+        self.bottom = bottom
+
+    def width(self) -> int:
+        return self.right - self.left
+
+    def height(self) -> int:
+        return self.bottom - self.top
+
+    def __repr__(self) -> str:
+        return f"(L{self.left}, T{self.top}, R{self.right}, B{self.bottom})"
+
+
+class FakeElementInfo:
+    """
+    The element information of a fake control, with the attributes of the pywinauto UIAElementInfo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        control_type: str,
+        rectangle: FakeRect,
+        runtime_id: Tuple[int, ...] = (),
+        handle: Optional[int] = None,
+    ) -> None:
+        self.name = name
+        self.control_type = control_type
+        self.rectangle = rectangle
+        self.runtime_id = runtime_id
+        self.handle = handle
+
+
+class FakeUIAWrapper:
+    """
+    A fake control. Every call of children() counts as one round-trip to the UI Automation server, and can be delayed
+    to simulate its latency.
+    """
+
+    # The number of children() calls of all the fake controls.
+    children_calls = 0
+    # The delay of a children() call, in seconds.
+    latency = 0.0
+
+    def __init__(
+        self,
+        element_info: FakeElementInfo,
+        children: Optional[List["FakeUIAWrapper"]] = None,
+    ) -> None:
+        self.element_info = element_info
+        self._children = children or []
+
+    def children(self) -> List["FakeUIAWrapper"]:
+        FakeUIAWrapper.children_calls += 1
+        if FakeUIAWrapper.latency > 0:
+            time.sleep(FakeUIAWrapper.latency)
+        return list(self._children)
+
+    def rectangle(self) -> FakeRect:
+        return self.element_info.rectangle
+
+    def window_text(self) -> str:
+        return self.element_info.name
+
+    def iter_descendants(self):
+        """
+        Iterate over all the descendants, depth-first.
+        """
+        for child in self._children:
+            yield child
+            yield from child.iter_descendants()
+
+    def add_child(self, child: "FakeUIAWrapper", index: Optional[int] = None) -> None:
+        """
+        Add a child, to simulate a change of the UI.
+        :param child: The child to add.
+        :param index: The position of the child, appended if not provided.
+        """
+        if index is None:
+            self._children.append(child)
+        else:
+            self._children.insert(index, child)
+
+    def remove_child(self, index: int) -> "FakeUIAWrapper":
+        """
+        Remove a child, to simulate a change of the UI.
+        :param index: The position of the child.
+        :return: The removed child.
+        """
+        return self._children.pop(index)
+
+
+_CONTROL_TYPES = [
+    "Button",
+    "MenuItem",
+    "TabItem",
+    "ListItem",
+    "Edit",
+    "CheckBox",
+    "ComboBox",
+    "Text",
+]
+
+
+def build_fake_tree(
+    breadth: Tuple[int, ...] = (8, 6, 8, 8), seed: int = 0, handle: int = 1
+) -> FakeUIAWrapper:
+    """
+    Build a fake window with nested groups, like an Office ribbon.
+    :param breadth: The number of children at every level, e.g. (8, 6, 8, 8) for 8 tabs of 6 groups of 8 controls of
+    8 sub-controls.
+    :param seed: The random seed of the control names and types.
+    :param handle: The window handle of the root.
+    :return: The root of the fake tree.
+    """
+    rng = random.Random(seed)
+    counter = [0]
+
+    def build(level: int, rect: FakeRect) -> FakeUIAWrapper:
+        counter[0] += 1
+        runtime_id = (42, handle, counter[0])
+        if level == 0:
+            info = FakeElementInfo("Fake Window", "Window", rect, runtime_id, handle)
+        else:
+            control_type = (
+                "Group" if level < len(breadth) else rng.choice(_CONTROL_TYPES)
+            )
+            info = FakeElementInfo(
+                f"{control_type} {counter[0]}", control_type, rect, runtime_id
+            )
+
+        node = FakeUIAWrapper(info)
+        if level < len(breadth):
+            count = breadth[level]
+            width = max(1, (rect.right - rect.left) // count)
+            for i in range(count):
+                child_rect = FakeRect(
+                    rect.left + i * width,
+                    rect.top + 10,
+                    rect.left + (i + 1) * width,
+                    rect.bottom - 10,
+                )
+                node.add_child(build(level + 1, child_rect))
+        return node
+
+    return build(0, FakeRect(0, 0, 1920, 1080))
@@ -0,0 +1,75 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import numpy as np
+from PIL import Image
+
+from ufo.utils.annotation_renderer import AnnotationRenderer, _overlap_matrix
+
+
+def _boxes(positions: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    return np.concatenate([positions, positions + sizes], axis=1)
+
+
+def test_labels_of_stacked_controls_do_not_overlap():
+    # Three controls sharing their top-left corner, as nested panes do.
+    rects = np.array([[100, 100, 400, 300], [100, 100, 300, 200], [100, 100, 350, 250]])
+    sizes = np.array([[30, 20], [30, 20], [30, 20]])
+    renderer = AnnotationRenderer(avoid_overlap=True)
+
+    positions = renderer.place_labels(rects, sizes, (800, 600))
+    boxes = _boxes(positions, sizes)
+    overlaps = _overlap_matrix(boxes, boxes)
+    np.fill_diagonal(overlaps, False)
+
+    assert positions[0].tolist() == [100, 100]
+    assert not overlaps.any()
+
+    legacy = AnnotationRenderer(avoid_overlap=False).place_labels(
+        rects, sizes, (800, 600)
+    )
+    assert (legacy == [100, 100]).all()
+
+
+def test_labels_are_clamped_to_the_image():
+    rects = np.array([[-50, -50, 10, 10], [790, 590, 900, 700], [0, 0, 10, 10]])
+    sizes = np.array([[30, 20], [30, 20], [30, 20]])
+
+    for avoid_overlap in (False, True):
+        positions = AnnotationRenderer(avoid_overlap=avoid_overlap).place_labels(
+            rects, sizes, (800, 600)
+        )
+        boxes = _boxes(positions, sizes)
+
+        assert (boxes[:, :2] >= 0).all()
+        assert (boxes[:, 2] <= 800).all() and (boxes[:, 3] <= 600).all()
+
+
+def test_translucent_labels_are_blended_once():
+    image = Image.new("RGB", (200, 100), (0, 0, 0))
+    rects = [[10, 10, 80, 60], [120, 40, 190, 90]]
+    labels = ["1", "2"]
+    colors = ["#FFFFFF", "#FFFFFF"]
+
+    opaque = AnnotationRenderer(opacity=1.0).render(image, rects, labels, colors)
+    translucent = AnnotationRenderer(opacity=0.5).render(image, rects, labels, colors)
+
+    # The screenshot is not modified and keeps its mode.
+    assert image.getpixel((12, 12)) == (0, 0, 0)
+    assert translucent.mode == "RGB"
+
+    # Inside a label, away from its border and text.
+    assert opaque.getpixel((12, 12)) == (255, 255, 255)
+    assert all(abs(channel - 128) <= 1 for channel in translucent.getpixel((12, 12)))
+
+    # Outside the labels.
+    assert translucent.getpixel((100, 5)) == (0, 0, 0)
+
+
+def test_no_labels_returns_a_copy():
+    image = Image.new("RGB", (20, 20))
+
+    annotated = AnnotationRenderer().render(image, [], [], [])
+
+    assert annotated is not image
+    assert annotated.tobytes() == image.tobytes()
@@ -0,0 +1,76 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import random
+from typing import List
+
+import numpy as np
+
+from ufo.utils.control_merge import iou_matrix, merge_controls
+from fake_ui_tree import FakeElementInfo, FakeRect, FakeUIAWrapper
+
+
+def _controls(count: int, seed: int) -> List[FakeUIAWrapper]:
+    rng = random.Random(seed)
+    controls = []
+    for i in range(count):
+        left = rng.randrange(0, 1620)
+        top = rng.randrange(0, 980)
+        rect = FakeRect(
+            left, top, left + rng.randrange(10, 300), top + rng.randrange(10, 100)
+        )
+        controls.append(FakeUIAWrapper(FakeElementInfo(f"{i}", "Button", rect)))
+    return controls
+
+
+def _control_iou(control1: FakeUIAWrapper, control2: FakeUIAWrapper) -> float:
+    rect1 = control1.rectangle()
+    rect2 = control2.rectangle()
+
+    left = max(rect1.left, rect2.left)
+    top = max(rect1.top, rect2.top)
+    right = min(rect1.right, rect2.right)
+    bottom = min(rect1.bottom, rect2.bottom)
+
+    intersection_area = max(0, right - left) * max(0, bottom - top)
+    area1 = (rect1.right - rect1.left) * (rect1.bottom - rect1.top)
+    area2 = (rect2.right - rect2.left) * (rect2.bottom - rect2.top)
+
+    return intersection_area / (area1 + area2 - intersection_area)
+
+
+def _pairwise_merge(main_controls, additional_controls, threshold):
+    """
+    The merge with the pairwise IoU loop the index replaces.
+    """
+    merged = main_controls.copy()
+    for additional_control in additional_controls:
+        if not any(
+            _control_iou(additional_control, main_control) > threshold
+            for main_control in main_controls
+        ):
+            merged.append(additional_control)
+    return merged
+
+
+def test_merge_matches_the_pairwise_loop():
+    main_controls = _controls(300, seed=0)
+    additional_controls = _controls(150, seed=1)
+
+    for threshold in (-0.1, 0.0, 0.1, 0.5):
+        merged = merge_controls(main_controls, additional_controls, threshold)
+
+        assert merged == _pairwise_merge(main_controls, additional_controls, threshold)
+
+
+def test_merge_keeps_everything_without_main_controls():
+    additional_controls = _controls(10, seed=2)
+
+    assert merge_controls([], additional_controls) == additional_controls
+
+
+def test_iou_matrix():
+    rects_a = np.array([[0, 0, 10, 10], [0, 0, 0, 0]], dtype=np.float64)
+    rects_b = np.array([[5, 0, 15, 10], [20, 20, 30, 30]], dtype=np.float64)
+
+    np.testing.assert_allclose(iou_matrix(rects_a, rects_b), [[1 / 3, 0], [0, 0]])
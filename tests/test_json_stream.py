@@ -0,0 +1,73 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+
+from ufo.llm.json_stream import IncrementalJSONParser, field_callback
+
+RESPONSE = {
+    "Observation": 'The "Home" tab of Word is open, {not a brace}.',
+    "ControlLabel": "12",
+    "ControlText": "Bold",
+    "Function": "click_input",
+    "Args": {"button": "left", "double": False, "nested": [1, [2, {"a": None}]]},
+    "Status": "CONTINUE",
+    "Step": 3,
+    "Confidence": 0.5,
+    "Plan": ["Type the title", "Save the document"],
+    "Thought": "To make the selected text bold, \\ I click. " * 10,
+    "Comment": "The text is selected, I click on the Bold button.",
+}
+
+
+def _chunks(text: str, size: int):
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+def test_fields_of_the_chunks_match_the_object():
+    response = json.dumps(RESPONSE)
+
+    for size in (1, 3, 16, len(response)):
+        parser = IncrementalJSONParser()
+        completed = []
+        for chunk in ["```json\n"] + _chunks(response, size) + ["\n```"]:
+            completed.extend(parser.feed(chunk))
+
+        assert parser.finished
+        assert parser.fields == RESPONSE
+        assert [key for key, _ in completed] == list(RESPONSE)
+
+
+def test_field_is_emitted_as_soon_as_complete():
+    response = json.dumps(RESPONSE)
+    args_end = response.index('"Status"')
+
+    parser = IncrementalJSONParser()
+    fields = parser.feed(response[:args_end])
+
+    assert [key for key, _ in fields] == [
+        "Observation",
+        "ControlLabel",
+        "ControlText",
+        "Function",
+        "Args",
+    ]
+    assert not parser.finished
+
+
+def test_text_after_the_object_is_ignored():
+    parser = IncrementalJSONParser()
+
+    parser.feed('{"a": 1}')
+    assert parser.feed('{"b": 2}') == []
+    assert parser.fields == {"a": 1}
+
+
+def test_field_callback():
+    received = []
+    on_chunk = field_callback(lambda key, value: received.append((key, value)))
+
+    for chunk in _chunks(json.dumps({"x": [1, 2], "y": "z"}), 2):
+        on_chunk(chunk)
+
+    assert received == [("x", [1, 2]), ("y", "z")]
@@ -0,0 +1,94 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import os
+from typing import List
+
+import pytest
+
+pytest.importorskip("faiss")
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from learner import indexer
+from learner.indexer import DocumentsIndexer, load_manifest
+
+
+class CountingEmbedding(DeterministicFakeEmbedding):
+    """
+    A deterministic embedding counting the embedded texts.
+    """
+
+    embedded: List[str] = []
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.embedded.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def embedding(tmp_path, monkeypatch):
+    # The indexer records its indexes in ./learner/records.json.
+    os.makedirs(os.path.join(tmp_path, "learner"))
+    monkeypatch.chdir(tmp_path)
+    embedding = CountingEmbedding(size=16, embedded=[])
+    monkeypatch.setattr(indexer, "get_hugginface_embedding", lambda: embedding)
+    return embedding
+
+
+def _write_doc(folder, name: str, request: str) -> None:
+    with open(os.path.join(folder, name), "w") as file:
+        json.dump({"request": request, "guidance": [f"Do {request}."]}, file)
+
+
+def _index(docs, save_path) -> str:
+    return DocumentsIndexer.create_indexer(
+        "app", str(docs), "json", True, str(save_path), workers=1, batch_size=2
+    )
+
+
+def _requests(path: str, embedding) -> List[str]:
+    db = FAISS.load_local(path, embedding, allow_dangerous_deserialization=True)
+    return sorted(document.page_content for document in db.docstore._dict.values())
+
+
+def test_incremental_indexing_embeds_only_the_changed_files(
+    tmp_path, embedding
+):
+    docs = tmp_path / "docs"
+    docs.mkdir()
+    save_path = tmp_path / "index"
+    _write_doc(docs, "a.json", "open a file")
+    _write_doc(docs, "b.json", "save a file")
+    _write_doc(docs, "c.json", "print a file")
+
+    path = _index(docs, save_path)
+
+    assert sorted(embedding.embedded) == ["open a file", "print a file", "save a file"]
+    assert len(load_manifest(path)) == 3
+
+    # Nothing changed: nothing is embedded nor saved again.
+    embedding.embedded.clear()
+    index_mtime = os.stat(os.path.join(path, "index.faiss")).st_mtime_ns
+    _index(docs, save_path)
+
+    assert embedding.embedded == []
+    assert os.stat(os.path.join(path, "index.faiss")).st_mtime_ns == index_mtime
+
+    # A changed, a removed, a new and a duplicate file.
+    _write_doc(docs, "a.json", "open a folder")
+    os.remove(os.path.join(docs, "b.json"))
+    _write_doc(docs, "d.json", "close a file")
+    _write_doc(docs, "e.json", "close a file")
+    embedding.embedded.clear()
+    _index(docs, save_path)
+
+    assert sorted(embedding.embedded) == ["close a file", "open a folder"]
+    assert _requests(path, embedding) == [
+        "close a file",
+        "open a folder",
+        "print a file",
+    ]
+    assert len(load_manifest(path)) == 4
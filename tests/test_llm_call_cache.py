@@ -0,0 +1,74 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import os
+from typing import List, Tuple
+
+import pytest
+
+from ufo.llm import llm_call
+from ufo.llm.hedged_request import hedged_request
+from ufo.llm.response_cache import LLMResponseCache
+from ufo.llm.service_registry import ServiceRegistry
+
+CONFIGS = {"APP_AGENT": {"API_TYPE": "fake", "API_MODEL": "fake-model"}}
+
+MESSAGES = [{"role": "user", "content": "Reply in JSON."}]
+
+
+class ScriptedService:
+    """
+    A service replying with a list of scripted responses, one per request.
+    """
+
+    def __init__(self, responses: List[str]) -> None:
+        self.responses = list(responses)
+        self.requests = 0
+
+    def chat_completion(self, messages, n, **kwargs) -> Tuple[List[str], float]:
+        self.requests += 1
+        return [self.responses.pop(0)], 1.0
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    service = ScriptedService(["not json", '{"a": 1}'])
+    cache = LLMResponseCache(
+        path=os.path.join(tmp_path, "cache.db"), mode="read_through"
+    )
+    monkeypatch.setattr(LLMResponseCache, "_instance", cache)
+    monkeypatch.setattr(
+        ServiceRegistry.get_instance(), "get", lambda configs, agent_type: service
+    )
+    return service
+
+
+def _request() -> Tuple[List[str], float]:
+    return llm_call.get_completions(
+        MESSAGES, "app", use_backup_engine=False, configs=CONFIGS, validate=json.loads
+    )
+
+
+def test_retry_of_an_invalid_reply_calls_the_api_again(service):
+    result = hedged_request(_request, json.loads, max_requests=3)
+
+    assert result.response == '{"a": 1}'
+    assert result.requests == 2
+    assert service.requests == 2
+
+    # The valid reply replaced the invalid one in the cache.
+    assert _request() == (['{"a": 1}'], 0.0)
+    assert service.requests == 2
+
+
+def test_replies_are_cached_without_validation(service):
+    response = llm_call.get_completions(
+        MESSAGES, "app", use_backup_engine=False, configs=CONFIGS
+    )
+
+    assert response == (["not json"], 1.0)
+    assert llm_call.get_completions(
+        MESSAGES, "app", use_backup_engine=False, configs=CONFIGS
+    ) == (["not json"], 0.0)
+    assert service.requests == 1
@@ -0,0 +1,128 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import asyncio
+
+import pytest
+
+from ufo.llm.rate_limit import (
+    DeploymentLimiter,
+    LLMRateLimitError,
+    RateLimitScheduler,
+    _Bucket,
+    retry_after_from_headers,
+)
+
+
+def test_bucket_queues_the_reservations_beyond_the_capacity():
+    bucket = _Bucket(60)
+    now = bucket.updated
+
+    assert bucket.reserve(60, now) == 0
+    # One unit per second once the bucket is full.
+    assert bucket.reserve(1, now) == pytest.approx(1.0)
+    assert bucket.reserve(1, now) == pytest.approx(2.0)
+    # The bucket drains over time.
+    assert bucket.reserve(1, now + 10) == pytest.approx(0.0)
+
+
+def test_bucket_caps_a_reservation_to_the_capacity():
+    bucket = _Bucket(60)
+
+    assert bucket.reserve(1000, bucket.updated) == 0
+
+
+def test_limiter_halves_and_recovers_its_budgets():
+    limiter = DeploymentLimiter(requests_per_minute=60, tokens_per_minute=6000)
+    base_rate = limiter._requests.base_rate
+
+    limiter.rejected(0)
+    assert limiter._requests.rate == pytest.approx(base_rate / 2)
+    assert limiter._tokens.rate == pytest.approx(limiter._tokens.base_rate / 2)
+
+    for _ in range(10):
+        limiter.rejected(0)
+    assert limiter._requests.rate == pytest.approx(base_rate / 10)
+
+    for _ in range(100):
+        limiter.accepted()
+    assert limiter._requests.rate == pytest.approx(base_rate)
+
+
+def test_limiter_pauses_after_a_rejection():
+    limiter = DeploymentLimiter()
+
+    assert limiter.reserve(1000) == 0
+    limiter.rejected(30)
+    assert 29 < limiter.reserve(1000) <= 30
+
+
+def test_retry_after_from_headers():
+    assert retry_after_from_headers(None) is None
+    assert retry_after_from_headers({"retry-after": "2"}) == 2.0
+    assert retry_after_from_headers({"retry-after-ms": "1500"}) == 1.5
+    assert retry_after_from_headers({"retry-after": "soon"}) is None
+
+
+def test_backoff():
+    scheduler = RateLimitScheduler(base_delay=1.0, max_delay=8.0)
+
+    assert 0.5 <= scheduler.backoff(0) <= 1.0
+    assert 4.0 <= scheduler.backoff(10) <= 8.0
+    assert 3.0 <= scheduler.backoff(0, retry_after=3.0) <= 4.0
+
+
+def _flaky_request(rejections: int):
+    """
+    A request rejected by the rate limit a number of times, then accepted.
+    """
+    calls = []
+
+    def request() -> str:
+        calls.append(None)
+        if len(calls) <= rejections:
+            raise LLMRateLimitError("Too many requests", retry_after=0.0)
+        return "ok"
+
+    return request, calls
+
+
+def test_call_retries_the_rejected_requests():
+    scheduler = RateLimitScheduler(max_retries=3, base_delay=0.001)
+    request, calls = _flaky_request(2)
+
+    assert scheduler.call(DeploymentLimiter(), 100, request) == "ok"
+    assert len(calls) == 3
+
+
+def test_call_raises_after_the_retries():
+    scheduler = RateLimitScheduler(max_retries=2, base_delay=0.001)
+    request, calls = _flaky_request(10)
+
+    with pytest.raises(LLMRateLimitError):
+        scheduler.call(DeploymentLimiter(), 100, request)
+    assert len(calls) == 3
+
+
+def test_call_async_retries_the_rejected_requests():
+    scheduler = RateLimitScheduler(max_retries=3, base_delay=0.001)
+    request, calls = _flaky_request(2)
+
+    async def async_request() -> str:
+        return request()
+
+    response = asyncio.run(
+        scheduler.call_async(DeploymentLimiter(), 100, async_request)
+    )
+
+    assert response == "ok"
+    assert len(calls) == 3
+
+
+def test_scheduler_shares_the_limiter_of_a_deployment():
+    scheduler = RateLimitScheduler()
+
+    limiter = scheduler.limiter("deployment", requests_per_minute=60)
+
+    assert scheduler.limiter("deployment") is limiter
+    assert scheduler.limiter("other") is not limiter
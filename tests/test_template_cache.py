@@ -0,0 +1,51 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import os
+
+from ufo.prompter.template_cache import PromptTemplateCache, content_digest
+
+
+def test_templates_are_copied_and_reloaded_when_modified(tmp_path):
+    path = os.path.join(tmp_path, "template.yaml")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("system: Hello {name}\n")
+    cache = PromptTemplateCache()
+
+    template = cache.load(path)
+    template["system"] = "Modified"
+    digest = cache.digest(path)
+
+    assert cache.load(path) == {"system": "Hello {name}"}
+
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("system: Goodbye {name}\n")
+
+    assert cache.load(path) == {"system": "Goodbye {name}"}
+    assert cache.digest(path) != digest
+
+
+def test_prompts_are_memoized_and_evicted():
+    cache = PromptTemplateCache(max_prompts=2)
+    builds = []
+
+    def build(prompt: str):
+        def formatted() -> str:
+            builds.append(prompt)
+            return prompt
+
+        return formatted
+
+    assert cache.memoize("a", build("A")) == "A"
+    assert cache.memoize("a", build("other")) == "A"
+    cache.memoize("b", build("B"))
+    cache.memoize("c", build("C"))
+    cache.memoize("a", build("A"))
+
+    assert builds == ["A", "B", "C", "A"]
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_content_digest_is_canonical():
+    assert content_digest({"a": 1, "b": [2]}) == content_digest({"b": [2], "a": 1})
+    assert content_digest([]) != content_digest({})
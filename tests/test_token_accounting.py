@@ -0,0 +1,158 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import base64
+import io
+import json
+import random
+import struct
+from typing import Dict
+
+from PIL import Image
+
+from ufo.llm.token_accounting import (
+    TrimmableComponent,
+    count_message_tokens,
+    fit_prompt,
+    image_size,
+    keep_items,
+    step_token_budget,
+)
+
+
+def _png_url(width: int, height: int) -> str:
+    """
+    A data URL with only the signature and the IHDR chunk of a PNG, which hold its dimensions.
+    """
+    png = b"\x89PNG\r\n\x1a\n" + struct.pack(">I", 13) + b"IHDR"
+    png += struct.pack(">II", width, height) + bytes(64)
+    return "data:image/png;base64," + base64.b64encode(png).decode()
+
+
+def _jpeg_url(width: int, height: int) -> str:
+    rng = random.Random(0)
+    noise = bytes(rng.getrandbits(8) for _ in range(width * height * 3))
+    image = Image.frombytes("RGB", (width, height), noise)
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_image_size():
+    assert image_size(_png_url(1920, 1080)) == (1920, 1080)
+    # Larger than the decoded header prefix.
+    jpeg = _jpeg_url(400, 300)
+    assert len(jpeg) > 64 * 1024
+    assert image_size(jpeg) == (400, 300)
+    assert image_size("https://example.com/image.png") is None
+
+
+def test_keep_items():
+    assert keep_items([1, 2, 3], 2) == [2, 3]
+    assert keep_items([1, 2, 3], 2, keep_latest=False) == [1, 2]
+    assert keep_items([1, 2, 3], 0) == []
+    assert keep_items([1, 2, 3], 5) == [1, 2, 3]
+
+
+def test_step_token_budget():
+    assert step_token_budget(0, per_step=0, per_session=0) is None
+    assert step_token_budget(0, per_step=1000, per_session=0) == 1000
+    assert step_token_budget(9500, per_step=1000, per_session=10000) == 500
+    assert step_token_budget(12000, per_step=1000, per_session=10000) == 0
+
+
+def _session_prompt(steps: int):
+    """
+    The components of the prompt of a session whose blackboard and history grow at every step.
+    """
+    screenshot = _png_url(1920, 1080)
+    history = [
+        {"subtask": f"Subtask {step}", "result": "done " * 60} for step in range(steps)
+    ]
+    screenshots = [screenshot] * steps
+    examples = [f"Example {index}: " + "click the button. " * 150 for index in range(3)]
+
+    def build(kept: Dict[str, int]):
+        components = {
+            "screenshots": [screenshot, screenshot],
+            "blackboard_screenshots": keep_items(
+                screenshots, kept["blackboard_screenshots"]
+            ),
+            "history": keep_items(history, kept["history"]),
+            "examples": keep_items(examples, kept["examples"], keep_latest=False),
+        }
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an agent. " + "\n".join(components["examples"]),
+            },
+            {
+                "role": "user",
+                "content": [
+                    {"type": "image_url", "image_url": {"url": url}}
+                    for url in components["blackboard_screenshots"]
+                    + components["screenshots"]
+                ]
+                + [{"type": "text", "text": json.dumps(components["history"])}],
+            },
+        ]
+        return messages, components
+
+    trimmable = [
+        TrimmableComponent("blackboard_screenshots", len(screenshots)),
+        TrimmableComponent("history", len(history)),
+        TrimmableComponent("examples", len(examples), keep_latest=False),
+    ]
+    return build, trimmable
+
+
+def test_fit_prompt_without_budget_keeps_everything():
+    build, trimmable = _session_prompt(8)
+
+    fit = fit_prompt(build, trimmable)
+
+    assert fit.trimmed == {}
+    assert fit.tokens == count_message_tokens(fit.messages)
+    assert not fit.over_budget
+
+
+def test_fit_prompt_trims_in_order_within_budget():
+    build, trimmable = _session_prompt(8)
+    trim_order = ["blackboard_screenshots", "history", "examples"]
+    unlimited = fit_prompt(build, trimmable)
+    breakdown = unlimited.breakdown
+
+    budget = unlimited.tokens - breakdown["blackboard_screenshots"] // 2
+    fit = fit_prompt(build, trimmable, budget=budget, trim_order=trim_order)
+
+    assert fit.tokens <= budget
+    assert not fit.over_budget
+    # Only the oldest blackboard screenshots are dropped while they are enough.
+    assert list(fit.trimmed) == ["blackboard_screenshots"]
+    assert 0 < fit.trimmed["blackboard_screenshots"] < 8
+    assert sum(fit.breakdown.values()) == fit.tokens
+
+    budget = (
+        unlimited.tokens
+        - breakdown["blackboard_screenshots"]
+        - breakdown["history"]
+        - breakdown["examples"] // 2
+    )
+    fit = fit_prompt(build, trimmable, budget=budget, trim_order=trim_order)
+
+    assert fit.tokens <= budget
+    assert fit.trimmed["blackboard_screenshots"] == 8
+    assert fit.trimmed["history"] == 8
+    assert 0 < fit.trimmed["examples"] < 3
+    # The first ranked examples are kept.
+    assert "Example 0" in fit.messages[0]["content"]
+    assert "Example 2" not in fit.messages[0]["content"]
+
+
+def test_fit_prompt_reports_an_unreachable_budget():
+    build, trimmable = _session_prompt(2)
+
+    fit = fit_prompt(build, trimmable, budget=100, trim_order=["history"])
+
+    assert fit.trimmed == {"history": 2}
+    assert fit.over_budget
@@ -0,0 +1,119 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+from typing import Tuple
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from ufo.utils.ui_settle import UISettleDetector
+
+
+class SyntheticFrameSource:
+    """
+    A frame source changing for a number of frames then staying still, with an optional blinking caret.
+    """
+
+    def __init__(
+        self,
+        changing_frames: int,
+        size: Tuple[int, int] = (640, 360),
+        caret: bool = True,
+        seed: int = 0,
+    ) -> None:
+        self.changing_frames = changing_frames
+        self.size = size
+        self.caret = caret
+        self.calls = 0
+        self._rng = np.random.default_rng(seed)
+        self._content = self._new_content()
+
+    def _new_content(self) -> np.ndarray:
+        """
+        Draw a few random blocks of color, like panes being repainted.
+        """
+        width, height = self.size
+        content = np.full((height, width, 3), 240, dtype=np.uint8)
+        for _ in range(8):
+            left = int(self._rng.integers(0, width - 200))
+            top = int(self._rng.integers(0, height - 100))
+            content[top : top + 100, left : left + 200] = self._rng.integers(
+                0, 255, 3, dtype=np.uint8
+            )
+        return content
+
+    def __call__(self) -> Image.Image:
+        self.calls += 1
+        if self.calls <= self.changing_frames:
+            self._content = self._new_content()
+
+        frame = self._content
+        if self.caret and self.calls % 2 == 0:
+            frame = frame.copy()
+            frame[100:116, 300:302] = 0
+        return Image.fromarray(frame)
+
+
+class FakeClock:
+    """
+    A clock advanced by the sleeps of the wait.
+    """
+
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def _detector(method: str = "dhash") -> UISettleDetector:
+    return UISettleDetector(
+        method=method, threshold=0.01, interval=0.05, stable_frames=2, min_wait=0.1
+    )
+
+
+@pytest.mark.parametrize("method", ["dhash", "pixel"])
+@pytest.mark.parametrize("changing_frames", [0, 1, 5])
+def test_ui_settles_after_the_changing_frames(method, changing_frames):
+    detector = _detector(method)
+    source = SyntheticFrameSource(changing_frames, seed=changing_frames)
+    clock = FakeClock()
+
+    result = detector.wait(source, timeout=1.0, clock=clock, sleep=clock.sleep)
+
+    assert result.settled
+    # The last changing frame, then two stable comparisons.
+    assert result.frames == max(changing_frames, 1) + detector.stable_frames
+    assert result.elapsed < 1.0
+
+
+@pytest.mark.parametrize("method", ["dhash", "pixel"])
+def test_unsettled_ui_times_out(method):
+    detector = _detector(method)
+    clock = FakeClock()
+
+    result = detector.wait(
+        SyntheticFrameSource(changing_frames=1000),
+        timeout=0.5,
+        clock=clock,
+        sleep=clock.sleep,
+    )
+
+    assert not result.settled
+    assert result.elapsed == pytest.approx(0.5)
+
+
+def test_failed_capture_ends_the_wait():
+    clock = FakeClock()
+
+    def capture():
+        raise OSError("The window is closed.")
+
+    result = _detector().wait(capture, timeout=1.0, clock=clock, sleep=clock.sleep)
+
+    assert not result.settled
+    assert result.frames == 0
@@ -0,0 +1,135 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import itertools
+
+from fake_ui_tree import (
+    FakeElementInfo,
+    FakeRect,
+    FakeUIAWrapper,
+    build_fake_tree,
+)
+from ufo.utils.ui_tree_diff import apply_ui_tree_diff, diff_size, diff_ui_trees
+from ufo.utils.ui_tree_snapshot import UITreeSnapshotter
+
+
+def _numbered_tree(root: FakeUIAWrapper) -> dict:
+    """
+    Capture a fake tree like UITree without the snapshotter, with the nodes numbered in pre-order.
+    """
+    counter = itertools.count()
+
+    def capture(node: FakeUIAWrapper, level: int) -> dict:
+        rect = node.element_info.rectangle
+        rectangle = {
+            "left": rect.left,
+            "top": rect.top,
+            "right": rect.right,
+            "bottom": rect.bottom,
+        }
+        tree = {
+            "id": f"node_{next(counter)}",
+            "name": node.element_info.name,
+            "control_type": node.element_info.control_type,
+            "rectangle": rectangle,
+            "adjusted_rectangle": dict(rectangle),
+            "relative_rectangle": dict(rectangle),
+            "level": level,
+            "children": [],
+        }
+        for child in node.children():
+            tree["children"].append(capture(child, level + 1))
+        return tree
+
+    return capture(root, 0)
+
+
+def _list_item(name: str) -> FakeUIAWrapper:
+    return FakeUIAWrapper(FakeElementInfo(name, "ListItem", FakeRect(0, 0, 10, 10)))
+
+
+def _list_window(count: int) -> FakeUIAWrapper:
+    """
+    A window with a list of items, each item with three sub-controls.
+    """
+    items = []
+    for i in range(count):
+        item = _list_item(f"Item {i}")
+        for control_type in ("Text", "Button", "CheckBox"):
+            item.add_child(
+                FakeUIAWrapper(
+                    FakeElementInfo(
+                        f"{control_type} {i}", control_type, FakeRect(0, 0, 5, 5)
+                    )
+                )
+            )
+        items.append(item)
+    list_control = FakeUIAWrapper(
+        FakeElementInfo("List", "List", FakeRect(0, 0, 100, 500)), items
+    )
+    return FakeUIAWrapper(
+        FakeElementInfo("Window", "Window", FakeRect(0, 0, 100, 500)), [list_control]
+    )
+
+
+def test_insertion_does_not_modify_renumbered_nodes():
+    root = _list_window(50)
+    tree1 = _numbered_tree(root)
+    root.children()[0].add_child(_list_item("Inserted"), index=0)
+    tree2 = _numbered_tree(root)
+
+    diff = diff_ui_trees(tree1, tree2)
+
+    assert diff_size(diff) == {
+        "added": 1,
+        "removed": 0,
+        "moved": 0,
+        "modified": 0,
+        "remapped": 200,
+    }
+    assert apply_ui_tree_diff(tree1, diff) == tree2
+
+
+def test_identical_trees_have_an_empty_diff():
+    tree = _numbered_tree(build_fake_tree((4, 3, 4)))
+
+    assert diff_ui_trees(tree, tree) == {
+        "added": [],
+        "removed": [],
+        "moved": [],
+        "modified": [],
+    }
+
+
+def test_move_and_removal_round_trip():
+    root = _list_window(10)
+    tree1 = _numbered_tree(root)
+    items = root.children()[0]
+    items.add_child(items.remove_child(2))
+    items.remove_child(5)
+    tree2 = _numbered_tree(root)
+
+    diff = diff_ui_trees(tree1, tree2)
+
+    assert len(diff["moved"]) == 1
+    assert len(diff["removed"]) == 1
+    assert diff["modified"] == []
+    assert apply_ui_tree_diff(tree1, diff) == tree2
+
+
+def test_snapshotter_and_diff_engine_round_trip():
+    root = build_fake_tree((4, 3, 4, 4))
+    snapshotter = UITreeSnapshotter(full_refresh_interval=0)
+    tree1 = snapshotter.snapshot(root).tree
+
+    root.children()[0].children()[0].add_child(_list_item("Inserted"), index=0)
+    other = root.children()[1].children()[1]
+    other.add_child(other.remove_child(0))
+    root.children()[2].remove_child(1)
+
+    snapshotter.full_refresh_interval = 1
+    snapshot = snapshotter.snapshot(root)
+    tree2 = snapshot.tree
+
+    assert apply_ui_tree_diff(tree1, diff_ui_trees(tree1, tree2)) == tree2
+    assert apply_ui_tree_diff(tree1, snapshot.diff) == tree2
@@ -0,0 +1,72 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+from typing import Any, Dict
+
+from fake_ui_tree import (
+    FakeElementInfo,
+    FakeRect,
+    FakeUIAWrapper,
+    build_fake_tree,
+)
+from ufo.utils.ui_tree_snapshot import UITreeSnapshotter
+
+
+def _strip_ids(tree: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Remove the IDs of a tree, to compare two trees regardless of the ID assignment.
+    """
+    tree = dict(tree)
+    tree.pop("id", None)
+    tree["children"] = [_strip_ids(child) for child in tree.get("children", [])]
+    return tree
+
+
+def _change_ui(root: FakeUIAWrapper) -> None:
+    """
+    Add a control to a group and resize another group.
+    """
+    root.children()[1].children()[2].add_child(
+        FakeUIAWrapper(
+            FakeElementInfo(
+                "New Button", "Button", FakeRect(10, 10, 50, 50), (42, 1, 99999)
+            )
+        )
+    )
+    resized = root.children()[3].children()[0]
+    rect = resized.element_info.rectangle
+    resized.element_info.rectangle = FakeRect(
+        rect.left, rect.top, rect.right + 5, rect.bottom
+    )
+
+
+def test_incremental_snapshot_matches_a_full_walk():
+    root = build_fake_tree((4, 4, 4, 4))
+    snapshotter = UITreeSnapshotter(full_refresh_interval=0)
+    first = snapshotter.snapshot(root)
+
+    _change_ui(root)
+    FakeUIAWrapper.children_calls = 0
+    second = snapshotter.snapshot(root)
+    incremental_calls = FakeUIAWrapper.children_calls
+
+    FakeUIAWrapper.children_calls = 0
+    reference = UITreeSnapshotter(full_refresh_interval=0).snapshot(root)
+
+    assert _strip_ids(second.tree) == _strip_ids(reference.tree)
+    assert second.reused > 0
+    assert incremental_calls < FakeUIAWrapper.children_calls
+    assert second.visited + second.reused > first.visited
+    assert len(second.diff["added"]) == 1
+    assert second.diff["removed"] == []
+
+
+def test_unchanged_ui_gives_an_empty_diff():
+    root = build_fake_tree((3, 3, 3))
+    snapshotter = UITreeSnapshotter(full_refresh_interval=0)
+    first = snapshotter.snapshot(root)
+
+    second = snapshotter.snapshot(root)
+
+    assert second.tree == first.tree
+    assert all(not entries for entries in second.diff.values())
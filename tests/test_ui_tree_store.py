@@ -0,0 +1,45 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+import json
+import os
+
+import pytest
+
+from fake_ui_tree import build_fake_tree
+from ufo.utils.ui_tree_snapshot import UITreeSnapshotter
+from ufo.utils.ui_tree_store import UI_TREE_FORMATS, UITreeStore
+
+
+@pytest.fixture
+def tree():
+    return (
+        UITreeSnapshotter(full_refresh_interval=0)
+        .snapshot(build_fake_tree((4, 3, 4, 4)))
+        .tree
+    )
+
+
+def test_views_match_the_tree(tree):
+    store = UITreeStore.from_tree(tree)
+
+    assert store.root() == tree
+    assert store.to_tree() == tree
+    assert store.flatten()[1]["name"] == tree["children"][0]["name"]
+
+
+@pytest.mark.parametrize("file_format", UI_TREE_FORMATS)
+def test_files_round_trip(tree, tmp_path, file_format):
+    store = UITreeStore.from_tree(tree)
+    path = os.path.join(tmp_path, "tree" + UITreeStore.file_extension(file_format))
+
+    with open(path, "wb") as file:
+        store.write(file, file_format)
+
+    assert UITreeStore.load(path).to_tree() == tree
+
+
+def test_streamed_json_is_the_tree(tree):
+    store = UITreeStore.from_tree(tree)
+
+    assert json.loads("".join(store.iter_json(chunk_size=7))) == tree
@@ -141,9 +141,17 @@ class AppAgent(BasicAgent):
         :param include_last_screenshot: The flag indicating whether to include the last screenshot.
         :return: The prompt message.
         """
-        appagent_prompt_system_message = self.prompter.system_prompt_construction(
-            dynamic_examples
-        )
+        if configs.get("PROMPT_CACHE", True):
+            # Keep the system prompt identical at every step, the retrieved examples lead the user content.
+            appagent_prompt_system_message = self.prompter.system_prompt_construction()
+            examples_content = self.prompter.retrieved_examples_content(
+                dynamic_examples
+            )
+        else:
+            appagent_prompt_system_message = self.prompter.system_prompt_construction(
+                dynamic_examples
+            )
+            examples_content = []
 
         appagent_prompt_user_message = self.prompter.user_content_construction(
             image_list=image_list,
@@ -164,6 +172,8 @@ class AppAgent(BasicAgent):
                 blackboard_prompt + appagent_prompt_user_message
             )
 
+        appagent_prompt_user_message = examples_content + appagent_prompt_user_message
+
         appagent_prompt_message = self.prompter.prompt_construction(
             appagent_prompt_system_message, appagent_prompt_user_message
         )
@@ -322,6 +332,7 @@ class AppAgent(BasicAgent):
             experience_top_k,
             filter=lambda x: self._app_root_name.lower()
             in [app.lower() for app in x["app_list"]],
+            filter_key=("app_list", self._app_root_name.lower()),
         )
 
         if experience_docs:
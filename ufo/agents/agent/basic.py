@@ -4,8 +4,19 @@
 from __future__ import annotations
 
 import json
+import math
 from abc import ABC, abstractmethod
-from typing import TYPE_CHECKING, Dict, List, Optional, Type, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
 
 from ufo import utils
 from ufo.agents.memory.memory import Memory, MemoryItem
@@ -14,6 +25,8 @@ from ufo.agents.states.basic import AgentState, AgentStatus
 from ufo.automator import puppeteer
 from ufo.config.config import Config
 from ufo.llm import llm_call
+from ufo.llm.hedged_request import hedged_request
+from ufo.llm.json_stream import field_callback
 from ufo.module.context import Context
 from ufo.module.interactor import question_asker
 
@@ -166,6 +179,51 @@ class BasicAgent(ABC):
         )
         return response_string, cost
 
+    @classmethod
+    def get_parsed_response(
+        cls,
+        message: List[dict],
+        namescope: str,
+        use_backup_engine: bool,
+        configs=configs,
+        on_field: Optional[Callable[[str, Any], None]] = None,
+    ) -> Tuple[str, float]:
+        """
+        Get a response for the prompt that can be parsed into a dictionary, retrying up to JSON_PARSING_RETRY times. In
+        the hedged mode, a request still running after JSON_PARSING_HEDGE_DELAY seconds is hedged by a concurrent one,
+        and every request asks for JSON_PARSING_CANDIDATES completions, used natively by the OpenAI-compatible services.
+        :param message: The message for LLMs.
+        :param namescope: The namescope for the LLMs.
+        :param use_backup_engine: Whether to use the backup engine.
+        :param configs: The configurations.
+        :param on_field: The function called with every top-level field of the response as soon as it is streamed, if
+        the service supports the streaming. It is called again for the fields of every retried request.
+        :return: The first response that can be parsed, or the last response, and the cost of the requests.
+        """
+        hedged = configs.get("JSON_PARSING_HEDGE", False)
+        candidates = configs.get("JSON_PARSING_CANDIDATES", 1) if hedged else 1
+
+        def request() -> Tuple[List[str], float]:
+            return llm_call.get_completions(
+                message,
+                namescope,
+                use_backup_engine=use_backup_engine,
+                n=candidates,
+                configs=configs,
+                stream_callback=field_callback(on_field) if on_field else None,
+                validate=cls.response_to_dict,
+            )
+
+        result = hedged_request(
+            request,
+            cls.response_to_dict,
+            max_requests=configs.get("JSON_PARSING_RETRY", 3),
+            hedge_delay=(
+                configs.get("JSON_PARSING_HEDGE_DELAY", 10) if hedged else math.inf
+            ),
+        )
+        return result.response, result.cost
+
     @staticmethod
     def response_to_dict(response: str) -> Dict[str, str]:
         """
@@ -4,7 +4,7 @@
 import json
 import os
 from dataclasses import dataclass
-from typing import Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Union
 
 from ufo.agents.memory.memory import Memory, MemoryItem
 from ufo.automator.ui_control.screenshot import PhotographerFacade
@@ -141,7 +141,7 @@ class Blackboard:
         :param metadata: The metadata of the image.
         """
 
-        if os.path.exists(screenshot_path):
+        if PhotographerFacade.image_exists(screenshot_path):
 
             screenshot_str = PhotographerFacade().encode_image_from_path(
                 screenshot_path
@@ -201,26 +201,38 @@ class Blackboard:
         for qa in qa_list:
             self.add_questions(qa)
 
-    def texts_to_prompt(self, memory: Memory, prefix: str) -> List[str]:
+    def texts_to_prompt(
+        self, memory: Memory, prefix: str, last_k: Optional[int] = None
+    ) -> List[str]:
         """
         Convert the data to a prompt.
+        :param memory: The memory.
+        :param prefix: The prefix of the prompt.
+        :param last_k: The number of the latest items to include, all if None.
         :return: The prompt.
         """
 
-        user_content = [
-            {"type": "text", "text": f"{prefix}\n {json.dumps(memory.list_content)}"}
-        ]
+        items = memory.list_content
+        if last_k is not None:
+            items = items[-last_k:] if last_k > 0 else []
+
+        user_content = [{"type": "text", "text": f"{prefix}\n {json.dumps(items)}"}]
 
         return user_content
 
-    def screenshots_to_prompt(self) -> List[str]:
+    def screenshots_to_prompt(self, last_k: Optional[int] = None) -> List[str]:
         """
         Convert the images to a prompt.
+        :param last_k: The number of the latest screenshots to include, all if None.
         :return: The prompt.
         """
 
+        screenshots = self.screenshots.list_content
+        if last_k is not None:
+            screenshots = screenshots[-last_k:] if last_k > 0 else []
+
         user_content = []
-        for screenshot_dict in self.screenshots.list_content:
+        for screenshot_dict in screenshots:
             user_content.append(
                 {
                     "type": "text",
@@ -273,9 +285,35 @@ class Blackboard:
         self.trajectories.from_list_of_dicts(blackboard_dict.get("trajectories", []))
         self.screenshots.from_list_of_dicts(blackboard_dict.get("screenshots", []))
 
-    def blackboard_to_prompt(self) -> List[str]:
+    def prompt_components(
+        self,
+        trajectories_last_k: Optional[int] = None,
+        screenshots_last_k: Optional[int] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Convert the blackboard to the components of its prompt, so that the trajectories and the screenshots can be
+        trimmed to fit the token budget.
+        :param trajectories_last_k: The number of the latest trajectories to include, all if None.
+        :param screenshots_last_k: The number of the latest screenshots to include, all if None.
+        :return: The prompt of the questions, requests, trajectories and screenshots.
+        """
+        return {
+            "questions": self.texts_to_prompt(self.questions, "[Questions & Answers:]"),
+            "requests": self.texts_to_prompt(self.requests, "[Request History:]"),
+            "trajectories": self.texts_to_prompt(
+                self.trajectories,
+                "[Step Trajectories Completed Previously:]",
+                last_k=trajectories_last_k,
+            ),
+            "screenshots": self.screenshots_to_prompt(last_k=screenshots_last_k),
+        }
+
+    def blackboard_to_prompt(
+        self, components: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    ) -> List[str]:
         """
         Convert the blackboard to a prompt.
+        :param components: The components of the prompt from prompt_components, all the blackboard if None.
         :return: The prompt.
         """
         prefix = [
@@ -285,14 +323,15 @@ class Blackboard:
             }
         ]
 
+        if components is None:
+            components = self.prompt_components()
+
         blackboard_prompt = (
             prefix
-            + self.texts_to_prompt(self.questions, "[Questions & Answers:]")
-            + self.texts_to_prompt(self.requests, "[Request History:]")
-            + self.texts_to_prompt(
-                self.trajectories, "[Step Trajectories Completed Previously:]"
-            )
-            + self.screenshots_to_prompt()
+            + components["questions"]
+            + components["requests"]
+            + components["trajectories"]
+            + components["screenshots"]
         )
 
         return blackboard_prompt
@@ -16,7 +16,10 @@ from pywinauto.controls.uiawrapper import UIAWrapper
 
 from ufo import utils
 from ufo.automator.puppeteer import AppPuppeteer
-from ufo.automator.ui_control.screenshot import PhotographerDecorator
+from ufo.automator.ui_control.screenshot import (
+    PhotographerDecorator,
+    PhotographerFacade,
+)
 from ufo.config.config import Config
 
 
@@ -51,6 +54,18 @@ class ActionExecutionLog:
     return_value: Any = None
 
 
+@dataclass
+class PreparedControl:
+    """
+    The control of an action validated, and outlined on the screen, while the response of the LLM is still streamed.
+    """
+
+    control_label: str
+    available: bool
+    # The time the outline was drawn, None if it was not drawn.
+    outline_time: Optional[float] = None
+
+
 class OneStepAction:
 
     def __init__(
@@ -62,6 +77,7 @@ class OneStepAction:
         after_status: str = "",
         results: Optional[ActionExecutionLog] = None,
         configs=Config.get_instance().config_data,
+        prepared_control: Optional[PreparedControl] = None,
     ):
         self._function = function
         self._args = args
@@ -72,6 +88,13 @@ class OneStepAction:
         self._configs = configs
         self._control_log = BaseControlLog()
 
+        # The preparation only applies to the same control.
+        if prepared_control is not None and prepared_control.control_label != (
+            control_label
+        ):
+            prepared_control = None
+        self._prepared_control = prepared_control
+
     @property
     def function(self) -> str:
         """
@@ -216,7 +239,8 @@ class OneStepAction:
         """
         return json.dumps(self.to_dict(previous_actions), ensure_ascii=False)
 
-    def _control_validation(self, control: UIAWrapper) -> bool:
+    @staticmethod
+    def _control_validation(control: UIAWrapper) -> bool:
         """
         Validate the action.
         :param action: The action to validate.
@@ -231,6 +255,26 @@ class OneStepAction:
         except:
             return False
 
+    @staticmethod
+    def prepare_control(
+        control_label: str,
+        control: UIAWrapper,
+        configs=Config.get_instance().config_data,
+    ) -> PreparedControl:
+        """
+        Validate the control of an action, and outline it on the screen, ahead of the action.
+        :param control_label: The label of the control.
+        :param control: The control.
+        :param configs: The configurations.
+        :return: The prepared control.
+        """
+        available = OneStepAction._control_validation(control)
+        outline_time = None
+        if available and configs.get("SHOW_VISUAL_OUTLINE_ON_SCREEN", True):
+            control.draw_outline(colour="red", thickness=3)
+            outline_time = time.monotonic()
+        return PreparedControl(control_label, available, outline_time)
+
     def execute(self, puppeteer: AppPuppeteer) -> Any:
         """
         Execute the action.
@@ -253,10 +297,16 @@ class OneStepAction:
         """
         control_selected: UIAWrapper = control_dict.get(self.control_label, None)
 
+        prepared = self._prepared_control
+        if prepared is not None:
+            available = prepared.available
+        else:
+            available = control_selected is None or self._control_validation(
+                control_selected
+            )
+
         # If the control is selected, but not available, return an error.
-        if control_selected is not None and not self._control_validation(
-            control_selected
-        ):
+        if control_selected is not None and not available:
             self.results = ActionExecutionLog(
                 status="error",
                 traceback="Control is not available.",
@@ -275,8 +325,13 @@ class OneStepAction:
 
             if self._configs.get("SHOW_VISUAL_OUTLINE_ON_SCREEN", True):
                 if control_selected:
-                    control_selected.draw_outline(colour="red", thickness=3)
-                    time.sleep(self._configs.get("RECTANGLE_TIME", 0))
+                    rectangle_time = self._configs.get("RECTANGLE_TIME", 0)
+                    if prepared is not None and prepared.outline_time is not None:
+                        # The outline is already shown, only wait for the rest of its time.
+                        rectangle_time -= time.monotonic() - prepared.outline_time
+                    else:
+                        control_selected.draw_outline(colour="red", thickness=3)
+                    time.sleep(max(0, rectangle_time))
 
             self._control_log = self._get_control_log(
                 control_selected=control_selected, application_window=application_window
@@ -478,8 +533,8 @@ class ActionSequence:
 
                 action.action_flow(puppeteer, control_dict, application_window)
 
-                # Sleep for a while to avoid the UI being too busy.
-                time.sleep(0.5)
+                # Wait for the UI to settle before the next action.
+                PhotographerFacade.wait_until_settled(application_window, 0.5)
 
             if action.results.status != "success":
                 early_stop = True
@@ -1,7 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-import json
 import os
 from dataclasses import asdict, dataclass, field
 from typing import TYPE_CHECKING, Any, ClassVar, Dict, List, Optional, Union
@@ -15,7 +14,10 @@ from ufo.automator.ui_control import ui_tree
 from ufo.automator.ui_control.control_filter import ControlFilterFactory
 from ufo.automator.ui_control.grounding.basic import BasicGrounding
 from ufo.config.config import Config
+from ufo.llm.prompt_cache import track_prompt_cache
+from ufo.llm.token_accounting import TrimmableComponent, keep_items
 from ufo.module.context import Context, ContextNames
+from ufo.utils.image_codec import ImageCodecSettings
 
 if TYPE_CHECKING:
     from ufo.agents.agent.app_agent import AppAgent
@@ -48,6 +50,7 @@ class AppAgentAdditionalMemory:
     AgentName: str
     Application: str
     Cost: float
+    PromptCache: Dict[str, Any]
     Results: str
     error: str
     time_cost: Dict[str, float]
@@ -110,6 +113,7 @@ class AppAgentRequestLog:
     include_last_screenshot: bool
     prompt: Dict[str, Any]
     control_info_recording: Dict[str, Any]
+    token_usage: Dict[str, Any]
 
 
 class AppAgentProcessor(BaseProcessor):
@@ -144,6 +148,9 @@ class AppAgentProcessor(BaseProcessor):
         self.filtered_annotation_dict = None
         self.screenshot_save_path = None
         self.grounding_service = ground_service
+        self.image_codec = ImageCodecSettings.from_config("APP_AGENT")
+        self._streamed_fields = {}
+        self._prepared_controls = {}
 
     def print_step_info(self) -> None:
         """
@@ -201,6 +208,9 @@ class AppAgentProcessor(BaseProcessor):
 
             onmiparser_configs = configs.get("OMNIPARSER", {})
 
+            # The grounding service reads the screenshot file, wait until it is written.
+            self.photographer.wait_for_image(screenshot_path)
+
             # print(onmiparser_configs)
 
             grounding_control_list = (
@@ -312,22 +322,32 @@ class AppAgentProcessor(BaseProcessor):
             self._annotation_dict
         )
 
-        # Capture the screenshot of the selected control items with annotation and save it.
+        # Annotate the selected control items on the clean screenshot and save it.
         self.photographer.capture_app_window_screenshot_with_annotation_dict(
             self.application_window,
             self.filtered_annotation_dict,
             annotation_type="number",
             save_path=annotated_screenshot_save_path,
+            background_screenshot_path=screenshot_save_path,
         )
 
         if configs.get("SAVE_UI_TREE", False):
             if self.application_window is not None:
-                step_ui_tree = ui_tree.UITree(self.application_window)
+                step_ui_tree = ui_tree.UITree(
+                    self.application_window,
+                    incremental=configs.get("UI_TREE_INCREMENTAL", True),
+                )
                 step_ui_tree.save_ui_tree_to_json(
                     os.path.join(
                         self.ui_tree_path, f"ui_tree_step{self.session_step}.json"
                     )
                 )
+                step_ui_tree.save_ui_tree_diff_to_json(
+                    os.path.join(
+                        self.ui_tree_path,
+                        f"ui_tree_step{self.session_step}_diff.json",
+                    )
+                )
 
         if configs.get("SAVE_FULL_SCREEN", False):
 
@@ -354,9 +374,9 @@ class AppAgentProcessor(BaseProcessor):
                 + f"action_step{self.session_step - 1}_selected_controls.png"
             )
             self._image_url += [
-                self.photographer.encode_image_from_path(
+                self.encode_screenshot(
                     last_control_screenshot_save_path
-                    if os.path.exists(last_control_screenshot_save_path)
+                    if self.photographer.image_exists(last_control_screenshot_save_path)
                     else last_screenshot_save_path
                 )
             ]
@@ -368,14 +388,10 @@ class AppAgentProcessor(BaseProcessor):
                 annotated_screenshot_save_path,
                 concat_screenshot_save_path,
             )
-            self._image_url += [
-                self.photographer.encode_image_from_path(concat_screenshot_save_path)
-            ]
+            self._image_url += [self.encode_screenshot(concat_screenshot_save_path)]
         else:
-            screenshot_url = self.photographer.encode_image_from_path(
-                screenshot_save_path
-            )
-            screenshot_annotated_url = self.photographer.encode_image_from_path(
+            screenshot_url = self.encode_screenshot(screenshot_save_path)
+            screenshot_annotated_url = self.encode_screenshot(
                 annotated_screenshot_save_path
             )
             self._image_url += [screenshot_url, screenshot_annotated_url]
@@ -431,11 +447,6 @@ class AppAgentProcessor(BaseProcessor):
 
         external_knowledge_prompt = offline_docs + online_docs
 
-        if not self.app_agent.blackboard.is_empty():
-            blackboard_prompt = self.app_agent.blackboard.blackboard_to_prompt()
-        else:
-            blackboard_prompt = []
-
         # Get the last successful actions of the AppAgent.
         last_success_actions = self.get_last_success_actions()
 
@@ -446,22 +457,78 @@ class AppAgentProcessor(BaseProcessor):
             for action in last_success_actions
         ]
 
-        # Construct the prompt message for the AppAgent.
-        self._prompt_message = self.app_agent.message_constructor(
-            dynamic_examples=retrieved_results,
-            dynamic_knowledge=external_knowledge_prompt,
-            image_list=self._image_url,
-            control_info=self.filtered_control_info,
-            prev_subtask=self.previous_subtasks,
-            plan=self.prev_plan,
-            request=self.request,
-            subtask=self.subtask,
-            current_application=self.application_process_name,
-            host_message=self.host_message,
-            blackboard_prompt=blackboard_prompt,
-            last_success_actions=filtered_last_success_actions,
-            include_last_screenshot=configs.get("INCLUDE_LAST_SCREENSHOT", True),
+        blackboard = self.app_agent.blackboard
+        # The blackboard prompt of the last build, i.e. the one sent.
+        sent = {}
+
+        def build(kept: Dict[str, int]):
+            if not blackboard.is_empty():
+                blackboard_components = blackboard.prompt_components(
+                    trajectories_last_k=kept["blackboard_trajectories"],
+                    screenshots_last_k=kept["blackboard_screenshots"],
+                )
+                blackboard_prompt = blackboard.blackboard_to_prompt(
+                    blackboard_components
+                )
+            else:
+                blackboard_components = {}
+                blackboard_prompt = []
+            sent["blackboard_prompt"] = blackboard_prompt
+
+            prev_subtask = keep_items(self.previous_subtasks, kept["history"])
+            dynamic_examples = keep_items(
+                retrieved_results, kept["examples"], keep_latest=False
+            )
+
+            # Construct the prompt message for the AppAgent.
+            prompt_message = self.app_agent.message_constructor(
+                dynamic_examples=dynamic_examples,
+                dynamic_knowledge=external_knowledge_prompt,
+                image_list=self._image_url,
+                control_info=self.filtered_control_info,
+                prev_subtask=prev_subtask,
+                plan=self.prev_plan,
+                request=self.request,
+                subtask=self.subtask,
+                current_application=self.application_process_name,
+                host_message=self.host_message,
+                blackboard_prompt=blackboard_prompt,
+                last_success_actions=filtered_last_success_actions,
+                include_last_screenshot=configs.get("INCLUDE_LAST_SCREENSHOT", True),
+            )
+
+            components = {
+                "screenshots": self._image_url,
+                "control_info": self.filtered_control_info,
+                "blackboard_questions": blackboard_components.get("questions", []),
+                "blackboard_requests": blackboard_components.get("requests", []),
+                "blackboard_trajectories": blackboard_components.get(
+                    "trajectories", []
+                ),
+                "blackboard_screenshots": blackboard_components.get("screenshots", []),
+                "history": prev_subtask,
+                "examples": dynamic_examples,
+                "knowledge": external_knowledge_prompt,
+            }
+            return prompt_message, components
+
+        fit = self.fit_prompt_message(
+            build,
+            [
+                TrimmableComponent(
+                    "blackboard_screenshots", blackboard.screenshots.length
+                ),
+                TrimmableComponent(
+                    "blackboard_trajectories", blackboard.trajectories.length
+                ),
+                TrimmableComponent("history", len(self.previous_subtasks)),
+                TrimmableComponent(
+                    "examples", len(retrieved_results), keep_latest=False
+                ),
+            ],
+            "APP_AGENT",
         )
+        self._prompt_message = fit.messages
 
         # Log the prompt message. Only save them in debug mode.
         request_data = AppAgentRequestLog(
@@ -480,15 +547,15 @@ class AppAgentProcessor(BaseProcessor):
             subtask=self.subtask,
             current_application=self.application_process_name,
             host_message=self.host_message,
-            blackboard_prompt=blackboard_prompt,
+            blackboard_prompt=sent["blackboard_prompt"],
             last_success_actions=filtered_last_success_actions,
             include_last_screenshot=configs.get("INCLUDE_LAST_SCREENSHOT", True),
             prompt=self._prompt_message,
             control_info_recording=asdict(self.control_recorder),
+            token_usage=fit.to_log(),
         )
 
-        request_log_str = json.dumps(asdict(request_data), ensure_ascii=False)
-        self.request_logger.debug(request_log_str)
+        self.log_request(asdict(request_data))
 
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
@@ -497,19 +564,47 @@ class AppAgentProcessor(BaseProcessor):
         Get the response from the LLM.
         """
 
-        retry = 0
-        while retry < configs.get("JSON_PARSING_RETRY", 3):
-            # Try to get the response from the LLM. If an error occurs, catch the exception and log the error.
-            self._response, self.cost = self.app_agent.get_response(
-                self._prompt_message, "APPAGENT", use_backup_engine=True
+        self._streamed_fields = {}
+        self._prepared_controls = {}
+
+        # Retry until the response can be parsed, hedging the slow requests if configured. If the response is streamed,
+        # the selected control is prepared while the rest of the response is generated.
+        with track_prompt_cache() as self._prompt_cache:
+            self._response, self.cost = self.app_agent.get_parsed_response(
+                self._prompt_message,
+                "APPAGENT",
+                use_backup_engine=True,
+                on_field=(
+                    self._prepare_control_early
+                    if configs.get("STREAM_RESPONSE", False)
+                    else None
+                ),
             )
 
-            try:
-                self.app_agent.response_to_dict(self._response)
-                break
-            except Exception as e:
-                print("Error in parsing response: ", e)
-                retry += 1
+    def _prepare_control_early(self, key: str, value: Any) -> None:
+        """
+        Validate and outline the selected control as soon as the streamed response has selected it with a function,
+        before the Thought, Plan and Comment are complete.
+        :param key: The key of the completed field of the response.
+        :param value: The value of the field.
+        """
+        self._streamed_fields[key] = value
+        if key not in ("ControlLabel", "Function"):
+            return
+
+        control_label = str(self._streamed_fields.get("ControlLabel", ""))
+        if (
+            not self._streamed_fields.get("Function")
+            or not self._annotation_dict
+            or control_label in self._prepared_controls
+        ):
+            return
+
+        control = self._annotation_dict.get(control_label)
+        if control is not None:
+            self._prepared_controls[control_label] = OneStepAction.prepare_control(
+                control_label, control
+            )
 
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
@@ -548,6 +643,7 @@ class AppAgentProcessor(BaseProcessor):
             control_label=self._control_label,
             control_text=self.control_text,
             after_status=self.status,
+            prepared_control=self._prepared_controls.get(self._control_label),
         )
         control_selected = self._annotation_dict.get(self._control_label, None)
 
@@ -645,6 +741,7 @@ class AppAgentProcessor(BaseProcessor):
             AgentName=self.app_agent.name,
             Application=app_root,
             Cost=self._cost,
+            PromptCache=self._prompt_cache.to_log(),
             Results=self.actions.get_results(),
             error=self._exeception_traceback,
             time_cost=self._time_cost,
@@ -817,7 +914,9 @@ class AppAgentProcessor(BaseProcessor):
             )
 
             cropped_icons_dict = self.photographer.get_cropped_icons_dict(
-                self.application_window, annotation_dict
+                self.application_window,
+                annotation_dict,
+                background_screenshot_path=self.screenshot_save_path,
             )
             filtered_icon_dict = model_icon.control_filter(
                 annotation_dict,
@@ -8,7 +8,7 @@ import time
 import traceback
 from abc import ABC, abstractmethod
 from functools import wraps
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from pywinauto.controls.uiawrapper import UIAWrapper
 
@@ -19,7 +19,18 @@ from ufo.agents.processors.actions import ActionSequence
 from ufo.automator.ui_control.inspector import ControlInspectorFacade
 from ufo.automator.ui_control.screenshot import PhotographerFacade
 from ufo.config.config import Config
+from ufo.llm.prompt_cache import PromptCacheUsage
+from ufo.llm.token_accounting import (
+    PromptFit,
+    TrimmableComponent,
+    fit_prompt,
+    get_provider,
+    step_token_budget,
+)
 from ufo.module.context import Context, ContextNames
+from ufo.utils.artifact_sink import ArtifactSink
+from ufo.utils.image_codec import ImageCodecSettings
+from ufo.utils.tracing import span
 
 configs = Config.get_instance().config_data
 
@@ -47,11 +58,18 @@ class BaseProcessor(ABC):
 
         self.photographer = PhotographerFacade()
         self.control_inspector = ControlInspectorFacade(BACKEND)
+        self.artifact_sink = ArtifactSink.get_instance()
+
+        # The codec of the screenshots sent to the LLM. None sends the PNG files as they are.
+        self.image_codec: Optional[ImageCodecSettings] = None
+        self._image_encodings = []
 
         self._prompt_message = None
         self._status = None
         self._response = None
         self._cost = 0
+        self._prompt_tokens = 0
+        self._prompt_cache = PromptCacheUsage()
         self._control_label = None
         self._control_text = None
         self._response_json = {}
@@ -85,55 +103,61 @@ class BaseProcessor(ABC):
 
         start_time = time.time()
 
-        try:
-            # Step 1: Print the step information.
-            self.print_step_info()
+        with span(
+            "processor.step",
+            agent=self.agent.name,
+            session_step=self.session_step,
+            round=self.round_num,
+        ):
+            try:
+                # Step 1: Print the step information.
+                self.print_step_info()
 
-            # Step 2: Capture the screenshot.
-            self.capture_screenshot()
+                # Step 2: Capture the screenshot.
+                self.capture_screenshot()
 
-            # Step 3: Get the control information.
-            self.get_control_info()
+                # Step 3: Get the control information.
+                self.get_control_info()
 
-            # Step 4: Get the prompt message.
-            self.get_prompt_message()
+                # Step 4: Get the prompt message.
+                self.get_prompt_message()
 
-            # Step 5: Get the response.
-            self.get_response()
+                # Step 5: Get the response.
+                self.get_response()
 
-            # Step 6: Update the context.
-            self.update_cost()
+                # Step 6: Update the context.
+                self.update_cost()
 
-            # Step 7: Parse the response, if there is no error.
-            self.parse_response()
+                # Step 7: Parse the response, if there is no error.
+                self.parse_response()
 
-            if self.is_pending() or self.is_paused():
-                # If the session is pending, update the step and memory, and return.
-                if self.is_pending():
-                    self.update_status()
-                    self.update_memory()
+                if self.is_pending() or self.is_paused():
+                    # If the session is pending, update the step and memory, and return.
+                    if self.is_pending():
+                        self.update_status()
+                        self.update_memory()
 
-                return
+                    return
 
-            # Step 8: Execute the action.
-            self.execute_action()
+                # Step 8: Execute the action.
+                self.execute_action()
 
-            # Step 9: Update the memory.
-            self.update_memory()
+                # Step 9: Update the memory.
+                self.update_memory()
 
-            # Step 10: Update the status.
-            self.update_status()
+                # Step 10: Update the status.
+                self.update_status()
 
-            self._total_time_cost = time.time() - start_time
+                self._total_time_cost = time.time() - start_time
 
-            # Step 11: Save the log.
-            self.log_save()
+                # Step 11: Save the log.
+                self.log_save()
 
-        except StopIteration:
-            # Error was handled and logged in the exception capture decorator.
-            # Simply return here to stop the process early.
+            except StopIteration:
+                # Error was handled and logged in the exception capture decorator.
+                # Simply return here to stop the process early.
 
-            return
+                return
 
     def resume(self) -> None:
         """
@@ -163,15 +187,17 @@ class BaseProcessor(ABC):
     @classmethod
     def method_timer(cls, func):
         """
-        Decorator to calculate the time cost of the method.
+        Decorator to calculate the time cost of the method, traced as a span of the step.
         :param func: The method to be decorated.
         :return: The decorated method.
         """
+        span_name = f"processor.{func.__name__}"
 
         @wraps(func)
         def wrapper(self, *args, **kwargs):
             start_time = time.time()
-            result = func(self, *args, **kwargs)
+            with span(span_name):
+                result = func(self, *args, **kwargs)
             end_time = time.time()
             self._time_cost[func.__name__] = end_time - start_time
             return result
@@ -285,7 +311,9 @@ class BaseProcessor(ABC):
         self.agent.status = self.status
 
         if self.status != self._agent_status_manager.FINISH.value:
-            time.sleep(configs["SLEEP_TIME"])
+            self.photographer.wait_until_settled(
+                self.application_window, configs["SLEEP_TIME"]
+            )
 
         self.round_step += 1
         self.session_step += 1
@@ -322,6 +350,7 @@ class BaseProcessor(ABC):
 
         self.round_cost += self.cost
         self.session_cost += self.cost
+        self.session_tokens += self._prompt_tokens
 
     @property
     def agent(self) -> BasicAgent:
@@ -434,6 +463,22 @@ class BaseProcessor(ABC):
         """
         self.context.set(ContextNames.SESSION_COST, cost)
 
+    @property
+    def session_tokens(self) -> int:
+        """
+        Get the estimated prompt tokens of the session.
+        :return: The session tokens.
+        """
+        return self.context.get(ContextNames.SESSION_TOKENS)
+
+    @session_tokens.setter
+    def session_tokens(self, tokens: int) -> None:
+        """
+        Set the estimated prompt tokens of the session.
+        :param tokens: The session tokens.
+        """
+        self.context.set(ContextNames.SESSION_TOKENS, tokens)
+
     @property
     def application_process_name(self) -> str:
         """
@@ -765,6 +810,82 @@ class BaseProcessor(ABC):
 
         self.logger.info(json.dumps(response_json))
 
+    def encode_screenshot(self, image_path: str) -> str:
+        """
+        Encode a screenshot for the LLM with the codec of the agent, and record the chosen settings in the step log.
+        :param image_path: The path of the screenshot.
+        :return: The data URL of the encoded screenshot.
+        """
+
+        if self.image_codec is None:
+            return self.photographer.encode_image_from_path(image_path)
+
+        encoded = self.photographer.encode_image_payload(image_path, self.image_codec)
+
+        if encoded is None:
+            # Let the photographer warn and return the empty image.
+            return self.photographer.encode_image_from_path(image_path)
+
+        self._image_encodings.append(
+            {"path": os.path.basename(image_path), **encoded.to_log()}
+        )
+        self._memory_data.add_values_from_dict(
+            {"ImageEncoding": self._image_encodings}
+        )
+
+        return encoded.to_data_url()
+
+    def fit_prompt_message(
+        self,
+        build: Callable[[Dict[str, int]], Tuple[List[Dict[str, Any]], Dict[str, Any]]],
+        trimmable: List[TrimmableComponent],
+        agent_type: str,
+    ) -> PromptFit:
+        """
+        Build the prompt message within the token budgets of the step and of the session, trimming its components in
+        priority order.
+        :param build: The callable building the prompt message from the number of kept items of every trimmable
+        component, and returning the message and its components by name.
+        :param trimmable: The trimmable components.
+        :param agent_type: The type of the agent in the configuration, e.g. "APP_AGENT".
+        :return: The fitted prompt.
+        """
+        fit = fit_prompt(
+            build,
+            trimmable,
+            step_token_budget(self.session_tokens),
+            get_provider(configs.get(agent_type, {})),
+        )
+
+        if fit.trimmed:
+            utils.print_with_color(
+                f"The prompt is trimmed to fit the token budget of {fit.budget}: {fit.trimmed}.",
+                "yellow",
+            )
+        if fit.over_budget:
+            utils.print_with_color(
+                f"Warning: The prompt of {fit.tokens} tokens exceeds the token budget of {fit.budget}.",
+                "yellow",
+            )
+
+        self._prompt_tokens = fit.tokens
+        return fit
+
+    def log_request(
+        self, request_data: Dict[str, Any], indent: Optional[int] = None
+    ) -> None:
+        """
+        Log the request data in the background. The serialization of the prompt and its images is done off the agent thread.
+        :param request_data: The request data, which must not be modified after being logged.
+        :param indent: The indentation of the JSON string.
+        """
+
+        def write_request_log() -> None:
+            request_log_str = json.dumps(request_data, indent=indent, ensure_ascii=False)
+            self.request_logger.debug(request_log_str)
+
+        self.artifact_sink.submit_task(write_request_log)
+
     @property
     def name(self) -> str:
         """
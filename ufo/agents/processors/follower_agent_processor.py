@@ -2,7 +2,6 @@
 # Licensed under the MIT License.
 
 
-import json
 from dataclasses import asdict, dataclass
 from typing import TYPE_CHECKING, Any, Dict
 
@@ -98,5 +97,4 @@ class FollowerAppAgentProcessor(AppAgentProcessor):
             prompt=self._prompt_message,
         )
 
-        request_log_str = json.dumps(asdict(request_data), indent=4, ensure_ascii=False)
-        self.request_logger.debug(request_log_str)
+        self.log_request(asdict(request_data), indent=4)
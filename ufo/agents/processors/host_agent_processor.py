@@ -2,7 +2,6 @@
 # Licensed under the MIT License.
 
 
-import json
 import time
 from dataclasses import asdict, dataclass
 from typing import TYPE_CHECKING, Any, Dict, List
@@ -18,7 +17,10 @@ from ufo.agents.processors.actions import (
 )
 from ufo.agents.processors.basic import BaseProcessor
 from ufo.config.config import Config
+from ufo.llm.prompt_cache import track_prompt_cache
+from ufo.llm.token_accounting import TrimmableComponent, keep_items
 from ufo.module.context import Context, ContextNames
+from ufo.utils.image_codec import ImageCodecSettings
 
 configs = Config.get_instance().config_data
 
@@ -47,6 +49,7 @@ class HostAgentAdditionalMemory:
     AgentName: str
     Application: str
     Cost: float
+    PromptCache: Dict[str, Any]
     Results: str
     error: str
     time_cost: Dict[str, float]
@@ -67,6 +70,7 @@ class HostAgentRequestLog:
     request: str
     blackboard_prompt: List[str]
     prompt: Dict[str, Any]
+    token_usage: Dict[str, Any]
 
 
 class HostAgentProcessor(BaseProcessor):
@@ -89,6 +93,7 @@ class HostAgentProcessor(BaseProcessor):
         self._desktop_windows_dict = None
         self._desktop_windows_info = None
         self.bash_command = None
+        self.image_codec = ImageCodecSettings.from_config("HOST_AGENT")
 
     def print_step_info(self) -> None:
         """
@@ -118,9 +123,7 @@ class HostAgentProcessor(BaseProcessor):
         )
 
         # Encode the desktop screenshot into base64 format as required by the LLM.
-        self._desktop_screen_url = self.photographer.encode_image_from_path(
-            desktop_save_path
-        )
+        self._desktop_screen_url = self.encode_screenshot(desktop_save_path)
 
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
@@ -146,20 +149,63 @@ class HostAgentProcessor(BaseProcessor):
         Get the prompt message.
         """
 
-        if not self.host_agent.blackboard.is_empty():
-            blackboard_prompt = self.host_agent.blackboard.blackboard_to_prompt()
-        else:
-            blackboard_prompt = []
+        blackboard = self.host_agent.blackboard
+        # The blackboard prompt of the last build, i.e. the one sent.
+        sent = {}
+
+        def build(kept: Dict[str, int]):
+            if not blackboard.is_empty():
+                blackboard_components = blackboard.prompt_components(
+                    trajectories_last_k=kept["blackboard_trajectories"],
+                    screenshots_last_k=kept["blackboard_screenshots"],
+                )
+                blackboard_prompt = blackboard.blackboard_to_prompt(
+                    blackboard_components
+                )
+            else:
+                blackboard_components = {}
+                blackboard_prompt = []
+            sent["blackboard_prompt"] = blackboard_prompt
+
+            prev_subtask = keep_items(self.previous_subtasks, kept["history"])
+
+            # Construct the prompt message for the host agent.
+            prompt_message = self.host_agent.message_constructor(
+                image_list=[self._desktop_screen_url],
+                os_info=self._desktop_windows_info,
+                plan=self.prev_plan,
+                prev_subtask=prev_subtask,
+                request=self.request,
+                blackboard_prompt=blackboard_prompt,
+            )
 
-        # Construct the prompt message for the host agent.
-        self._prompt_message = self.host_agent.message_constructor(
-            image_list=[self._desktop_screen_url],
-            os_info=self._desktop_windows_info,
-            plan=self.prev_plan,
-            prev_subtask=self.previous_subtasks,
-            request=self.request,
-            blackboard_prompt=blackboard_prompt,
+            components = {
+                "screenshots": [self._desktop_screen_url],
+                "os_info": self._desktop_windows_info,
+                "blackboard_questions": blackboard_components.get("questions", []),
+                "blackboard_requests": blackboard_components.get("requests", []),
+                "blackboard_trajectories": blackboard_components.get(
+                    "trajectories", []
+                ),
+                "blackboard_screenshots": blackboard_components.get("screenshots", []),
+                "history": prev_subtask,
+            }
+            return prompt_message, components
+
+        fit = self.fit_prompt_message(
+            build,
+            [
+                TrimmableComponent(
+                    "blackboard_screenshots", blackboard.screenshots.length
+                ),
+                TrimmableComponent(
+                    "blackboard_trajectories", blackboard.trajectories.length
+                ),
+                TrimmableComponent("history", len(self.previous_subtasks)),
+            ],
+            "HOST_AGENT",
         )
+        self._prompt_message = fit.messages
 
         request_data = HostAgentRequestLog(
             step=self.session_step,
@@ -168,13 +214,13 @@ class HostAgentProcessor(BaseProcessor):
             plan=self.prev_plan,
             prev_subtask=self.previous_subtasks,
             request=self.request,
-            blackboard_prompt=blackboard_prompt,
+            blackboard_prompt=sent["blackboard_prompt"],
             prompt=self._prompt_message,
+            token_usage=fit.to_log(),
         )
 
         # Log the prompt message. Only save them in debug mode.
-        request_log_str = json.dumps(asdict(request_data), ensure_ascii=False)
-        self.request_logger.debug(request_log_str)
+        self.log_request(asdict(request_data))
 
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
@@ -183,20 +229,12 @@ class HostAgentProcessor(BaseProcessor):
         Get the response from the LLM.
         """
 
-        retry = 0
-        while retry < configs.get("JSON_PARSING_RETRY", 3):
-            # Try to get the response from the LLM. If an error occurs, catch the exception and log the error.
-            self._response, self.cost = self.host_agent.get_response(
+        # Retry until the response can be parsed, hedging the slow requests if configured.
+        with track_prompt_cache() as self._prompt_cache:
+            self._response, self.cost = self.host_agent.get_parsed_response(
                 self._prompt_message, "HOSTAGENT", use_backup_engine=True
             )
 
-            try:
-                self.host_agent.response_to_dict(self._response)
-                break
-            except Exception as e:
-                print(f"Error in parsing response into json, retrying: {retry}")
-                retry += 1
-
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
     def parse_response(self) -> None:
@@ -389,6 +427,7 @@ class HostAgentProcessor(BaseProcessor):
             AgentName=self.host_agent.name,
             Application=self.app_root,
             Cost=self._cost,
+            PromptCache=self._prompt_cache.to_log(),
             Results=self.actions.get_results(),
             error=self._exeception_traceback,
             time_cost=self._time_cost,
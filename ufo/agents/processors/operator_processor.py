@@ -1,7 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-import json
 import os
 from dataclasses import asdict, dataclass
 from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
@@ -115,12 +114,21 @@ class OpenAIOperatorProcessor(AppAgentProcessor):
 
         if configs.get("SAVE_UI_TREE", False):
             if self.application_window is not None:
-                step_ui_tree = ui_tree.UITree(self.application_window)
+                step_ui_tree = ui_tree.UITree(
+                    self.application_window,
+                    incremental=configs.get("UI_TREE_INCREMENTAL", True),
+                )
                 step_ui_tree.save_ui_tree_to_json(
                     os.path.join(
                         self.ui_tree_path, f"ui_tree_step{self.session_step}.json"
                     )
                 )
+                step_ui_tree.save_ui_tree_diff_to_json(
+                    os.path.join(
+                        self.ui_tree_path,
+                        f"ui_tree_step{self.session_step}_diff.json",
+                    )
+                )
 
         if configs.get("SAVE_FULL_SCREEN", False):
 
@@ -182,8 +190,7 @@ class OpenAIOperatorProcessor(AppAgentProcessor):
             prompt=self._prompt_message,
         )
 
-        request_log_str = json.dumps(asdict(request_data), ensure_ascii=False)
-        self.request_logger.debug(request_log_str)
+        self.log_request(asdict(request_data))
 
     @BaseProcessor.exception_capture
     @BaseProcessor.method_timer
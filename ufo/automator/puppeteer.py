@@ -9,6 +9,7 @@ from pywinauto.controls.uiawrapper import UIAWrapper
 
 from ufo.automator.app_apis.basic import WinCOMReceiverBasic
 from ufo.automator.basic import CommandBasic, ReceiverBasic, ReceiverFactory
+from ufo.utils.tracing import span
 
 if TYPE_CHECKING:
     from ufo.automator.ui_control.controller import ControlReceiver
@@ -75,9 +76,10 @@ class AppPuppeteer:
         :return: The execution result.
         """
 
-        command = self.create_command(command_name, params, *args, **kwargs)
+        with span("puppeteer.execute_command", command=command_name):
+            command = self.create_command(command_name, params, *args, **kwargs)
 
-        return command.execute()
+            return command.execute()
 
     def execute_all_commands(self) -> List[Any]:
         """
@@ -1,13 +1,30 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
+import hashlib
 import heapq
 import re
+import threading
 import warnings
 from abc import abstractmethod
-from typing import Dict, List
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List
+
+import numpy as np
+
+from ufo.config.config import Config
+from ufo.utils.embedding import EmbeddingModelManager, get_embedding_service
 
 warnings.filterwarnings("ignore")
 
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    CONTROL_FILTER_EMBEDDING_CACHE_SIZE = int(
+        configs.get("CONTROL_FILTER_EMBEDDING_CACHE_SIZE", 4096)
+    )
+else:
+    CONTROL_FILTER_EMBEDDING_CACHE_SIZE = 4096
+
 
 class ControlFilterFactory:
     """
@@ -78,19 +95,22 @@ class BasicControlFilter:
         if model_path not in cls._instances:
             instance = super(BasicControlFilter, cls).__new__(cls)
             instance.model = cls.load_model(model_path)
+            # The texts are embedded by the shared service, with its persistent cache.
+            instance.embedding_service = get_embedding_service(model_path)
+            # The embeddings are kept across steps, as most controls and plans do not change between two steps.
+            instance._embedding_cache = OrderedDict()
+            instance._embedding_cache_lock = threading.Lock()
             cls._instances[model_path] = instance
         return cls._instances[model_path]
 
     @staticmethod
     def load_model(model_path):
         """
-        Loads the model from the given model path.
+        Loads the model from the given model path, shared with the other users of the model in the process.
         :param model_path: The path to the model.
         :return: The loaded model.
         """
-        import sentence_transformers
-
-        return sentence_transformers.SentenceTransformer(model_path)
+        return EmbeddingModelManager.get_instance().get_model(model_path)
 
     def get_embedding(self, content):
         """
@@ -101,6 +121,79 @@ class BasicControlFilter:
 
         return self.model.encode(content)
 
+    def get_embeddings(self, contents: List[Any], keys: List[Hashable]) -> np.ndarray:
+        """
+        Encodes the given contents into normalized embeddings, with a single model call for the contents not cached.
+        :param contents: The contents to encode, e.g. texts or images.
+        :param keys: The cache keys of the contents.
+        :return: The array of the normalized embeddings, one row per content.
+        """
+        embeddings = [None] * len(contents)
+        missing = {}
+
+        with self._embedding_cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._embedding_cache:
+                    self._embedding_cache.move_to_end(key)
+                    embeddings[i] = self._embedding_cache[key]
+                else:
+                    missing.setdefault(key, []).append(i)
+
+        if missing:
+            missing_contents = [contents[indices[0]] for indices in missing.values()]
+            if all(isinstance(content, str) for content in missing_contents):
+                encoded = self.embedding_service.embed(missing_contents)
+            else:
+                encoded = np.asarray(
+                    self.model.encode(missing_contents), dtype=np.float32
+                )
+            norms = np.linalg.norm(encoded, axis=1, keepdims=True)
+            encoded = encoded / np.where(norms > 0, norms, 1)
+
+            with self._embedding_cache_lock:
+                for (key, indices), embedding in zip(missing.items(), encoded):
+                    for i in indices:
+                        embeddings[i] = embedding
+                    self._embedding_cache[key] = embedding
+                while len(self._embedding_cache) > CONTROL_FILTER_EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+
+        return np.stack(embeddings)
+
+    def score(
+        self, contents: List[Any], keys: List[Hashable], plans: List[str]
+    ) -> np.ndarray:
+        """
+        Calculates the scores of the contents as their largest cosine similarity with any plan.
+        :param contents: The contents to score, e.g. control texts or icons.
+        :param keys: The cache keys of the contents.
+        :param plans: The plans to be used for calculating the similarity.
+        :return: The array of the scores, one per content.
+        """
+        if len(contents) == 0 or len(plans) == 0:
+            return np.zeros(len(contents), dtype=np.float32)
+
+        plan_embeddings = self.get_embeddings(plans, [("text", plan) for plan in plans])
+        content_embeddings = self.get_embeddings(contents, keys)
+
+        return (content_embeddings @ plan_embeddings.T).max(axis=1)
+
+    @staticmethod
+    def top_k_labels(labels: List[str], scores: np.ndarray, top_k: int) -> List[str]:
+        """
+        Gets the labels with the top-k scores.
+        :param labels: The labels.
+        :param scores: The scores of the labels.
+        :param top_k: The number of labels to return.
+        :return: The top-k labels.
+        """
+        return [
+            label
+            for label, _ in heapq.nlargest(
+                top_k, zip(labels, scores.tolist()), key=lambda x: x[1]
+            )
+        ]
+
     @abstractmethod
     def control_filter(self, control_dicts, plans, **kwargs):
         """
@@ -202,9 +295,7 @@ class SemanticControlFilter(BasicControlFilter):
         :return: The score (0-1) indicating the similarity between the control text and the keywords.
         """
 
-        plan_embedding = self.get_embedding(plans)
-        control_text_embedding = self.get_embedding(control_text)
-        return max(self.cos_sim(control_text_embedding, plan_embedding).tolist()[0])
+        return float(self.score([control_text], [("text", control_text)], plans)[0])
 
     def control_filter(self, control_dicts, plans, top_k):
         """
@@ -214,22 +305,21 @@ class SemanticControlFilter(BasicControlFilter):
         :param top_k: The number of top control items to return.
         :return: The filtered control items.
         """
-        scores_items = []
-        filtered_control_dict = {}
-
-        for label, control_item in control_dicts.items():
-            control_text = control_item.element_info.name.lower()
-            score = self.control_filter_score(control_text, plans)
-            scores_items.append((label, score))
-        topk_scores_items = heapq.nlargest(top_k, (scores_items), key=lambda x: x[1])
-        topk_items = [
-            (score_item[0], score_item[1]) for score_item in topk_scores_items
+        labels = list(control_dicts.keys())
+        control_texts = [
+            control_item.element_info.name.lower()
+            for control_item in control_dicts.values()
         ]
+        scores = self.score(
+            control_texts, [("text", text) for text in control_texts], plans
+        )
+        topk_labels = set(self.top_k_labels(labels, scores, top_k))
 
-        for label, control_item in control_dicts.items():
-            if label in topk_items:
-                filtered_control_dict[label] = control_item
-        return filtered_control_dict
+        return {
+            label: control_item
+            for label, control_item in control_dicts.items()
+            if label in topk_labels
+        }
 
 
 class IconControlFilter(BasicControlFilter):
@@ -245,9 +335,23 @@ class IconControlFilter(BasicControlFilter):
         :return: The maximum similarity score between the control icon and the keywords.
         """
 
-        plans_embedding = self.get_embedding(plans)
-        control_icon_embedding = self.get_embedding(control_icon)
-        return max(self.cos_sim(control_icon_embedding, plans_embedding).tolist()[0])
+        return float(
+            self.score([control_icon], [self.icon_key(control_icon)], plans)[0]
+        )
+
+    @staticmethod
+    def icon_key(control_icon) -> Hashable:
+        """
+        Gets the cache key of an icon from its pixels, so that an unchanged icon is not encoded again.
+        :param control_icon: The control icon image.
+        :return: The cache key.
+        """
+        return (
+            "icon",
+            control_icon.mode,
+            control_icon.size,
+            hashlib.md5(control_icon.tobytes()).hexdigest(),
+        )
 
     def control_filter(self, control_dicts, cropped_icons_dict, plans, top_k):
         """
@@ -258,17 +362,13 @@ class IconControlFilter(BasicControlFilter):
         :param top_k: The number of top items to return.
         :return: The list of top-k control items based on their scores.
         """
-
-        scores_items = []
-        filtered_control_dict = {}
-
-        for label, cropped_icon in cropped_icons_dict.items():
-            score = self.control_filter_score(cropped_icon, plans)
-            scores_items.append((score, label))
-        topk_scores_items = heapq.nlargest(top_k, scores_items, key=lambda x: x[0])
-        topk_labels = [scores_items[1] for scores_items in topk_scores_items]
-
-        for label, control_item in control_dicts.items():
-            if label in topk_labels:
-                filtered_control_dict[label] = control_item
-        return filtered_control_dict
+        labels = list(cropped_icons_dict.keys())
+        icons = list(cropped_icons_dict.values())
+        scores = self.score(icons, [self.icon_key(icon) for icon in icons], plans)
+        topk_labels = set(self.top_k_labels(labels, scores, top_k))
+
+        return {
+            label: control_item
+            for label, control_item in control_dicts.items()
+            if label in topk_labels
+        }
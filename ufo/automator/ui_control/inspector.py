@@ -19,6 +19,7 @@ from pywinauto.uia_element_info import UIAElementInfo
 
 
 from ufo.config.config import Config
+from ufo.utils.tracing import traced
 
 configs = Config.get_instance().config_data
 
@@ -482,6 +483,7 @@ class ControlInspectorFacade:
         """
         self.backend = backend
 
+    @traced("inspector.get_desktop_windows")
     def get_desktop_windows(self, remove_empty: bool = True) -> List[UIAWrapper]:
         """
         Get all the apps on the desktop.
@@ -490,6 +492,7 @@ class ControlInspectorFacade:
         """
         return self.backend_strategy.get_desktop_windows(remove_empty)
 
+    @traced("inspector.find_control_elements_in_descendants")
     def find_control_elements_in_descendants(
         self,
         window: UIAWrapper,
@@ -563,6 +566,7 @@ class ControlInspectorFacade:
         )
         return desktop_windows_info
 
+    @traced("inspector.get_control_info_batch")
     def get_control_info_batch(
         self, window_list: List[UIAWrapper], field_list: List[str] = []
     ) -> List[Dict[str, str]]:
@@ -577,6 +581,7 @@ class ControlInspectorFacade:
             control_info_list.append(self.get_control_info(window, field_list))
         return control_info_list
 
+    @traced("inspector.get_control_info_list_of_dict")
     def get_control_info_list_of_dict(
         self, window_dict: Dict[str, UIAWrapper], field_list: List[str] = []
     ) -> List[Dict[str, str]]:
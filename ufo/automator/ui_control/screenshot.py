@@ -2,19 +2,24 @@
 # Licensed under the MIT License.
 
 import base64
-import functools
 import mimetypes
 import os
 from abc import ABC, abstractmethod
-from io import BytesIO
 from typing import Dict, List, Optional, Tuple
 
-from PIL import Image, ImageDraw, ImageFont, ImageGrab
+import numpy as np
+from PIL import Image, ImageDraw, ImageGrab
 from pywinauto.controls.uiawrapper import UIAWrapper
 from pywinauto.win32structures import RECT
 
 from ufo import utils
 from ufo.config.config import Config
+from ufo.utils.annotation_renderer import AnnotationRenderer
+from ufo.utils.control_merge import ControlMerger, merge_controls, rectangles_to_array
+from ufo.utils.image_codec import EncodedImage, ImageCodecSettings, encode_image
+from ufo.utils.screenshot_frame import FrameStore, ScreenshotFrame
+from ufo.utils.tracing import traced
+from ufo.utils.ui_settle import SettleResult, wait_until_settled
 
 configs = Config.get_instance().config_data
 
@@ -81,7 +86,7 @@ class ControlPhotographer(Photographer):
             screenshot = self.rescale_image(screenshot, scalar)
 
         if save_path is not None and screenshot is not None:
-            screenshot.save(save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+            FrameStore.put(screenshot, save_path)
         return screenshot
 
 
@@ -107,7 +112,7 @@ class DesktopPhotographer(Photographer):
         if scalar is not None:
             screenshot = self.rescale_image(screenshot, scalar)
         if save_path is not None and screenshot is not None:
-            screenshot.save(save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+            FrameStore.put(screenshot, save_path)
         return screenshot
 
 
@@ -131,6 +136,27 @@ class PhotographerDecorator(Photographer):
         """
         return self.photographer.capture(save_path)
 
+    @staticmethod
+    def load_background(
+        background_screenshot_path: Optional[str],
+    ) -> Optional[Image.Image]:
+        """
+        Load a writable copy of the background screenshot, from memory if it was captured recently.
+        :param background_screenshot_path: The path of the background screenshot.
+        :return: The background screenshot, or None if it does not exist.
+        """
+        if background_screenshot_path is None:
+            return None
+
+        frame = FrameStore.get(background_screenshot_path)
+        if frame is not None:
+            return frame.copy_image()
+
+        if os.path.exists(background_screenshot_path):
+            return Image.open(background_screenshot_path)
+
+        return None
+
     @staticmethod
     def coordinate_adjusted(window_rect: RECT, control_rect: RECT) -> Tuple:
         """
@@ -220,11 +246,8 @@ class RectangleDecorator(PhotographerDecorator):
         :return: The screenshot with rectangles.
         """
 
-        if background_screenshot_path is not None and os.path.exists(
-            background_screenshot_path
-        ):
-            screenshot = Image.open(background_screenshot_path)
-        else:
+        screenshot = self.load_background(background_screenshot_path)
+        if screenshot is None:
             screenshot = self.photographer.capture()
 
         window_rect = self.photographer.control.rectangle()
@@ -237,7 +260,7 @@ class RectangleDecorator(PhotographerDecorator):
                     screenshot, coordinate=adjusted_rect, color=self.color
                 )
         if save_path is not None and screenshot is not None:
-            screenshot.save(save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+            FrameStore.put(screenshot, save_path)
         return screenshot
 
     def capture_from_adjusted_coords(
@@ -253,11 +276,8 @@ class RectangleDecorator(PhotographerDecorator):
         :param background_screenshot_path: The path of the background screenshot, optional. If provided, the rectangle will be drawn on the background screenshot instead of the control screenshot.
         :return: The screenshot with rectangles.
         """
-        if background_screenshot_path is not None and os.path.exists(
-            background_screenshot_path
-        ):
-            screenshot = Image.open(background_screenshot_path)
-        else:
+        screenshot = self.load_background(background_screenshot_path)
+        if screenshot is None:
             screenshot = self.photographer.capture()
 
         for control_adjusted_coord in control_adjusted_coords:
@@ -272,7 +292,7 @@ class RectangleDecorator(PhotographerDecorator):
                     screenshot, coordinate=control_rect, color=self.color
                 )
         if save_path is not None and screenshot is not None:
-            screenshot.save(save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+            FrameStore.put(screenshot, save_path)
         return screenshot
 
 
@@ -342,7 +362,6 @@ class AnnotationDecorator(PhotographerDecorator):
         return image
 
     @staticmethod
-    @functools.lru_cache(maxsize=2048, typed=False)
     def _get_button_img(
         label_text: str,
         botton_margin: int = 5,
@@ -352,33 +371,15 @@ class AnnotationDecorator(PhotographerDecorator):
         border_color: str = "#FF0000",
         button_color: str = "#FFF68F",
     ):
-        font = AnnotationDecorator._get_font("arial.ttf", font_size)
-        text_size = font.getbbox(label_text)
-
-        # set button size + margins
-        button_size = (text_size[2] + botton_margin, text_size[3] + botton_margin)
-        # create image with correct size and black background
-        button_img = Image.new("RGBA", button_size, button_color)
-        button_draw = ImageDraw.Draw(button_img)
-        button_draw.text(
-            (botton_margin / 2, botton_margin / 2),
+        return AnnotationRenderer.get_label_image(
             label_text,
-            font=font,
-            fill=font_color,
-        )
-
-        # draw red rectangle around button
-        ImageDraw.Draw(button_img).rectangle(
-            [(0, 0), (button_size[0] - 1, button_size[1] - 1)],
-            outline=border_color,
-            width=border_width,
+            button_color,
+            font_size=font_size,
+            botton_margin=botton_margin,
+            border_width=border_width,
+            font_color=font_color,
+            border_color=border_color,
         )
-        return button_img
-
-    @staticmethod
-    @functools.lru_cache(maxsize=64, typed=False)
-    def _get_font(name: str, size: int):
-        return ImageFont.truetype(name, size)
 
     @staticmethod
     def number_to_letter(n: int):
@@ -415,14 +416,24 @@ class AnnotationDecorator(PhotographerDecorator):
         return annotation_dict
 
     def get_cropped_icons_dict(
-        self, annotation_dict: Dict[str, UIAWrapper]
+        self,
+        annotation_dict: Dict[str, UIAWrapper],
+        background_screenshot_path: Optional[str] = None,
     ) -> Dict[str, Image.Image]:
         """
         Get the dictionary of the cropped icons.
+        :param annotation_dict: The dictionary of the controls with annotation labels as keys.
+        :param background_screenshot_path: The path of the background screenshot, optional. If provided, the icons will be cropped from the background screenshot instead of a new capture.
         :return: The dictionary of the cropped icons.
         """
         cropped_icons_dict = {}
-        image = self.photographer.capture()
+        frame = FrameStore.get(background_screenshot_path)
+        if frame is not None:
+            image = frame.image
+        else:
+            image = self.load_background(background_screenshot_path)
+        if image is None:
+            image = self.photographer.capture()
         window_rect = self.photographer.control.rectangle()
 
         for label_text, control in annotation_dict.items():
@@ -434,36 +445,54 @@ class AnnotationDecorator(PhotographerDecorator):
         return cropped_icons_dict
 
     def capture_with_annotation_dict(
-        self, annotation_dict: Dict[str, UIAWrapper], save_path: Optional[str] = None
+        self,
+        annotation_dict: Dict[str, UIAWrapper],
+        save_path: Optional[str] = None,
+        background_screenshot_path: Optional[str] = None,
     ):
+        """
+        Capture a screenshot with the annotations of the given controls.
+        :param annotation_dict: The dictionary of the controls with annotation labels as keys.
+        :param save_path: The path to save the screenshot.
+        :param background_screenshot_path: The path of the background screenshot, optional. If provided, the annotations will be drawn on the background screenshot instead of a new capture.
+        :return: The screenshot with annotations.
+        """
 
         window_rect = self.photographer.control.rectangle()
-        screenshot_annotated = self.photographer.capture()
+
+        # The renderer draws on a new image, so the cached frame is used without a copy.
+        frame = FrameStore.get(background_screenshot_path)
+        if frame is not None:
+            screenshot = frame.image
+        else:
+            screenshot = self.load_background(background_screenshot_path)
+        if screenshot is None:
+            screenshot = self.photographer.capture()
 
         color_dict = configs.get("ANNOTATION_COLORS", {})
 
-        for label_text, control in annotation_dict.items():
-            control_rect = control.rectangle()
-            adjusted_rect = self.coordinate_adjusted(window_rect, control_rect)
-            adjusted_coordinate = (adjusted_rect[0], adjusted_rect[1])
-            screenshot_annotated = self.draw_rectangles_controls(
-                screenshot_annotated,
-                adjusted_coordinate,
-                label_text,
-                font_size=configs.get("ANNOTATION_FONT_SIZE", 25),
-                button_color=(
-                    color_dict.get(
-                        control.element_info.control_type, self.color_default
-                    )
-                    if self.color_diff
-                    else self.color_default
-                ),
+        labels = list(annotation_dict.keys())
+        rects = [
+            self.coordinate_adjusted(window_rect, control.rectangle())
+            for control in annotation_dict.values()
+        ]
+        colors = [
+            (
+                color_dict.get(control.element_info.control_type, self.color_default)
+                if self.color_diff
+                else self.color_default
             )
+            for control in annotation_dict.values()
+        ]
+
+        renderer = AnnotationRenderer(
+            font_size=configs.get("ANNOTATION_FONT_SIZE", 25),
+            avoid_overlap=configs.get("ANNOTATION_AVOID_OVERLAP", True),
+        )
+        screenshot_annotated = renderer.render(screenshot, rects, labels, colors)
 
         if save_path is not None and screenshot_annotated is not None:
-            screenshot_annotated.save(
-                save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL
-            )
+            FrameStore.put(screenshot_annotated, save_path)
 
         return screenshot_annotated
 
@@ -514,6 +543,7 @@ class PhotographerFacade:
     def __init__(self):
         pass
 
+    @traced("photographer.capture_app_window_screenshot")
     def capture_app_window_screenshot(
         self, control: UIAWrapper, save_path=None, scalar: List[int] = None
     ):
@@ -527,6 +557,7 @@ class PhotographerFacade:
         screenshot = self.screenshot_factory.create_screenshot("app_window", control)
         return screenshot.capture(save_path, scalar)
 
+    @traced("photographer.capture_desktop_screen_screenshot")
     def capture_desktop_screen_screenshot(self, all_screens=True, save_path=None):
         """
         Capture the desktop screenshot.
@@ -538,6 +569,7 @@ class PhotographerFacade:
         )
         return screenshot.capture(save_path)
 
+    @traced("photographer.capture_app_window_screenshot_with_rectangle")
     def capture_app_window_screenshot_with_rectangle(
         self,
         control: UIAWrapper,
@@ -591,6 +623,7 @@ class PhotographerFacade:
             background_screenshot_path=background_screenshot_path,
         )
 
+    @traced("photographer.capture_app_window_screenshot_with_annotation_dict")
     def capture_app_window_screenshot_with_annotation_dict(
         self,
         control: UIAWrapper,
@@ -599,6 +632,7 @@ class PhotographerFacade:
         color_diff: bool = True,
         color_default: str = "#FFF68F",
         save_path: Optional[str] = None,
+        background_screenshot_path: Optional[str] = None,
     ) -> Image.Image:
         """
         Capture the control screenshot with annotations.
@@ -607,6 +641,8 @@ class PhotographerFacade:
         :param annotation_type: The type of the annotation.
         :param color_diff: Whether to use different colors for different control types.
         :param color_default: The default color of the annotation.
+        :param save_path: The path to save the screenshot.
+        :param background_screenshot_path: The path of the background screenshot, optional. If provided, the annotations will be drawn on the background screenshot instead of a new capture.
         :return: The screenshot.
         """
         screenshot = self.screenshot_factory.create_screenshot("app_window", control)
@@ -615,9 +651,10 @@ class PhotographerFacade:
             screenshot, sub_control_list, annotation_type, color_diff, color_default
         )
         return screenshot.capture_with_annotation_dict(
-            annotation_control_dict, save_path
+            annotation_control_dict, save_path, background_screenshot_path
         )
 
+    @traced("photographer.capture_app_window_screenshot_with_annotation")
     def capture_app_window_screenshot_with_annotation(
         self,
         control: UIAWrapper,
@@ -658,10 +695,10 @@ class PhotographerFacade:
         :param save_path: The path to save the screenshot.
         :return: The screenshot.
         """
-        if not os.path.exists(background_screenshot_path):
+        screenshot = PhotographerDecorator.load_background(background_screenshot_path)
+        if screenshot is None:
             return None
 
-        screenshot = Image.open(background_screenshot_path)
         draw = ImageDraw.Draw(screenshot)
         for point in point_list:
             draw.ellipse(
@@ -675,7 +712,7 @@ class PhotographerFacade:
             )
 
         if save_path is not None and screenshot is not None:
-            screenshot.save(save_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+            FrameStore.put(screenshot, save_path)
         return screenshot
 
     def get_annotation_dict(
@@ -697,21 +734,27 @@ class PhotographerFacade:
         return screenshot.get_annotation_dict()
 
     def get_cropped_icons_dict(
-        self, control: UIAWrapper, annotation_dict: Dict[str, UIAWrapper]
+        self,
+        control: UIAWrapper,
+        annotation_dict: Dict[str, UIAWrapper],
+        background_screenshot_path: Optional[str] = None,
     ) -> Dict[str, Image.Image]:
         """
         Get the dictionary of the cropped icons.
         :param control: The control item to capture.
-        :param sub_control_list: The list of the controls to annotate.
-        :param annotation_type: The type of the annotation.
+        :param annotation_dict: The dictionary of the controls with annotation labels as keys.
+        :param background_screenshot_path: The path of the background screenshot, optional. If provided, the icons will be cropped from the background screenshot instead of a new capture.
         :return: The dictionary of the cropped icons.
         """
 
         screenshot = self.screenshot_factory.create_screenshot("app_window", control)
         screenshot = AnnotationDecorator(screenshot, sub_control_list=[])
-        return screenshot.get_cropped_icons_dict(annotation_dict)
+        return screenshot.get_cropped_icons_dict(
+            annotation_dict, background_screenshot_path
+        )
 
     @staticmethod
+    @traced("photographer.concat_screenshots")
     def concat_screenshots(
         image1_path: str, image2_path: str, output_path: str
     ) -> Image.Image:
@@ -722,19 +765,19 @@ class PhotographerFacade:
         :param output_path: The path to save the concatenated image.
         :return: The concatenated image.
         """
-        # Open the images
-        if not os.path.exists(image1_path):
+        # Open the images, from memory if they were captured recently.
+        if not FrameStore.exists(image1_path):
             utils.print_with_color(f"Waring: {image1_path} does not exist.", "yellow")
 
             return Image.new("RGB", (0, 0))
 
-        if not os.path.exists(image2_path):
+        if not FrameStore.exists(image2_path):
             utils.print_with_color(f"Waring: {image2_path} does not exist.", "yellow")
 
             return Image.new("RGB", (0, 0))
 
-        image1 = Image.open(image1_path)
-        image2 = Image.open(image2_path)
+        image1 = PhotographerFacade._read_image(image1_path)
+        image2 = PhotographerFacade._read_image(image2_path)
 
         # Ensure both images have the same height
         min_height = min(image1.height, image2.height)
@@ -747,31 +790,123 @@ class PhotographerFacade:
         result.paste(image2, (image1.width, 0))
 
         # Save the result
-        result.save(output_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+        FrameStore.put(result, output_path)
 
         return result
 
     @staticmethod
     def load_image(image_path: str) -> Image.Image:
         """
-        Load an image from the path.
+        Load an image from the path. Recently captured images are loaded from memory.
+        :param image_path: The path of the image.
+        :return: The image.
+        """
+        frame = FrameStore.get(image_path)
+        if frame is not None:
+            return frame.copy_image()
+        return Image.open(image_path)
+
+    @staticmethod
+    def _read_image(image_path: str) -> Image.Image:
+        """
+        Read an image from the path without copying it. The returned image must not be modified.
         :param image_path: The path of the image.
         :return: The image.
         """
+        frame = FrameStore.get(image_path)
+        if frame is not None:
+            return frame.image
         return Image.open(image_path)
 
     @staticmethod
-    def image_to_base64(image: Image.Image) -> str:
+    def image_exists(image_path: str) -> bool:
+        """
+        Check whether the image exists, either in memory or on the disk.
+        Recently captured images may not be written to the disk yet.
+        :param image_path: The path of the image.
+        :return: True if the image exists, otherwise False.
+        """
+        return FrameStore.exists(image_path)
+
+    @staticmethod
+    def get_frame(image_path: str) -> Optional[ScreenshotFrame]:
+        """
+        Get the in-memory frame of a recently captured image.
+        :param image_path: The path of the image.
+        :return: The frame, or None if the image is not in memory.
+        """
+        return FrameStore.get(image_path)
+
+    @staticmethod
+    def wait_for_image(image_path: str) -> None:
+        """
+        Block until the image is written to the disk, for the consumers that read the file directly.
+        :param image_path: The path of the image.
+        """
+        FrameStore.wait(image_path)
+
+    @staticmethod
+    def flush_images() -> None:
+        """
+        Block until all the captured images are written to the disk.
+        """
+        FrameStore.flush()
+
+    @staticmethod
+    @traced("photographer.wait_until_settled")
+    def wait_until_settled(
+        control: Optional[UIAWrapper] = None, timeout: float = 1.0
+    ) -> SettleResult:
+        """
+        Wait until the screenshots of the control stop changing, instead of sleeping a fixed time. Only the rectangle
+        of the control on the primary screen is grabbed, and shrunk before the comparison. The frames are not saved.
+        The wait sleeps for the timeout if it is disabled by UI_SETTLE_WAIT.
+        :param control: The control to capture, the primary screen if None.
+        :param timeout: The longest wait, in seconds.
+        :return: The result of the wait.
+        """
+
+        def capture() -> Optional[Image.Image]:
+            if control is None:
+                return PhotographerFacade.settle_frame(ImageGrab.grab())
+
+            rect = control.rectangle()
+            if rect.width() <= 0 or rect.height() <= 0:
+                return None
+            return PhotographerFacade.settle_frame(
+                ImageGrab.grab(bbox=(rect.left, rect.top, rect.right, rect.bottom))
+            )
+
+        return wait_until_settled(capture, timeout)
+
+    @staticmethod
+    def settle_frame(image: Image.Image, max_width: int = 256) -> Image.Image:
+        """
+        Shrink a frame compared by the settle wait, which only looks at a few pixels per side.
+        :param image: The frame.
+        :param max_width: The largest width of the shrunk frame.
+        :return: The shrunk frame.
+        """
+        factor = image.width // max_width
+        if factor > 1:
+            return image.reduce(factor)
+        return image
+
+    @staticmethod
+    def image_to_base64(
+        image: Image.Image, codec: Optional[ImageCodecSettings] = None
+    ) -> str:
         """
         Convert image to base64 string.
 
         :param image: The image to convert.
+        :param codec: The codec settings, optional. The configured IMAGE_CODEC is used by default.
         :return: The base64 string.
         """
-        buffered = BytesIO()
-        image.save(buffered, format="PNG", optimize=True)
+        if codec is None:
+            codec = ImageCodecSettings.from_config()
 
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
+        return base64.b64encode(encode_image(image, codec).data).decode("utf-8")
 
     @staticmethod
     def control_iou(control1: UIAWrapper, control2: UIAWrapper) -> float:
@@ -810,56 +945,121 @@ class PhotographerFacade:
         :param iou_overlap_threshold: The threshold of the IOU overlap to consider two controls as overlapping.
         :return: The merged control list.
         """
-        merged_control_list = main_control_list.copy()
-
-        for additional_control in additional_control_list:
-            is_overlapping = False
-            for main_control in main_control_list:
-                if (
-                    PhotographerFacade.control_iou(additional_control, main_control)
-                    > iou_overlap_threshold
-                ):
-                    is_overlapping = True
-                    break
-
-            if not is_overlapping:
-                merged_control_list.append(additional_control)
+        return merge_controls(
+            main_control_list, additional_control_list, iou_overlap_threshold
+        )
 
-        return merged_control_list
+    @staticmethod
+    def control_overlap_matrix(
+        main_control_list: List[UIAWrapper],
+        additional_control_list: List[UIAWrapper],
+    ) -> np.ndarray:
+        """
+        Get the IOU overlap of every additional control with every main control, for debugging the merge.
+        :param main_control_list: The main control list.
+        :param additional_control_list: The additional control list.
+        :return: The IOU matrix, with a row per additional control and a column per main control.
+        """
+        return ControlMerger(rectangles_to_array(main_control_list)).overlap_matrix(
+            rectangles_to_array(additional_control_list)
+        )
 
     @classmethod
-    def encode_image(cls, image: Image.Image, mime_type: Optional[str] = None) -> str:
+    @traced("photographer.encode_image")
+    def encode_image(
+        cls,
+        image: Image.Image,
+        mime_type: Optional[str] = None,
+        codec: Optional[ImageCodecSettings] = None,
+    ) -> str:
         """
         Encode an image to base64 string.
         :param image: The image to encode.
-        :param mime_type: The mime type of the image.
+        :param mime_type: The mime type of the image. Only used by the PNG codec.
+        :param codec: The codec settings, optional. The configured IMAGE_CODEC is used by default.
         :return: The base64 string.
         """
 
         if image is None:
             return cls._empty_image_string
 
-        buffered = BytesIO()
-        image.save(buffered, format="PNG", optimize=True)
-        encoded_image = base64.b64encode(buffered.getvalue()).decode("ascii")
+        if codec is None:
+            codec = ImageCodecSettings.from_config()
 
-        if mime_type is None:
-            mime_type = "image/png"
+        encoded = encode_image(image, codec)
 
-        image_url = f"data:{mime_type};base64," + encoded_image
+        if mime_type is None or encoded.format != "png":
+            mime_type = encoded.mime_type
+
+        image_url = f"data:{mime_type};base64," + base64.b64encode(
+            encoded.data
+        ).decode("ascii")
         return image_url
 
     @classmethod
+    @traced("photographer.encode_image_payload")
+    def encode_image_payload(
+        cls, image_path: str, codec: ImageCodecSettings
+    ) -> Optional[EncodedImage]:
+        """
+        Encode an image file for the LLM with the codec settings.
+        Recently captured images are encoded from memory, and the encoding is reused across calls.
+        :param image_path: The path of the image file.
+        :param codec: The codec settings.
+        :return: The encoded image, or None if the image does not exist.
+        """
+
+        frame = FrameStore.get(image_path)
+        if frame is not None:
+            return frame.encode(codec)
+
+        if not os.path.exists(image_path):
+            return None
+
+        image = Image.open(image_path)
+
+        if codec.is_passthrough and image.format == "PNG":
+            with open(image_path, "rb") as image_file:
+                data = image_file.read()
+            return EncodedImage(
+                data=data,
+                mime_type="image/png",
+                format="png",
+                quality=None,
+                width=image.width,
+                height=image.height,
+                original_width=image.width,
+                original_height=image.height,
+            )
+
+        return encode_image(image, codec)
+
+    @classmethod
+    @traced("photographer.encode_image_from_path")
     def encode_image_from_path(
-        cls, image_path: str, mime_type: Optional[str] = None
+        cls,
+        image_path: str,
+        mime_type: Optional[str] = None,
+        codec: Optional[ImageCodecSettings] = None,
     ) -> str:
         """
         Encode an image file to base64 string.
         :param image_path: The path of the image file.
         :param mime_type: The mime type of the image.
+        :param codec: The codec settings, optional. If not provided, the file is sent as it is.
         :return: The base64 string.
         """
 
+        if codec is not None:
+            encoded = cls.encode_image_payload(image_path, codec)
+            if encoded is not None:
+                return encoded.to_data_url()
+
+        # Reuse the encoding of a recently captured image.
+        frame = FrameStore.get(image_path)
+        if frame is not None and mime_type in (None, "image/png"):
+            return frame.to_data_url()
+
         # If image path not exist, return an empty image string
         if not os.path.exists(image_path):
 
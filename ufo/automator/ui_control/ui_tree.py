@@ -1,7 +1,6 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-import copy
 import json
 import os
 import traceback
@@ -10,6 +9,13 @@ from typing import Any, Dict, List
 from pywinauto.controls.uiawrapper import UIAWrapper
 
 from ufo.automator.ui_control.screenshot import PhotographerDecorator
+from ufo.config.config import Config
+from ufo.utils.artifact_sink import ArtifactSink
+from ufo.utils.ui_tree_diff import apply_ui_tree_diff, diff_ui_trees
+from ufo.utils.ui_tree_snapshot import UITreeSnapshotter
+from ufo.utils.ui_tree_store import UITreeStore
+
+configs = Config.get_instance().config_data
 
 
 class UITree:
@@ -17,18 +23,31 @@ class UITree:
     A class to represent the UI tree.
     """
 
-    def __init__(self, root: UIAWrapper):
+    def __init__(self, root: UIAWrapper, incremental: bool = False):
         """
         Initialize the UI tree with the root element.
         :param root: The root element of the UI tree.
+        :param incremental: Whether to reuse the unchanged subtrees of the previous snapshot of the same window. The diff
+        with the previous snapshot is then available in the diff attribute.
         """
         self.root = root
 
         # The node counter to count the number of nodes in the UI tree.
         self.node_counter = 0
 
+        # The diff with the previous snapshot, only available for the incremental snapshots.
+        self.diff = None
+
+        # The columnar store of the UI tree, built on demand.
+        self._store = None
+
         try:
-            self._ui_tree = self._get_ui_tree(self.root)
+            if incremental:
+                snapshot = UITreeSnapshotter.get_instance(self.root).snapshot(self.root)
+                self._ui_tree = snapshot.tree
+                self.diff = snapshot.diff
+            else:
+                self._ui_tree = self._get_ui_tree(self.root)
         except Exception as e:
             self._ui_tree = {"error": traceback.format_exc()}
 
@@ -100,9 +119,30 @@ class UITree:
         """
         return self._ui_tree
 
+    @property
+    def store(self) -> UITreeStore:
+        """
+        The columnar store of the UI tree.
+        """
+        if self._store is None:
+            self._store = UITreeStore.from_tree(self.ui_tree)
+        return self._store
+
+    @staticmethod
+    def _file_format() -> str:
+        """
+        Get the format of the UI tree files from the configuration.
+        :return: The format, "json" for indented JSON, "compact" for compact JSON or "npz".
+        """
+        if configs is None:
+            return "json"
+        return str(configs.get("UI_TREE_FORMAT", "json")).lower()
+
     def save_ui_tree_to_json(self, file_path: str) -> None:
         """
-        Save the UI tree to a JSON file.
+        Save the UI tree to a file, in the format of the UI_TREE_FORMAT configuration. The tree is serialized and
+        streamed to the file in the background by the artifact sink. The extension of the file path is replaced with
+        .npz for the NPZ format.
         :param file_path: The file path to save the UI tree.
         """
 
@@ -111,115 +151,56 @@ class UITree:
         if not os.path.exists(save_dir):
             os.makedirs(save_dir)
 
-        with open(file_path, "w") as file:
-            json.dump(self.ui_tree, file, indent=4)
+        file_format = self._file_format()
+        file_path = os.path.splitext(file_path)[0] + UITreeStore.file_extension(
+            file_format
+        )
+
+        ui_tree = self.ui_tree
+        store = self._store
 
-    def flatten_ui_tree(self) -> List[Dict[str, Any]]:
+        def write_ui_tree(file) -> None:
+            (store or UITreeStore.from_tree(ui_tree)).write(file, file_format)
+
+        ArtifactSink.get_instance().submit_stream(file_path, write_ui_tree)
+
+    def save_ui_tree_diff_to_json(self, file_path: str) -> None:
         """
-        Flatten the UI tree into a list in width-first order.
+        Save the diff with the previous snapshot to a JSON file, in the background. Nothing is saved if the diff is not
+        available.
+        :param file_path: The file path to save the diff.
         """
+        if self.diff is None:
+            return
 
-        def flatten_tree(tree: Dict[str, Any], result: List[Dict[str, Any]]):
-            """
-            Flatten the tree.
-            :param tree: The tree to flatten.
-            :param result: The result list.
-            """
-
-            tree_info = {
-                "name": tree["name"],
-                "control_type": tree["control_type"],
-                "rectangle": tree["rectangle"],
-                "adjusted_rectangle": tree["adjusted_rectangle"],
-                "relative_rectangle": tree["relative_rectangle"],
-                "level": tree["level"],
-            }
-
-            result.append(tree_info)
-            for child in tree.get("children", []):
-                flatten_tree(child, result)
-
-        result = []
-        flatten_tree(self.ui_tree, result)
-        return result
+        save_dir = os.path.dirname(file_path)
+        if not os.path.exists(save_dir):
+            os.makedirs(save_dir)
+
+        diff = self.diff
+        if self._file_format() == "json":
+            content = lambda: json.dumps(diff, indent=4)
+        else:
+            content = lambda: json.dumps(diff, separators=(",", ":"))
+
+        ArtifactSink.get_instance().submit(file_path, content)
+
+    def flatten_ui_tree(self) -> List[Dict[str, Any]]:
+        """
+        Flatten the UI tree into a list in depth-first order.
+        """
+        return self.store.flatten()
 
     @staticmethod
     def ui_tree_diff(ui_tree_1: Dict[str, Any], ui_tree_2: Dict[str, Any]):
         """
-        Compute the difference between two UI trees.
+        Compute the difference between two UI trees. The children are matched by key and the reordered children are
+        recorded as moved, see ufo.utils.ui_tree_diff.
         :param ui_tree_1: The first UI tree.
         :param ui_tree_2: The second UI tree.
         :return: The difference between the two UI trees.
         """
-
-        diff = {"added": [], "removed": [], "modified": []}
-
-        def compare_nodes(node1, node2, path):
-            # Note: `path` is a list of IDs. The last element corresponds to the current node.
-            # If node1 doesn't exist and node2 does, it's an addition.
-            if node1 is None and node2 is not None:
-                diff["added"].append({"path": path, "node": copy.deepcopy(node2)})
-                return
-
-            # If node1 exists and node2 doesn't, it's a removal.
-            if node1 is not None and node2 is None:
-                diff["removed"].append({"path": path, "node": copy.deepcopy(node1)})
-                return
-
-            # If both don't exist, nothing to do.
-            if node1 is None and node2 is None:
-                return
-
-            # Both nodes exist, check for modifications at this node
-            fields_to_compare = [
-                "name",
-                "control_type",
-                "rectangle",
-                "adjusted_rectangle",
-                "relative_rectangle",
-                "level",
-            ]
-
-            changes = {}
-            for field in fields_to_compare:
-                if node1[field] != node2[field]:
-                    changes[field] = (node1[field], node2[field])
-
-            if changes:
-                diff["modified"].append({"path": path, "changes": changes})
-
-            # Compare children
-            children1 = node1.get("children", [])
-            children2 = node2.get("children", [])
-
-            # We'll assume children order is stable. If not, differences will appear as adds/removes.
-            max_len = max(len(children1), len(children2))
-            for i in range(max_len):
-                c1 = children1[i] if i < len(children1) else None
-                c2 = children2[i] if i < len(children2) else None
-                # Use the child's id if available from c2 (prefer new tree), else from c1
-                if c2 is not None:
-                    child_id = c2["id"]
-                elif c1 is not None:
-                    child_id = c1["id"]
-                else:
-                    # Both None shouldn't happen since max_len ensures one must exist
-                    child_id = "unknown_child_id"
-
-                compare_nodes(c1, c2, path + [child_id])
-
-        # Initialize the path with the root node id if it exists
-        if ui_tree_2 and "id" in ui_tree_2:
-            root_id = ui_tree_2["id"]
-        elif ui_tree_1 and "id" in ui_tree_1:
-            root_id = ui_tree_1["id"]
-        else:
-            # If no root id is present, assume a placeholder
-            root_id = "root"
-
-        compare_nodes(ui_tree_1, ui_tree_2, [root_id])
-
-        return diff
+        return diff_ui_trees(ui_tree_1, ui_tree_2)
 
     @staticmethod
     def apply_ui_tree_diff(
@@ -231,93 +212,4 @@ class UITree:
         :param diff: The diff to apply.
         :return: The new UI tree after applying the diff.
         """
-
-        ui_tree_2 = copy.deepcopy(ui_tree_1)
-
-        # Build an ID map for quick node lookups
-        def build_id_map(node, id_map):
-            id_map[node["id"]] = node
-            for child in node.get("children", []):
-                build_id_map(child, id_map)
-
-        id_map = {}
-        if "id" in ui_tree_2:
-            build_id_map(ui_tree_2, id_map)
-
-        def remove_node_by_path(path):
-            # The path is a list of IDs from root to target node.
-            # The target node is the last element. Its parent is the second to last element.
-            if len(path) == 1:
-                # Removing the root
-                for k in list(ui_tree_2.keys()):
-                    del ui_tree_2[k]
-                id_map.clear()
-                return
-
-            target_id = path[-1]
-            parent_id = path[-2]
-            parent_node = id_map[parent_id]
-            # Find and remove the child with target_id
-            for i, c in enumerate(parent_node.get("children", [])):
-                if c["id"] == target_id:
-                    parent_node["children"].pop(i)
-                    break
-
-            # Remove target_id from id_map
-            if target_id in id_map:
-                del id_map[target_id]
-
-        def add_node_by_path(path, node):
-            # Add the node at the specified path. The parent is path[-2], the node is path[-1].
-            # The path[-1] should be node["id"].
-            if len(path) == 1:
-                # Replacing the root node entirely
-                for k in list(ui_tree_2.keys()):
-                    del ui_tree_2[k]
-                for k, v in node.items():
-                    ui_tree_2[k] = v
-                # Rebuild id_map
-                id_map.clear()
-                if "id" in ui_tree_2:
-                    build_id_map(ui_tree_2, id_map)
-                return
-
-            target_id = path[-1]
-            parent_id = path[-2]
-            parent_node = id_map[parent_id]
-            # Ensure children list exists
-            if "children" not in parent_node:
-                parent_node["children"] = []
-            # Insert or append the node
-            # We don't have a numeric index anymore, we just append, assuming order doesn't matter.
-            # If order matters, we must store ordering info or do some heuristic.
-            parent_node["children"].append(node)
-
-            # Update the id_map with the newly added subtree
-            build_id_map(node, id_map)
-
-        def modify_node_by_path(path, changes):
-            # Modify fields of the node at the given ID
-            target_id = path[-1]
-            node = id_map[target_id]
-            for field, (old_val, new_val) in changes.items():
-                node[field] = new_val
-
-        # Apply removals first
-        # Sort removals by length of path descending so we remove deeper nodes first.
-        # This ensures we don't remove parents before children.
-        for removal in sorted(
-            diff["removed"], key=lambda x: len(x["path"]), reverse=True
-        ):
-            remove_node_by_path(removal["path"])
-
-        # Apply additions
-        # Additions can be applied directly.
-        for addition in diff["added"]:
-            add_node_by_path(addition["path"], addition["node"])
-
-        # Apply modifications
-        for modification in diff["modified"]:
-            modify_node_by_path(modification["path"], modification["changes"])
-
-        return ui_tree_2
+        return apply_ui_tree_diff(ui_tree_1, diff)
@@ -12,6 +12,7 @@ from langchain_community.vectorstores import FAISS
 from ufo.experience.experience_parser import ExperienceLogLoader
 from ufo.llm.llm_call import get_completion
 from ufo.prompter.experience_prompter import ExperiencePrompter
+from ufo.rag.index_registry import save_index
 from ufo.utils import get_hugginface_embedding, json_parser
 
 
@@ -186,7 +187,7 @@ class ExperienceSummarizer:
             )
             db.merge_from(prev_db)
 
-        db.save_local(db_path)
+        save_index(db, db_path)
 
         print(f"Updated vector DB successfully: {db_path}")
 
@@ -2,11 +2,16 @@
 # Licensed under the MIT License.
 
 import abc
+import asyncio
 from importlib import import_module
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple
 
 
 class BaseService(abc.ABC):
+
+    # Whether chat_completion accepts a stream_callback receiving the chunks of the response.
+    supports_streaming = False
+
     @abc.abstractmethod
     def __init__(self, *args, **kwargs):
         pass
@@ -15,6 +20,19 @@ class BaseService(abc.ABC):
     def chat_completion(self, *args, **kwargs):
         pass
 
+    async def chat_completion_async(
+        self, messages: List[Dict[str, Any]], n: int, **kwargs: Any
+    ) -> Tuple[List[str], Optional[float]]:
+        """
+        Generate completions without blocking the event loop. The services without an asynchronous client run the
+        blocking chat_completion in a thread.
+        :param messages: The list of messages.
+        :param n: The number of completions to generate.
+        :param kwargs: Additional keyword arguments of chat_completion.
+        :return: A tuple containing a list of generated completions and the estimated cost.
+        """
+        return await asyncio.to_thread(self.chat_completion, messages, n, **kwargs)
+
     @staticmethod
     def get_service(name: str, model_name: str = None) -> "BaseService":
         """
@@ -66,14 +84,20 @@ class BaseService(abc.ABC):
         prices: Dict[str, float],
         prompt_tokens: int,
         completion_tokens: int,
+        cached_tokens: int = 0,
+        cache_write_tokens: int = 0,
     ) -> float:
         """
         Calculates the cost estimate for using a specific model based on the number of prompt tokens and completion tokens.
+        The prompt tokens read from or written to the provider cache are charged at the "cached_input" and "cache_write"
+        prices of the model if given, otherwise at the usual discount of the provider.
         :param api_type: The type of api used.
         :param model: The name of the model.
         :param prices: A dictionary containing the prices for different models.
-        :param prompt_tokens: The number of prompt tokens used.
+        :param prompt_tokens: The number of prompt tokens used, including the cached tokens.
         :param completion_tokens: The number of completion tokens used.
+        :param cached_tokens: The number of prompt tokens read from the cache.
+        :param cache_write_tokens: The number of prompt tokens written to the cache.
         :return: The estimated cost for using the model.
         """
 
@@ -93,9 +117,21 @@ class BaseService(abc.ABC):
             name = model
 
         if name in prices:
+            price = prices[name]
+            # Anthropic charges the cache reads 10% and the writes 125% of the input, OpenAI the reads 50%.
+            read_factor, write_factor = (
+                (0.1, 1.25) if api_type.lower() == "claude" else (0.5, 1.0)
+            )
+            uncached_tokens = prompt_tokens - cached_tokens - cache_write_tokens
             cost = (
-                prompt_tokens * prices[name]["input"] / 1000
-                + completion_tokens * prices[name]["output"] / 1000
+                uncached_tokens * price["input"] / 1000
+                + cached_tokens
+                * price.get("cached_input", price["input"] * read_factor)
+                / 1000
+                + cache_write_tokens
+                * price.get("cache_write", price["input"] * write_factor)
+                / 1000
+                + completion_tokens * price["output"] / 1000
             )
         else:
             return 0
@@ -6,6 +6,7 @@ import anthropic
 from PIL import Image
 
 from ufo.llm.base import BaseService
+from ufo.llm.prompt_cache import add_cache_breakpoints, record_prompt_cache
 from ufo.utils import print_with_color
 
 
@@ -68,15 +69,30 @@ class ClaudeService(BaseService):
                         messages=user_prompt,
                     )
                     responses.append(response.content[0].text)
-                    prompt_tokens = response.usage.input_tokens
+                    # The input tokens exclude the tokens read from and written to the cache.
+                    cached_tokens = (
+                        getattr(response.usage, "cache_read_input_tokens", 0) or 0
+                    )
+                    cache_write_tokens = (
+                        getattr(response.usage, "cache_creation_input_tokens", 0) or 0
+                    )
+                    prompt_tokens = (
+                        response.usage.input_tokens + cached_tokens + cache_write_tokens
+                    )
                     completion_tokens = response.usage.output_tokens
+                    record_prompt_cache(
+                        prompt_tokens, cached_tokens, cache_write_tokens
+                    )
                     cost += self.get_cost_estimator(
                         self.api_type,
                         self.model,
                         self.prices,
                         prompt_tokens,
                         completion_tokens,
+                        cached_tokens=cached_tokens,
+                        cache_write_tokens=cache_write_tokens,
                     )
+                    break
                 except Exception as e:
                     import traceback
 
@@ -95,11 +111,12 @@ class ClaudeService(BaseService):
 
     def process_messages(
         self, messages: List[Dict[str, str]]
-    ) -> Tuple[str, list[Dict]]:
+    ) -> Tuple[Any, list[Dict]]:
         """
-        Processes the messages to generate the system and user prompts.
+        Processes the messages to generate the system and user prompts. The stable prefix of the prompt is marked with
+        cache_control breakpoints, see ufo.llm.prompt_cache.
         :param messages: A list of message dictionaries.
-        :return: A tuple containing the system prompt (str) and the user prompt (list).
+        :return: A tuple containing the system prompt (str, or blocks if cached) and the user prompt (list).
         """
 
         system_prompt = ""
@@ -131,4 +148,8 @@ class ClaudeService(BaseService):
                             )
                         else:
                             raise ValueError("Invalid image URL")
+
+        system_prompt, user_prompt["content"] = add_cache_breakpoints(
+            system_prompt, user_prompt["content"]
+        )
         return system_prompt, [user_prompt]
@@ -13,6 +13,8 @@ class CogAgentService(BaseService):
         self.config = config
         self.max_retry = self.config["MAX_RETRY"]
         self.timeout = self.config["TIMEOUT"]
+        # The session keeps the connections to the worker alive between the requests.
+        self.session = requests.Session()
         self.max_tokens = 2048  # default max tokens for cogagent for now
 
     def chat_completion(
@@ -63,7 +65,7 @@ class CogAgentService(BaseService):
 
             for _ in range(self.max_retry):
                 try:
-                    response = requests.post(
+                    response = self.session.post(
                         self.config_llm["API_BASE"] + "/chat/completions", json=payload
                     )
                     if response.status_code == 200:
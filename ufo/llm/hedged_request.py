@@ -0,0 +1,137 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Hedged LLM requests: the first candidate response passing a validation wins.
+
+The first request is sent alone. If it fails, or if none of its candidates passes the validation, e.g. the JSON parsing
+of the agent, another request is sent at once. If it is still running after the hedge delay, another request is sent
+concurrently, so that a slow request does not hold the step. At most max_requests requests are sent, and the first
+valid candidate of any of them is returned. The requests still queued are cancelled, the requests already sent run to
+completion in the background and their responses are dropped.
+
+With an infinite hedge delay, this is the sequential retry of the agents.
+"""
+
+import contextvars
+import math
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Set, Tuple
+
+from ufo.utils import print_with_color
+
+# The requests of all the agents share the threads of the executor.
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """
+    Get the executor of the hedged requests.
+    :return: The executor.
+    """
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=8, thread_name_prefix="llm-hedged-request"
+                )
+    return _executor
+
+
+@dataclass
+class HedgedResult:
+    """
+    The result of a hedged request.
+    """
+
+    # The first valid candidate, or the last candidate received if none is valid.
+    response: Optional[str]
+    # The cost of the requests completed before the result.
+    cost: float
+    # The number of requests sent.
+    requests: int
+    # Whether the response passed the validation.
+    accepted: bool
+
+
+def hedged_request(
+    request: Callable[[], Tuple[List[str], Optional[float]]],
+    validate: Callable[[str], Any],
+    max_requests: int = 3,
+    hedge_delay: float = math.inf,
+) -> HedgedResult:
+    """
+    Send hedged requests until a candidate passes the validation.
+    :param request: The callable sending one request and returning the candidates and the cost.
+    :param validate: The callable raising an exception if a candidate is not valid.
+    :param max_requests: The largest number of requests.
+    :param hedge_delay: The time in seconds after which a running request is hedged by another one, infinite for the
+    sequential retry.
+    :return: The result.
+    :raises: The error of the last request if no request returned any candidate.
+    """
+    executor = _get_executor()
+    pending: Set[Future] = set()
+    launched = 0
+    cost = 0.0
+    last_response = None
+    last_error = None
+
+    def launch() -> None:
+        nonlocal launched
+        # Run in a copy of the context, e.g. to track the prompt cache usage of the step.
+        pending.add(executor.submit(contextvars.copy_context().run, request))
+        launched += 1
+
+    launch()
+
+    while pending:
+        can_hedge = launched < max_requests and math.isfinite(hedge_delay)
+        done, _ = wait(
+            pending,
+            timeout=hedge_delay if can_hedge else None,
+            return_when=FIRST_COMPLETED,
+        )
+
+        if not done:
+            # The requests are slow, hedge them with another one.
+            launch()
+            continue
+
+        for future in done:
+            pending.discard(future)
+
+            try:
+                responses, request_cost = future.result()
+            except Exception as e:
+                print_with_color(f"Error in the LLM request: {e}", "red")
+                last_error = e
+                responses, request_cost = [], 0.0
+
+            cost += request_cost or 0.0
+
+            for response in responses:
+                last_response = response
+                try:
+                    validate(response)
+                except Exception as e:
+                    print_with_color(f"Error in parsing response: {e}", "yellow")
+                    continue
+
+                for other in pending:
+                    other.cancel()
+                return HedgedResult(response, cost, launched, True)
+
+            # No valid candidate, retry at once.
+            if launched < max_requests:
+                launch()
+
+    if last_response is None and last_error is not None:
+        raise last_error
+
+    return HedgedResult(last_response, cost, launched, False)
+
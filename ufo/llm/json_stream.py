@@ -0,0 +1,162 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+An incremental parser of the JSON object streamed by an LLM.
+
+The chunks of the response are fed as they arrive, and every top-level field of the object is returned as soon as its
+value is complete, e.g. the ControlLabel of the app agent, long before the trailing Thought and Comment are emitted.
+Every character is scanned once. The text around the object, e.g. a ```json fence, is ignored.
+"""
+
+import json
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# The phases of the parser inside the top-level object.
+_KEY, _COLON, _VALUE, _AFTER_VALUE = range(4)
+
+
+class IncrementalJSONParser:
+    """
+    Parse the top-level fields of a JSON object from its chunks.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the parser.
+        """
+        self._buffer = ""
+        self._position = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._phase = _KEY
+        self._start = 0
+        self._key: Optional[str] = None
+        self._finished = False
+
+        # The complete top-level fields, in order.
+        self.fields: Dict[str, Any] = {}
+
+    @property
+    def finished(self) -> bool:
+        """
+        Whether the top-level object is complete.
+        """
+        return self._finished
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """
+        Feed a chunk of the response.
+        :param chunk: The chunk.
+        :return: The top-level fields completed by the chunk, as (key, value) pairs.
+        """
+        if self._finished or not chunk:
+            return []
+
+        self._buffer += chunk
+        buffer = self._buffer
+        completed = []
+
+        position = self._position
+        while position < len(buffer):
+            char = buffer[position]
+
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._end_string(position, completed)
+                position += 1
+                continue
+
+            if self._depth == 0:
+                # Skip the text before the object.
+                if char == "{":
+                    self._depth = 1
+                    self._phase = _KEY
+                position += 1
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._phase == _KEY:
+                    self._start = position
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._phase == _VALUE:
+                    # A nested object or array is complete.
+                    self._emit(position + 1, completed)
+                elif self._depth == 0:
+                    if self._phase == _VALUE:
+                        self._emit(position, completed)
+                    self._finished = True
+                    position += 1
+                    break
+            elif self._depth == 1:
+                if char == ":" and self._phase == _COLON:
+                    self._phase = _VALUE
+                    self._start = position + 1
+                elif char == ",":
+                    if self._phase == _VALUE:
+                        # A number, boolean or null is complete.
+                        self._emit(position, completed)
+                    self._phase = _KEY
+
+            position += 1
+
+        self._position = position
+        return completed
+
+    def _end_string(self, position: int, completed: List[Tuple[str, Any]]) -> None:
+        """
+        Handle the end of a string of the top-level object.
+        :param position: The position of the closing quote.
+        :param completed: The completed fields.
+        """
+        if self._phase == _KEY:
+            self._key = json.loads(self._buffer[self._start : position + 1])
+            self._phase = _COLON
+        elif self._phase == _VALUE:
+            self._emit(position + 1, completed)
+
+    def _emit(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        """
+        Parse the value of the current field.
+        :param end: The end of the value in the buffer.
+        :param completed: The completed fields.
+        """
+        text = self._buffer[self._start : end].strip()
+        self._phase = _AFTER_VALUE
+        if not text:
+            return
+        try:
+            value = json.loads(text)
+        except ValueError:
+            return
+        self.fields[self._key] = value
+        completed.append((self._key, value))
+
+
+def field_callback(
+    on_field: Callable[[str, Any], None],
+) -> Callable[[str], None]:
+    """
+    Create the callback of the streamed chunks calling a function for every completed top-level field.
+    :param on_field: The function called with the key and value of every completed field.
+    :return: The callback of the chunks.
+    """
+    parser = IncrementalJSONParser()
+
+    def on_chunk(chunk: str) -> None:
+        for key, value in parser.feed(chunk):
+            on_field(key, value)
+
+    return on_chunk
+
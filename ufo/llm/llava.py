@@ -20,6 +20,8 @@ class LlavaService(BaseService):
         self.config = config
         self.max_retry = self.config["MAX_RETRY"]
         self.timeout = self.config["TIMEOUT"]
+        # The session keeps the connections to the worker alive between the requests.
+        self.session = requests.Session()
         self.max_tokens = 2048  # default max tokens for llava for now
 
     def chat_completion(
@@ -75,7 +77,7 @@ class LlavaService(BaseService):
 
             for _ in range(self.max_retry):
                 try:
-                    response = requests.post(
+                    response = self.session.post(
                         self.config_llm["API_BASE"] + "/chat/completions",
                         json=payload,
                         timeout=self.timeout,
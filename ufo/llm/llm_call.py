@@ -1,16 +1,91 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
-from typing import Any, Dict, List, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from ufo.utils import print_with_color
+from ufo.utils.tracing import span, traced
 
 from ..config.config import Config
-from .base import BaseService
+from .rate_limit import DeploymentLimiter, RateLimitScheduler
+from .response_cache import LLMResponseCache
+from .service_registry import ServiceRegistry
+from .token_accounting import estimate_request_tokens
 
 configs = Config.get_instance().config_data
 
 
+def get_agent_type(agent: str, configs: Dict[str, Any] = configs) -> str:
+    """
+    Get the type of the agent in the configuration.
+    :param agent: Type of agent. Possible values are 'hostagent', 'appagent' or 'backup'.
+    :param configs: The configuration.
+    :return: The type of the agent in the configuration, e.g. "APP_AGENT".
+    """
+
+    if agent.lower() in ["host", "hostagent"]:
+        return "HOST_AGENT"
+    elif agent.lower() in ["app", "appagent"]:
+        return "APP_AGENT"
+    elif agent.lower() in ["eva", "evaluation", "evaluationagent"]:
+        # If evaluation agent is not in configs, use APP_AGENT as default.
+        if "EVALUATION_AGENT" not in configs:
+            return "APP_AGENT"
+        else:
+            return "EVALUATION_AGENT"
+    elif agent.lower() in ["openaioperator", "openai_operator", "operator"]:
+        return "OPERATOR"
+    elif agent.lower() == "prefill":
+        return "PREFILL_AGENT"
+    elif agent.lower() == "filter":
+        return "FILTER_AGENT"
+    elif agent.lower() == "backup":
+        return "BACKUP_AGENT"
+    else:
+        raise ValueError(f"Agent {agent} not supported")
+
+
+def get_deployment_limiter(
+    configs: Dict[str, Any], agent_type: str
+) -> DeploymentLimiter:
+    """
+    Get the rate limiter of the deployment of an agent. The agents sharing an endpoint and a model share its budgets
+    RPM_LIMIT and TPM_LIMIT, unlimited if not set.
+    :param configs: The configuration.
+    :param agent_type: The type of the agent, e.g. "APP_AGENT".
+    :return: The limiter of the deployment.
+    """
+    agent_configs = configs[agent_type]
+    deployment = (
+        str(agent_configs.get("API_TYPE", "")).lower(),
+        agent_configs.get("API_BASE", ""),
+        agent_configs.get("API_MODEL", ""),
+    )
+    return RateLimitScheduler.get_instance().limiter(
+        deployment,
+        agent_configs.get("RPM_LIMIT"),
+        agent_configs.get("TPM_LIMIT"),
+    )
+
+
+def any_valid(responses: List[Any], validate: Optional[Callable[[str], Any]]) -> bool:
+    """
+    Check whether a response passes the validation of the caller, e.g. the JSON parsing of the agents.
+    :param responses: The responses.
+    :param validate: The callable raising an exception if a response is not valid, None to accept all the responses.
+    :return: True if a response is valid, or if there is no validation.
+    """
+    if validate is None:
+        return True
+    for response in responses:
+        try:
+            validate(response)
+        except Exception:
+            continue
+        return True
+    return False
+
+
 def get_completion(
     messages, agent: str = "APP", use_backup_engine: bool = True, configs=configs
 ) -> Tuple[str, float]:
@@ -28,12 +103,15 @@ def get_completion(
     return responses[0], cost
 
 
+@traced("llm.get_completions")
 def get_completions(
     messages,
     agent: str = "APP",
     use_backup_engine: bool = True,
     n: int = 1,
     configs=configs,
+    stream_callback: Optional[Callable[[str], None]] = None,
+    validate: Optional[Callable[[str], Any]] = None,
 ) -> Tuple[list, float]:
     """
     Get completions for the given messages.
@@ -41,49 +119,149 @@ def get_completions(
     :param agent: Type of agent. Possible values are 'hostagent', 'appagent' or 'backup'.
     :param use_backup_engine: Flag indicating whether to use the backup engine or not.
     :param n: Number of completions to generate.
+    :param stream_callback: The callback of the chunks of the response, for the services supporting the streaming.
+    The cached responses and the responses of the backup engine are not streamed.
+    :param validate: The callable raising an exception if a response is not valid. The responses are only cached if
+    one of them is valid, so that a retry of the same request calls the API again.
     :return: A tuple containing the completion responses and the cost.
     """
 
-    if agent.lower() in ["host", "hostagent"]:
-        agent_type = "HOST_AGENT"
-    elif agent.lower() in ["app", "appagent"]:
-        agent_type = "APP_AGENT"
-    elif agent.lower() in ["eva", "evaluation", "evaluationagent"]:
-        # If evaluation agent is not in configs, use APP_AGENT as default.
-        if "EVALUATION_AGENT" not in configs:
-            agent_type = "APP_AGENT"
-        else:
-            agent_type = "EVALUATION_AGENT"
-    elif agent.lower() in ["openaioperator", "openai_operator", "operator"]:
-        agent_type = "OPERATOR"
-    elif agent.lower() == "prefill":
-        agent_type = "PREFILL_AGENT"
-    elif agent.lower() == "filter":
-        agent_type = "FILTER_AGENT"
-    elif agent.lower() == "backup":
-        agent_type = "BACKUP_AGENT"
-    else:
-        raise ValueError(f"Agent {agent} not supported")
+    agent_type = get_agent_type(agent, configs)
+
+    # A cached response is returned without calling the API. In the replay mode, a miss raises an LLMCacheMiss error
+    # instead of falling back to the backup engine.
+    cache = LLMResponseCache.get_instance()
+    cache_key = None
+    if cache.enabled:
+        cache_key = LLMResponseCache.make_key(
+            agent_type, configs[agent_type], messages, n, configs
+        )
+        cached = cache.get(cache_key)
+        # An invalid response cached before is requested again, and replaced, in the read-through mode.
+        if cached is not None and (
+            cache.mode == "replay" or any_valid(cached[0], validate)
+        ):
+            return cached[0], 0.0
 
-    api_type = configs[agent_type]["API_TYPE"]
     try:
-        api_type_lower = api_type.lower()
-        service = BaseService.get_service(
-            api_type_lower, configs[agent_type]["API_MODEL"].lower()
+        service = ServiceRegistry.get_instance().get(configs, agent_type)
+        if stream_callback is not None and service.supports_streaming:
+            kwargs = {"stream_callback": stream_callback}
+        else:
+            kwargs = {}
+
+        def attempt() -> Tuple[list, float]:
+            with span(
+                "llm.attempt",
+                agent_type=agent_type,
+                model=configs[agent_type]["API_MODEL"],
+            ):
+                return service.chat_completion(messages, n, **kwargs)
+
+        # Wait for the budgets of the deployment, and retry the rate-limited requests.
+        response, cost = RateLimitScheduler.get_instance().call(
+            get_deployment_limiter(configs, agent_type),
+            estimate_request_tokens(
+                messages, configs[agent_type], configs.get("MAX_TOKENS", 0)
+            ),
+            attempt,
         )
-        if service:
-            response, cost = service(configs, agent_type=agent_type).chat_completion(
-                messages, n
+        if cache_key is not None and any_valid(response, validate):
+            cache.put(
+                cache_key,
+                response,
+                cost,
+                agent_type=agent_type,
+                model=configs[agent_type]["API_MODEL"],
             )
-            return response, cost
-        else:
-            raise ValueError(f"API_TYPE {api_type} not supported")
+        return response, cost
     except Exception as e:
         if use_backup_engine:
             print_with_color(f"The API request of {agent_type} failed: {e}.", "red")
             print_with_color(f"Switching to use the backup engine...", "yellow")
             return get_completions(
-                messages, agent="backup", use_backup_engine=False, n=n
+                messages,
+                agent="backup",
+                use_backup_engine=False,
+                n=n,
+                configs=configs,
+                validate=validate,
+            )
+        else:
+            raise e
+
+
+async def get_completions_async(
+    messages,
+    agent: str = "APP",
+    use_backup_engine: bool = True,
+    n: int = 1,
+    configs=configs,
+    validate: Optional[Callable[[str], Any]] = None,
+) -> Tuple[list, float]:
+    """
+    Get completions for the given messages without blocking the event loop, so that the requests of concurrent
+    sessions run on one event loop. The agents do not call it yet, they call get_completions from their threads.
+    :param messages: List of messages to be used for completion.
+    :param agent: Type of agent. Possible values are 'hostagent', 'appagent' or 'backup'.
+    :param use_backup_engine: Flag indicating whether to use the backup engine or not.
+    :param n: Number of completions to generate.
+    :param validate: The callable raising an exception if a response is not valid, see get_completions.
+    :return: A tuple containing the completion responses and the cost.
+    """
+
+    agent_type = get_agent_type(agent, configs)
+
+    cache = LLMResponseCache.get_instance()
+    cache_key = None
+    if cache.enabled:
+        cache_key = LLMResponseCache.make_key(
+            agent_type, configs[agent_type], messages, n, configs
+        )
+        cached = cache.get(cache_key)
+        if cached is not None and (
+            cache.mode == "replay" or any_valid(cached[0], validate)
+        ):
+            return cached[0], 0.0
+
+    try:
+        service = ServiceRegistry.get_instance().get(configs, agent_type)
+
+        async def attempt() -> Tuple[list, float]:
+            with span(
+                "llm.attempt",
+                agent_type=agent_type,
+                model=configs[agent_type]["API_MODEL"],
+            ):
+                return await service.chat_completion_async(messages, n)
+
+        response, cost = await RateLimitScheduler.get_instance().call_async(
+            get_deployment_limiter(configs, agent_type),
+            estimate_request_tokens(
+                messages, configs[agent_type], configs.get("MAX_TOKENS", 0)
+            ),
+            attempt,
+        )
+        if cache_key is not None and any_valid(response, validate):
+            cache.put(
+                cache_key,
+                response,
+                cost,
+                agent_type=agent_type,
+                model=configs[agent_type]["API_MODEL"],
+            )
+        return response, cost
+    except Exception as e:
+        if use_backup_engine:
+            print_with_color(f"The API request of {agent_type} failed: {e}.", "red")
+            print_with_color(f"Switching to use the backup engine...", "yellow")
+            return await get_completions_async(
+                messages,
+                agent="backup",
+                use_backup_engine=False,
+                n=n,
+                configs=configs,
+                validate=validate,
             )
         else:
             raise e
@@ -0,0 +1,363 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The load test of the LLM request path of the agents, against the mock LLM server of ufo.llm.mock_server.
+
+N concurrent sessions send the requests of their steps to the server, and the latencies of the steps are reported
+with the time the server spent on their requests, so that the overhead of the framework is measured separately from
+the latency of the model. In the "framework" mode, a step goes through the path of the agents: the rate limit
+scheduler, the OpenAI service, the retries of the JSON parsing and the backup engine. In the "http" mode, a step is a
+plain HTTP request, the baseline of the transport.
+
+Run the load test against an in-process server with:
+
+    python -m ufo.llm.load_test --sessions 16 --steps 20 --latency 0.5 --mode framework
+
+or against a running server with --url http://127.0.0.1:8000/v1.
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from ufo.llm.mock_server import LatencyModel, MockLLMServer, MockScript
+
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    Compute a percentile, interpolated between the closest ranks.
+    :param values: The values.
+    :param q: The percentile, between 0 and 100.
+    :return: The percentile, 0 if there is no value.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * q / 100
+    lower = int(rank)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+@dataclass
+class LoadTestReport:
+    """
+    The report of a load test.
+    """
+
+    mode: str
+    sessions: int
+    steps: int
+    # The wall time of the test, in seconds.
+    wall_time: float = 0.0
+    # The latencies of the completed steps, in seconds.
+    step_latencies: List[float] = field(default_factory=list)
+    failed_steps: int = 0
+    # The time of the failed steps, in seconds.
+    failed_time: float = 0.0
+    # The statistics of the server over the test.
+    server: Dict[str, Any] = field(default_factory=dict)
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        Summarize the report, with the latencies in milliseconds.
+        :return: The summary.
+        """
+        latencies = self.step_latencies
+        server_times = self.server.get("server_times", [])
+        completed = len(latencies)
+        total = sum(latencies) + self.failed_time
+
+        summary = {
+            "mode": self.mode,
+            "sessions": self.sessions,
+            "steps": completed + self.failed_steps,
+            "failed_steps": self.failed_steps,
+            "steps_per_second": (
+                round(completed / self.wall_time, 2) if self.wall_time else 0.0
+            ),
+            "requests": sum(self.server.get("requests", {}).values()),
+            "errors": {
+                kind: count
+                for kind, count in self.server.get("errors", {}).items()
+                if count
+            },
+        }
+        for q in (50, 90, 99):
+            summary[f"step_p{q}_ms"] = round(percentile(latencies, q) * 1000, 1)
+        summary["step_max_ms"] = round(max(latencies, default=0.0) * 1000, 1)
+        for q in (50, 90, 99):
+            summary[f"server_p{q}_ms"] = round(percentile(server_times, q) * 1000, 1)
+        # The time of the steps not spent in the server, the failed steps included.
+        summary["overhead_per_step_ms"] = (
+            round((total - sum(server_times)) / summary["steps"] * 1000, 2)
+            if summary["steps"]
+            else 0.0
+        )
+        return summary
+
+
+def _server_request(url: str, path: str, method: str = "GET") -> Dict[str, Any]:
+    """
+    Send a request to the statistics endpoints of the server.
+    :param url: The API base of the server.
+    :param path: The path of the endpoint.
+    :param method: The HTTP method.
+    :return: The JSON response.
+    """
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/{path}", data=b"" if method == "POST" else None
+    )
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def build_messages(session: int, step: int, prompt_chars: int) -> List[Dict[str, Any]]:
+    """
+    Build the synthetic prompt of a step, with a system prompt shared by the steps.
+    :param session: The index of the session.
+    :param step: The index of the step.
+    :param prompt_chars: The size of the system prompt, in characters.
+    :return: The messages.
+    """
+    return [
+        {
+            "role": "system",
+            "content": ("You are a mock agent. " * prompt_chars)[:prompt_chars],
+        },
+        {
+            "role": "user",
+            "content": f"Session {session}, step {step}: continue the task.",
+        },
+    ]
+
+
+def http_step(
+    url: str,
+    messages: List[Dict[str, Any]],
+    timeout: float,
+    max_retry: int,
+) -> None:
+    """
+    Run a step as a plain HTTP request, retrying the rate-limited requests after their Retry-After.
+    :param url: The API base of the server.
+    :param messages: The messages of the step.
+    :param timeout: The timeout of a request, in seconds.
+    :param max_retry: The largest number of retries.
+    :raises Exception: If the request fails or the reply cannot be parsed.
+    """
+    data = json.dumps({"model": "mock", "messages": messages}).encode("utf-8")
+    for attempt in range(max_retry + 1):
+        request = urllib.request.Request(
+            f"{url.rstrip('/')}/chat/completions",
+            data=data,
+            headers={"Content-Type": "application/json"},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                body = json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429 and attempt < max_retry:
+                time.sleep(float(e.headers.get("Retry-After", 1)))
+                continue
+            raise
+        json.loads(body["choices"][0]["message"]["content"])
+        return
+
+
+def framework_configs(
+    url: str, timeout: float, max_retry: int, use_backup_engine: bool
+) -> Dict[str, Any]:
+    """
+    Build the configuration of the agents sending their requests to the mock server.
+    :param url: The API base of the server.
+    :param timeout: The timeout of a request, in seconds.
+    :param max_retry: The retries of the OpenAI client.
+    :param use_backup_engine: Whether the backup engine is configured, also the mock server.
+    :return: The configuration.
+    """
+
+    def agent(model: str) -> Dict[str, Any]:
+        return {
+            "VISUAL_MODE": False,
+            "API_TYPE": "openai",
+            "API_BASE": url,
+            "API_KEY": "mock",
+            "API_MODEL": model,
+        }
+
+    configs = {
+        "APP_AGENT": agent("mock-app"),
+        "MAX_RETRY": max_retry,
+        "TIMEOUT": timeout,
+        "TEMPERATURE": 0,
+        "TOP_P": 0,
+        "MAX_TOKENS": 2000,
+        "PRICES": {},
+    }
+    if use_backup_engine:
+        configs["BACKUP_AGENT"] = agent("mock-backup")
+    return configs
+
+
+def framework_step(
+    messages: List[Dict[str, Any]],
+    configs: Dict[str, Any],
+    use_backup_engine: bool,
+    parse_retry: int,
+    stream: bool,
+) -> None:
+    """
+    Run a step through the request path of the agents, as in BasicAgent.get_parsed_response.
+    :param messages: The messages of the step.
+    :param configs: The configuration of the agents.
+    :param use_backup_engine: Whether to fall back to the backup engine.
+    :param parse_retry: The largest number of requests until the reply can be parsed.
+    :param stream: Whether to stream the replies.
+    :raises Exception: If the requests fail or no reply can be parsed.
+    """
+    from ufo.llm import llm_call
+    from ufo.llm.hedged_request import hedged_request
+    from ufo.utils import json_parser
+
+    result = hedged_request(
+        lambda: llm_call.get_completions(
+            messages,
+            "app",
+            use_backup_engine=use_backup_engine,
+            configs=configs,
+            stream_callback=(lambda chunk: None) if stream else None,
+        ),
+        json_parser,
+        max_requests=parse_retry,
+    )
+    if not result.accepted:
+        raise ValueError("No reply could be parsed.")
+
+
+def run_load_test(
+    url: str,
+    sessions: int = 8,
+    steps: int = 10,
+    mode: str = "framework",
+    prompt_chars: int = 20000,
+    timeout: float = 20,
+    max_retry: int = 3,
+    parse_retry: int = 3,
+    use_backup_engine: bool = False,
+    stream: bool = False,
+) -> LoadTestReport:
+    """
+    Run concurrent sessions of sequential steps against the mock server.
+    :param url: The API base of the server.
+    :param sessions: The number of concurrent sessions.
+    :param steps: The number of steps of every session.
+    :param mode: "framework" for the request path of the agents, "http" for plain HTTP requests.
+    :param prompt_chars: The size of the system prompt of the steps, in characters.
+    :param timeout: The timeout of a request, in seconds.
+    :param max_retry: The retries of a request.
+    :param parse_retry: The largest number of requests of a step until the reply can be parsed, in the framework mode.
+    :param use_backup_engine: Whether to fall back to the backup engine, in the framework mode.
+    :param stream: Whether to stream the replies, in the framework mode.
+    :return: The report.
+    """
+    if mode == "framework":
+        configs = framework_configs(url, timeout, max_retry, use_backup_engine)
+
+        def step(messages: List[Dict[str, Any]]) -> None:
+            framework_step(messages, configs, use_backup_engine, parse_retry, stream)
+
+    elif mode == "http":
+
+        def step(messages: List[Dict[str, Any]]) -> None:
+            http_step(url, messages, timeout, max_retry)
+
+    else:
+        raise ValueError(f"Mode {mode} not supported")
+
+    report = LoadTestReport(mode, sessions, steps)
+    lock = threading.Lock()
+
+    def session(index: int) -> None:
+        for step_index in range(steps):
+            messages = build_messages(index, step_index, prompt_chars)
+            start = time.perf_counter()
+            try:
+                step(messages)
+            except Exception:
+                with lock:
+                    report.failed_steps += 1
+                    report.failed_time += time.perf_counter() - start
+                continue
+            latency = time.perf_counter() - start
+            with lock:
+                report.step_latencies.append(latency)
+
+    _server_request(url, "stats/reset", "POST")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(session, range(sessions)))
+    report.wall_time = time.perf_counter() - start
+    report.server = _server_request(url, "stats")
+    return report
+
+
+def main() -> None:
+    """
+    Run the load test from the command line, against an in-process mock server if no URL is given.
+    """
+    parser = argparse.ArgumentParser(description="Load test the LLM request path.")
+    parser.add_argument("--url", default=None, help="The API base of a mock server.")
+    parser.add_argument("--script", default=None, help="The script of the server.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=None,
+        help="A fixed latency in seconds, replacing the latency of the script.",
+    )
+    parser.add_argument("--sessions", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=10)
+    parser.add_argument("--mode", choices=["framework", "http"], default="framework")
+    parser.add_argument("--prompt-chars", type=int, default=20000)
+    parser.add_argument("--timeout", type=float, default=20)
+    parser.add_argument("--backup", action="store_true", help="Use the backup engine.")
+    parser.add_argument("--stream", action="store_true", help="Stream the replies.")
+    args = parser.parse_args()
+
+    server: Optional[MockLLMServer] = None
+    url = args.url
+    if url is None:
+        script = MockScript.load(args.script) if args.script else MockScript()
+        if args.latency is not None:
+            script.latency = LatencyModel(median=args.latency)
+        server = MockLLMServer(script).start()
+        url = server.url
+
+    try:
+        report = run_load_test(
+            url,
+            sessions=args.sessions,
+            steps=args.steps,
+            mode=args.mode,
+            prompt_chars=args.prompt_chars,
+            timeout=args.timeout,
+            use_backup_engine=args.backup,
+            stream=args.stream,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+
+    for key, value in report.summary().items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
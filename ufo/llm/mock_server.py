@@ -0,0 +1,732 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A local OpenAI-compatible mock LLM server, to measure the overhead of the framework separately from the latency of
+the model, and to exercise the retry and backup paths, without a live endpoint.
+
+The server speaks the chat completions API used by the OpenAI services, streamed or not, and the responses API used
+by the Operator service, on the OpenAI paths (/v1/chat/completions, /v1/responses) and the Azure OpenAI paths
+(/openai/deployments/<deployment>/chat/completions, /openai/responses). It replies with the canned or templated
+replies of a script, after a latency drawn from a distribution, and injects errors at given rates: rate limits (429
+with a Retry-After header), timeouts, server errors (503) and malformed JSON replies.
+
+A script is a YAML or JSON file:
+
+    latency: {distribution: lognormal, median: 1.5, sigma: 0.4}  # In seconds, or a number for a fixed latency.
+    errors: {rate_limit: 0.05, timeout: 0.01, server_error: 0.0, malformed: 0.02}  # The rates of the requests.
+    retry_after: 1  # The Retry-After of the rate limits, in seconds.
+    timeout: 60  # The hang of the timeouts, in seconds.
+    replies:  # Answered in turn, except the replies with a match, answered to the requests matching them.
+      - match: "Excel"  # A regular expression searched in the last user message.
+        content: {"Observation": "...", "Status": "CONTINUE"}  # A JSON object, or a text.
+      - content: {"Observation": "Step $index of $model.", "Status": "FINISH"}
+      - error: rate_limit  # A scripted error, answered in turn as the replies.
+
+The $index (of the request), $model and $request (the last user message) placeholders of the replies are replaced,
+escaped for JSON. The replies of the responses API are output_text messages, or the given output items, e.g. a
+computer_call. Point the API_BASE of an agent to the server, with the "openai" API_TYPE, and start it with:
+
+    python -m ufo.llm.mock_server --port 8000 --script script.yaml
+
+The statistics of the server are served at GET /stats, and reset with POST /stats/reset.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import string
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import yaml
+
+# The errors which can be injected, in the order their rates are drawn.
+ERROR_KINDS = ("rate_limit", "timeout", "server_error", "malformed")
+
+# A reply valid for the AppAgent and the HostAgent, continuing the task.
+DEFAULT_REPLY = {
+    "Observation": "The mock observation of step $index.",
+    "Thought": "The mock thought of step $index.",
+    "CurrentSubtask": "The mock subtask.",
+    "Message": [],
+    "ControlLabel": "",
+    "ControlText": "",
+    "Function": "",
+    "Args": {},
+    "Status": "CONTINUE",
+    "Plan": [],
+    "Comment": "",
+    "Questions": [],
+    "Bash": "",
+    "SaveScreenshot": {"save": False, "reason": ""},
+}
+
+
+@dataclass
+class LatencyModel:
+    """
+    The distribution of the latency of the replies, in seconds.
+    """
+
+    # One of "fixed", "uniform", "normal", "lognormal" and "exponential".
+    distribution: str = "fixed"
+    # The latency of the fixed, normal and exponential distributions, the median of the lognormal distribution.
+    median: float = 0.0
+    # The bounds of the uniform distribution.
+    low: float = 0.0
+    high: float = 0.0
+    # The standard deviation of the normal distribution, of the logarithm of the latency for the lognormal one.
+    sigma: float = 0.0
+
+    @classmethod
+    def from_config(cls, config: Union[None, float, Dict[str, Any]]) -> "LatencyModel":
+        """
+        Build the model from the configuration of a script.
+        :param config: A fixed latency, or the distribution and its parameters.
+        :return: The model.
+        """
+        if config is None:
+            return cls()
+        if isinstance(config, (int, float)):
+            return cls(median=float(config))
+
+        model = cls(**config)
+        if model.distribution not in (
+            "fixed",
+            "uniform",
+            "normal",
+            "lognormal",
+            "exponential",
+        ):
+            raise ValueError(f"Latency distribution {model.distribution} not supported")
+        return model
+
+    def sample(self, rng: random.Random) -> float:
+        """
+        Draw a latency.
+        :param rng: The random generator.
+        :return: The latency, in seconds.
+        """
+        if self.distribution == "uniform":
+            latency = rng.uniform(self.low, self.high)
+        elif self.distribution == "normal":
+            latency = rng.gauss(self.median, self.sigma)
+        elif self.distribution == "lognormal":
+            latency = (
+                rng.lognormvariate(math.log(self.median), self.sigma)
+                if self.median > 0
+                else 0.0
+            )
+        elif self.distribution == "exponential":
+            latency = rng.expovariate(1 / self.median) if self.median > 0 else 0.0
+        else:
+            latency = self.median
+        return max(latency, 0.0)
+
+
+@dataclass
+class MockReply:
+    """
+    A reply of a script.
+    """
+
+    # The content of the reply, a JSON object or a text.
+    content: Any = None
+    # The regular expression searched in the last user message, to answer the matching requests only.
+    match: Optional[str] = None
+    # The scripted error, one of ERROR_KINDS.
+    error: Optional[str] = None
+    # The output items of the responses API, replacing the output_text message of the content.
+    output: Optional[List[Dict[str, Any]]] = None
+    # The latency of the reply, replacing the latency of the script.
+    latency: Union[None, float, Dict[str, Any]] = None
+
+    def __post_init__(self) -> None:
+        if self.error is not None and self.error not in ERROR_KINDS:
+            raise ValueError(f"Error {self.error} not supported")
+        self.latency_model = (
+            LatencyModel.from_config(self.latency) if self.latency is not None else None
+        )
+
+
+@dataclass
+class MockScript:
+    """
+    The script of the replies of the server.
+    """
+
+    replies: List[MockReply] = field(default_factory=list)
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    # The rates of the injected errors, by kind.
+    errors: Dict[str, float] = field(default_factory=dict)
+    retry_after: float = 1.0
+    timeout: float = 60.0
+    # The streamed replies are sent in chunks of chunk_size characters, every chunk_interval seconds.
+    chunk_size: int = 16
+    chunk_interval: float = 0.0
+    seed: Optional[int] = None
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> "MockScript":
+        """
+        Build the script from its configuration.
+        :param config: The configuration, as in a script file.
+        :return: The script.
+        """
+        config = dict(config)
+        unknown = set(config.get("errors", {})) - set(ERROR_KINDS)
+        if unknown:
+            raise ValueError(f"Errors {sorted(unknown)} not supported")
+
+        config["replies"] = [
+            MockReply(**reply) if isinstance(reply, dict) else MockReply(content=reply)
+            for reply in config.get("replies", [])
+        ]
+        config["latency"] = LatencyModel.from_config(config.get("latency"))
+        return cls(**config)
+
+    @classmethod
+    def load(cls, path: str) -> "MockScript":
+        """
+        Load a script file.
+        :param path: The path of the YAML or JSON file.
+        :return: The script.
+        """
+        with open(path, "r", encoding="utf-8") as file:
+            return cls.from_config(yaml.safe_load(file) or {})
+
+
+def _message_text(content: Any) -> str:
+    """
+    Get the text of the content of a message, a text or a list of parts.
+    :param content: The content.
+    :return: The text.
+    """
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return "\n".join(
+            part.get("text", "") for part in content if isinstance(part, dict)
+        )
+    return ""
+
+
+def last_user_text(messages: Any) -> str:
+    """
+    Get the text of the last user message of a chat completions or responses request.
+    :param messages: The messages of a chat completions request, or the input of a responses request.
+    :return: The text, empty if there is no user message.
+    """
+    if isinstance(messages, str):
+        return messages
+    for message in reversed(messages or []):
+        if isinstance(message, dict) and message.get("role") == "user":
+            return _message_text(message.get("content"))
+    return ""
+
+
+def approximate_tokens(value: Any) -> int:
+    """
+    Approximate the tokens of a value by the length of its JSON, images included.
+    :param value: The value.
+    :return: The approximate number of tokens.
+    """
+    if not isinstance(value, str):
+        value = json.dumps(value, ensure_ascii=False)
+    return max(1, len(value) // 4)
+
+
+class MockLLMState:
+    """
+    The script, the random generator and the statistics of a server, shared by its request threads.
+    """
+
+    def __init__(self, script: MockScript) -> None:
+        """
+        Initialize the state.
+        :param script: The script of the replies.
+        """
+        self.script = script
+        self._rng = random.Random(script.seed)
+        self._lock = threading.Lock()
+        self._index = 0
+        self._turn = 0
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        """
+        Reset the statistics.
+        """
+        with self._lock:
+            self.requests: Dict[str, int] = {}
+            self.errors: Dict[str, int] = {kind: 0 for kind in ERROR_KINDS}
+            self.latencies: List[float] = []
+            self.server_times: List[float] = []
+
+    def next_reply(
+        self, endpoint: str, text: str
+    ) -> Tuple[int, MockReply, Optional[str], float]:
+        """
+        Choose the reply of a request, its error and its latency, and count the request in the statistics.
+        :param endpoint: The endpoint, "chat.completions" or "responses".
+        :param text: The last user message of the request.
+        :return: The index of the request, the reply, the error, if any, and the latency.
+        """
+        script = self.script
+        with self._lock:
+            self._index += 1
+            index = self._index
+
+            reply = next(
+                (
+                    reply
+                    for reply in script.replies
+                    if reply.match is not None and re.search(reply.match, text)
+                ),
+                None,
+            )
+            if reply is None:
+                turns = [reply for reply in script.replies if reply.match is None]
+                if turns:
+                    reply = turns[self._turn % len(turns)]
+                    self._turn += 1
+                else:
+                    reply = MockReply(content=DEFAULT_REPLY)
+
+            error = reply.error
+            if error is None:
+                draw = self._rng.random()
+                for kind in ERROR_KINDS:
+                    rate = script.errors.get(kind, 0.0)
+                    if draw < rate:
+                        error = kind
+                        break
+                    draw -= rate
+
+            latency = (reply.latency_model or script.latency).sample(self._rng)
+
+            # Counted at once, the timed-out requests included.
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            if error is not None:
+                self.errors[error] += 1
+            self.latencies.append(latency)
+
+        return index, reply, error, latency
+
+    def record(self, server_time: float) -> None:
+        """
+        Record the time spent by the server on a request, once answered.
+        :param server_time: The time, in seconds.
+        """
+        with self._lock:
+            self.server_times.append(server_time)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the statistics.
+        :return: The requests by endpoint and the injected errors by kind, counted when the requests are received, the
+        injected latencies and the times spent by the server on the answered requests, in seconds.
+        """
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "errors": dict(self.errors),
+                "latencies": list(self.latencies),
+                "server_times": list(self.server_times),
+            }
+
+
+def render_content(reply: MockReply, index: int, model: str, text: str) -> str:
+    """
+    Render the content of a reply, replacing its placeholders.
+    :param reply: The reply.
+    :param index: The index of the request.
+    :param model: The model of the request.
+    :param text: The last user message of the request.
+    :return: The content.
+    """
+    content = reply.content if reply.content is not None else DEFAULT_REPLY
+    if not isinstance(content, str):
+        content = json.dumps(content, ensure_ascii=False)
+
+    values = {"index": index, "model": model, "request": text}
+    return string.Template(content).safe_substitute(
+        {key: json.dumps(str(value))[1:-1] for key, value in values.items()}
+    )
+
+
+def malform(content: str) -> str:
+    """
+    Make a reply malformed, by truncating it.
+    :param content: The content of the reply.
+    :return: The malformed content.
+    """
+    return content[: max(1, len(content) // 2)]
+
+
+class MockLLMHandler(BaseHTTPRequestHandler):
+    """
+    The handler of the requests of the server.
+    """
+
+    protocol_version = "HTTP/1.1"
+    server: "MockLLMServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        # The requests are counted in the statistics instead.
+        pass
+
+    def _send_json(
+        self, status: int, body: Any, headers: Optional[Dict[str, str]] = None
+    ) -> None:
+        """
+        Send a JSON response.
+        :param status: The HTTP status.
+        :param body: The body, serializable as JSON.
+        :param headers: The additional headers.
+        """
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status: int, message: str, code: str) -> None:
+        """
+        Send an error in the format of the OpenAI API.
+        :param status: The HTTP status.
+        :param message: The message of the error.
+        :param code: The code of the error.
+        """
+        headers = {}
+        if status == 429:
+            headers["Retry-After"] = str(self.server.state.script.retry_after)
+        self._send_json(
+            status,
+            {"error": {"message": message, "type": code, "param": None, "code": code}},
+            headers,
+        )
+
+    def do_GET(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/stats"):
+            self._send_json(200, self.server.state.stats())
+        elif path.endswith("/models"):
+            self._send_json(
+                200,
+                {"object": "list", "data": [{"id": "mock", "object": "model"}]},
+            )
+        else:
+            self._send_error(404, f"Path {self.path} not found", "not_found")
+
+    def do_POST(self) -> None:
+        path = self.path.split("?", 1)[0].rstrip("/")
+        if path.endswith("/stats/reset"):
+            self.server.state.reset_stats()
+            self._send_json(200, {})
+            return
+
+        if path.endswith("/chat/completions"):
+            endpoint = "chat.completions"
+        elif path.endswith("/responses"):
+            endpoint = "responses"
+        else:
+            self._send_error(404, f"Path {self.path} not found", "not_found")
+            return
+
+        start = time.perf_counter()
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError as e:
+            self._send_error(400, f"Invalid JSON body: {e}", "invalid_request_error")
+            return
+
+        messages = request.get("messages", request.get("input", []))
+        text = last_user_text(messages)
+        index, reply, error, latency = self.server.state.next_reply(endpoint, text)
+
+        try:
+            time.sleep(latency)
+            if error == "timeout":
+                # Hang until the client gives up.
+                time.sleep(self.server.state.script.timeout)
+                self._send_error(504, "The mock request timed out", "timeout")
+            elif error == "rate_limit":
+                self._send_error(
+                    429, "The mock rate limit is exceeded", "rate_limit_exceeded"
+                )
+            elif error == "server_error":
+                self._send_error(503, "The mock server is unavailable", "server_error")
+            else:
+                model = str(request.get("model", "mock"))
+                content = render_content(reply, index, model, text)
+                if error == "malformed":
+                    content = malform(content)
+                prompt_tokens = approximate_tokens(messages)
+
+                if endpoint == "responses":
+                    self._send_json(
+                        200, self._response_body(request, reply, content, prompt_tokens)
+                    )
+                elif request.get("stream"):
+                    self._stream_chat_completion(request, content, prompt_tokens)
+                else:
+                    self._send_json(
+                        200, self._chat_completion_body(request, content, prompt_tokens)
+                    )
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up, e.g. after its own timeout.
+            pass
+        finally:
+            self.server.state.record(time.perf_counter() - start)
+
+    @staticmethod
+    def _usage(prompt_tokens: int, content: str) -> Dict[str, Any]:
+        """
+        Build the usage of a chat completion.
+        :param prompt_tokens: The prompt tokens.
+        :param content: The content of the completion.
+        :return: The usage.
+        """
+        completion_tokens = approximate_tokens(content)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+
+    def _chat_completion_body(
+        self, request: Dict[str, Any], content: str, prompt_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        Build a chat completion, with the same content for all the choices.
+        :param request: The request.
+        :param content: The content of the completion.
+        :param prompt_tokens: The prompt tokens.
+        :return: The chat completion.
+        """
+        n = int(request.get("n") or 1)
+        usage = self._usage(prompt_tokens, content)
+        usage["completion_tokens"] *= n
+        usage["total_tokens"] = prompt_tokens + usage["completion_tokens"]
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock"),
+            "choices": [
+                {
+                    "index": choice,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                    "logprobs": None,
+                }
+                for choice in range(n)
+            ],
+            "usage": usage,
+        }
+
+    def _stream_chat_completion(
+        self, request: Dict[str, Any], content: str, prompt_tokens: int
+    ) -> None:
+        """
+        Stream a chat completion as server-sent events.
+        :param request: The request.
+        :param content: The content of the completion.
+        :param prompt_tokens: The prompt tokens.
+        """
+        script = self.server.state.script
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def chunk(
+            delta: Dict[str, Any], finish_reason: Optional[str], usage=None
+        ) -> bytes:
+            body = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": request.get("model", "mock"),
+                "choices": (
+                    [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+                    if usage is None
+                    else []
+                ),
+                "usage": usage,
+            }
+            return f"data: {json.dumps(body)}\n\n".encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        self.wfile.write(chunk({"role": "assistant", "content": ""}, None))
+        for offset in range(0, len(content), max(1, script.chunk_size)):
+            if offset and script.chunk_interval:
+                time.sleep(script.chunk_interval)
+            piece = content[offset : offset + max(1, script.chunk_size)]
+            self.wfile.write(chunk({"content": piece}, None))
+            self.wfile.flush()
+        self.wfile.write(chunk({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self.wfile.write(chunk({}, None, self._usage(prompt_tokens, content)))
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _response_body(
+        request: Dict[str, Any], reply: MockReply, content: str, prompt_tokens: int
+    ) -> Dict[str, Any]:
+        """
+        Build a response of the responses API.
+        :param request: The request.
+        :param reply: The reply.
+        :param content: The content of the reply.
+        :param prompt_tokens: The input tokens.
+        :return: The response.
+        """
+        if reply.output is not None:
+            output = reply.output
+        else:
+            output = [
+                {
+                    "type": "message",
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [
+                        {"type": "output_text", "text": content, "annotations": []}
+                    ],
+                }
+            ]
+        output_tokens = approximate_tokens(output)
+        return {
+            "id": f"resp_{uuid.uuid4().hex}",
+            "object": "response",
+            "created_at": int(time.time()),
+            "model": request.get("model", "mock"),
+            "status": "completed",
+            "output": output,
+            "previous_response_id": request.get("previous_response_id"),
+            "tools": request.get("tools", []),
+            "tool_choice": "auto",
+            "parallel_tool_calls": True,
+            "truncation": request.get("truncation", "disabled"),
+            "temperature": request.get("temperature"),
+            "top_p": request.get("top_p"),
+            "error": None,
+            "incomplete_details": None,
+            "instructions": None,
+            "metadata": {},
+            "usage": {
+                "input_tokens": prompt_tokens,
+                "input_tokens_details": {"cached_tokens": 0},
+                "output_tokens": output_tokens,
+                "output_tokens_details": {"reasoning_tokens": 0},
+                "total_tokens": prompt_tokens + output_tokens,
+            },
+        }
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    """
+    The mock LLM server, answering every request in its own thread.
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        script: Optional[MockScript] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """
+        Create the server.
+        :param script: The script of the replies, the default reply without latency nor errors if not given.
+        :param host: The host to listen on.
+        :param port: The port to listen on, any free port if 0.
+        """
+        super().__init__((host, port), MockLLMHandler)
+        self.state = MockLLMState(script or MockScript())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """
+        The API base of the server, for the API_BASE of the agents.
+        """
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "MockLLMServer":
+        """
+        Serve the requests in a background thread.
+        :return: The server.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """
+        Stop serving the requests and close the server.
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockLLMServer":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+
+def main() -> None:
+    """
+    Run the server from the command line.
+    """
+    parser = argparse.ArgumentParser(description="A mock OpenAI-compatible server.")
+    parser.add_argument("--host", default="127.0.0.1", help="The host to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="The port.")
+    parser.add_argument("--script", default=None, help="The script of the replies.")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=None,
+        help="A fixed latency in seconds, replacing the latency of the script.",
+    )
+    args = parser.parse_args()
+
+    script = MockScript.load(args.script) if args.script else MockScript()
+    if args.latency is not None:
+        script.latency = LatencyModel(median=args.latency)
+
+    server = MockLLMServer(script, args.host, args.port)
+    print(f"The mock LLM server is listening at {server.url}.")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -51,7 +51,7 @@ class OllamaService(BaseOpenAIService):
         """
         return super()._chat_completion(
             messages,
-            False,
+            stream,
             temperature,
             max_tokens,
             top_p,
@@ -13,11 +13,27 @@ import urllib.request
 from typing import Any, Callable, Dict, List, Literal, Optional, Tuple
 
 import openai
-from openai import AzureOpenAI, OpenAI
+from openai import AsyncAzureOpenAI, AsyncOpenAI, AzureOpenAI, OpenAI
 from ufo.llm.base import BaseService
+from ufo.llm.prompt_cache import openai_cached_tokens, record_prompt_cache
+from ufo.llm.rate_limit import LLMRateLimitError, retry_after_from_headers
+from ufo.utils import print_with_color
 
 
 class BaseOpenAIService(BaseService):
+
+    # The chunks of the response can be streamed to a callback.
+    supports_streaming = True
+
+    # Whether the provider only serves streamed responses.
+    requires_streaming = False
+
+    # Whether a request can generate several completions, the other services generate one completion per request.
+    supports_n = False
+
+    # The response format requested from the provider.
+    response_format = {"type": "json_object"}
+
     def __init__(
         self, config: Dict[str, Any], agent_type: str, api_provider: str, api_base: str
     ) -> None:
@@ -36,16 +52,18 @@ class BaseOpenAIService(BaseService):
         self.agent_type = agent_type
         assert api_provider in ["openai", "aoai", "azure_ad"], "Invalid API Provider"
 
-        self.client: OpenAI = OpenAIService.get_openai_client(
+        self._client_args = (
             api_provider,
             api_base,
             self.max_retry,
             self.config["TIMEOUT"],
             self.config_llm.get("API_KEY", ""),
             self.config_llm.get("API_VERSION", ""),
-            aad_api_scope_base=self.config_llm.get("AAD_API_SCOPE_BASE", ""),
-            aad_tenant_id=self.config_llm.get("AAD_TENANT_ID", ""),
+            self.config_llm.get("AAD_API_SCOPE_BASE", ""),
+            self.config_llm.get("AAD_TENANT_ID", ""),
         )
+        self.client: OpenAI = OpenAIService.get_openai_client(*self._client_args)
+        self._async_client: Optional[AsyncOpenAI] = None
 
     def _chat_completion(
         self,
@@ -54,16 +72,20 @@ class BaseOpenAIService(BaseService):
         temperature: Optional[float] = None,
         max_tokens: Optional[int] = None,
         top_p: Optional[float] = None,
+        n: int = 1,
+        stream_callback: Optional[Callable[[str], None]] = None,
         **kwargs: Any,
     ) -> Tuple[Dict[str, Any], Optional[float]]:
         """
         Generates completions for a given conversation using the OpenAI Chat API.
         :param messages: The list of messages in the conversation.
-        :param n: The number of completions to generate.
         :param stream: Whether to stream the API response.
         :param temperature: The temperature parameter for randomness in the output.
         :param max_tokens: The maximum number of tokens in the generated completion.
         :param top_p: The top-p parameter for nucleus sampling.
+        :param n: The number of completions to generate in one request. The streamed and reasoning requests generate
+        one completion.
+        :param stream_callback: The callback of the chunks of the response. The response is streamed if provided.
         :param kwargs: Additional keyword arguments to pass to the OpenAI API.
         :return: A tuple containing a list of generated completions and the estimated cost.
         :raises: Exception if there is an error in the OpenAI API request
@@ -77,6 +99,8 @@ class BaseOpenAIService(BaseService):
         max_tokens = max_tokens if max_tokens is not None else self.config["MAX_TOKENS"]
         top_p = top_p if top_p is not None else self.config["TOP_P"]
 
+        stream = stream or stream_callback is not None
+
         try:
             if self.config_llm.get("REASONING_MODEL", False):
                 response: Any = self.client.chat.completions.create(
@@ -91,7 +115,7 @@ class BaseOpenAIService(BaseService):
                     response: Any = self.client.chat.completions.create(
                         model=model,
                         messages=messages,  # type: ignore
-                        n=1,
+                        n=n,
                         temperature=temperature,
                         max_tokens=max_tokens,
                         top_p=top_p,
@@ -124,33 +148,33 @@ class BaseOpenAIService(BaseService):
             # )
 
             if stream:
-                collected_content = [""]
+                collected_chunks = []
+                usage = None
 
                 for chunk in response:
                     if chunk.choices:
                         delta = chunk.choices[0].delta
                         if delta and delta.content:
-                            collected_content[0] += delta.content
-                    else:
+                            collected_chunks.append(delta.content)
+                            if stream_callback is not None:
+                                try:
+                                    stream_callback(delta.content)
+                                except Exception as e:
+                                    print_with_color(
+                                        f"Error in the stream callback: {e}", "yellow"
+                                    )
+                    if chunk.usage:
                         usage = chunk.usage
 
-                prompt_tokens = usage.prompt_tokens
-                completion_tokens = usage.completion_tokens
+                collected_content = ["".join(collected_chunks)]
+                if usage is None:
+                    return collected_content, 0.0
 
-                cost = self.get_cost_estimator(
-                    self.api_type, model, self.prices, prompt_tokens, completion_tokens
-                )
-                return collected_content, cost
+                return collected_content, self._usage_cost(model, usage)
             else:
-                usage = response.usage
-                prompt_tokens = usage.prompt_tokens
-                completion_tokens = usage.completion_tokens
-
-                cost = self.get_cost_estimator(
-                    self.api_type, model, self.prices, prompt_tokens, completion_tokens
-                )
+                cost = self._usage_cost(model, response.usage)
 
-                return [response.choices[0].message.content], cost
+                return [choice.message.content for choice in response.choices], cost
 
         except openai.APITimeoutError as e:
             # Handle timeout error, e.g. retry or log
@@ -168,12 +192,162 @@ class BaseOpenAIService(BaseService):
             # Handle permission error, e.g. check scope or log
             raise Exception(f"OpenAI API request was not permitted: {e}")
         except openai.RateLimitError as e:
-            # Handle rate limit error, e.g. wait or log
-            raise Exception(f"OpenAI API request exceeded rate limit: {e}")
+            # Let the rate limit scheduler wait and retry.
+            raise self._rate_limit_error(e)
         except openai.APIError as e:
             # Handle API error, e.g. retry or log
             raise Exception(f"OpenAI API returned an API Error: {e}")
 
+    @staticmethod
+    def _rate_limit_error(error: openai.RateLimitError) -> LLMRateLimitError:
+        """
+        Convert a rate limit error of the OpenAI API, with the delay before retrying given by the API.
+        :param error: The rate limit error.
+        :return: The converted error.
+        """
+        headers = getattr(getattr(error, "response", None), "headers", None)
+        return LLMRateLimitError(
+            f"OpenAI API request exceeded rate limit: {error}",
+            retry_after=retry_after_from_headers(headers),
+        )
+
+    @property
+    def async_client(self) -> AsyncOpenAI:
+        """
+        The asynchronous client of the service, sharing the configuration of the synchronous client.
+        """
+        if self._async_client is None:
+            self._async_client = BaseOpenAIService.get_async_openai_client(
+                *self._client_args
+            )
+        return self._async_client
+
+    async def chat_completion_async(
+        self,
+        messages: List[Dict[str, str]],
+        n: int,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Tuple[List[str], Optional[float]]:
+        """
+        Generates completions for a given conversation using the asynchronous OpenAI Chat API, with the streaming,
+        number of completions and response format of the service.
+        :param messages: The list of messages in the conversation.
+        :param n: The number of completions to generate, one if the service does not support several completions.
+        :param temperature: The temperature parameter for randomness in the output.
+        :param max_tokens: The maximum number of tokens in the generated completion.
+        :param top_p: The top-p parameter for nucleus sampling.
+        :param kwargs: Additional keyword arguments to pass to the OpenAI API.
+        :return: A tuple containing a list of generated completions and the estimated cost.
+        """
+        return await self._chat_completion_async(
+            messages,
+            self.requires_streaming,
+            temperature,
+            max_tokens,
+            top_p,
+            n=n if self.supports_n else 1,
+            response_format=self.response_format,
+            **kwargs,
+        )
+
+    async def _chat_completion_async(
+        self,
+        messages: List[Dict[str, str]],
+        stream: bool = False,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        n: int = 1,
+        **kwargs: Any,
+    ) -> Tuple[List[str], Optional[float]]:
+        """
+        Generates completions for a given conversation using the asynchronous OpenAI Chat API.
+        :param messages: The list of messages in the conversation.
+        :param stream: Whether to stream the API response. The streamed requests generate one completion.
+        :param temperature: The temperature parameter for randomness in the output.
+        :param max_tokens: The maximum number of tokens in the generated completion.
+        :param top_p: The top-p parameter for nucleus sampling.
+        :param n: The number of completions to generate in one request.
+        :param kwargs: Additional keyword arguments to pass to the OpenAI API.
+        :return: A tuple containing a list of generated completions and the estimated cost.
+        :raises LLMRateLimitError: If the request exceeded the rate limit.
+        """
+        model = self.config_llm["API_MODEL"]
+
+        if self.config_llm.get("REASONING_MODEL", False):
+            parameters = {"n": 1}
+        else:
+            parameters = {
+                "n": 1 if stream else n,
+                "temperature": (
+                    temperature
+                    if temperature is not None
+                    else self.config["TEMPERATURE"]
+                ),
+                "max_tokens": (
+                    max_tokens if max_tokens is not None else self.config["MAX_TOKENS"]
+                ),
+                "top_p": top_p if top_p is not None else self.config["TOP_P"],
+            }
+
+        if stream:
+            parameters["stream"] = True
+            parameters["stream_options"] = {"include_usage": True}
+
+        try:
+            response: Any = await self.async_client.chat.completions.create(
+                model=model,
+                messages=messages,  # type: ignore
+                **parameters,
+                **kwargs,
+            )
+
+            if stream:
+                collected_chunks = []
+                usage = None
+
+                async for chunk in response:
+                    if chunk.choices:
+                        delta = chunk.choices[0].delta
+                        if delta and delta.content:
+                            collected_chunks.append(delta.content)
+                    if chunk.usage:
+                        usage = chunk.usage
+
+                collected_content = ["".join(collected_chunks)]
+                if usage is None:
+                    return collected_content, 0.0
+
+                return collected_content, self._usage_cost(model, usage)
+        except openai.RateLimitError as e:
+            raise self._rate_limit_error(e)
+        except openai.APIError as e:
+            raise Exception(f"OpenAI API returned an API Error: {e}")
+
+        cost = self._usage_cost(model, response.usage)
+        return [choice.message.content for choice in response.choices], cost
+
+    def _usage_cost(self, model: str, usage: Any) -> float:
+        """
+        Record the prompt cache usage of a chat completion and estimate its cost.
+        :param model: The model.
+        :param usage: The usage of the response.
+        :return: The estimated cost.
+        """
+        cached_tokens = openai_cached_tokens(usage)
+        record_prompt_cache(usage.prompt_tokens, cached_tokens)
+        return self.get_cost_estimator(
+            self.api_type,
+            model,
+            self.prices,
+            usage.prompt_tokens,
+            usage.completion_tokens,
+            cached_tokens=cached_tokens,
+        )
+
     def _chat_completion_operator(
         self,
         message: Dict[str, Any] = None,
@@ -280,6 +454,65 @@ class BaseOpenAIService(BaseService):
                 )
         return client
 
+    @functools.lru_cache()
+    @staticmethod
+    def get_async_openai_client(
+        api_type: str,
+        api_base: str,
+        max_retry: int,
+        timeout: int,
+        api_key: Optional[str] = None,
+        api_version: Optional[str] = None,
+        aad_api_scope_base: Optional[str] = None,
+        aad_tenant_id: Optional[str] = None,
+    ) -> AsyncOpenAI:
+        """
+        Create an asynchronous OpenAI client based on the API type, with the parameters of get_openai_client.
+        :param api_type: The type of the API, one of "openai", "aoai", or "azure_ad".
+        :param api_base: The base URL of the API.
+        :param max_retry: The maximum number of retries for the API request.
+        :param timeout: The timeout for the API request.
+        :param api_key: The API key for the OpenAI API.
+        :param api_version: The API version for the Azure OpenAI API.
+        :param aad_api_scope_base: The AAD API scope base for the Azure OpenAI API.
+        :param aad_tenant_id: The AAD tenant ID for the Azure OpenAI API.
+        :return: The asynchronous OpenAI client.
+        """
+        if api_type == "openai":
+            assert api_key, "OpenAI API key must be specified"
+            assert api_base, "OpenAI API base URL must be specified"
+            return AsyncOpenAI(
+                base_url=api_base,
+                api_key=api_key,
+                max_retries=max_retry,
+                timeout=timeout,
+            )
+
+        assert api_version, "Azure OpenAI API version must be specified"
+        if api_type == "aoai":
+            assert api_key, "Azure OpenAI API key must be specified"
+            return AsyncAzureOpenAI(
+                max_retries=max_retry,
+                timeout=timeout,
+                api_version=api_version,
+                azure_endpoint=api_base,
+                api_key=api_key,
+            )
+
+        assert (
+            aad_api_scope_base and aad_tenant_id
+        ), "AAD API scope base and tenant ID must be specified"
+        return AsyncAzureOpenAI(
+            max_retries=max_retry,
+            timeout=timeout,
+            api_version=api_version,
+            azure_endpoint=api_base,
+            azure_ad_token_provider=OpenAIService.get_aad_token_provider(
+                aad_api_scope_base=aad_api_scope_base,
+                aad_tenant_id=aad_tenant_id,
+            ),
+        )
+
     @functools.lru_cache()
     @staticmethod
     def get_aad_token_provider(
@@ -445,6 +678,8 @@ class OpenAIService(BaseOpenAIService):
     The OpenAI service class to interact with the OpenAI API.
     """
 
+    supports_n = True
+
     def __init__(self, config: Dict[str, Any], agent_type: str) -> None:
         """
         Create an OpenAI service instance.
@@ -490,6 +725,7 @@ class OpenAIService(BaseOpenAIService):
                 max_tokens,
                 top_p,
                 response_format={"type": "json_object"},
+                n=n,
                 **kwargs,
             )
         else:
@@ -498,6 +734,33 @@ class OpenAIService(BaseOpenAIService):
                 messages,
             )
 
+    async def chat_completion_async(
+        self,
+        messages: List[Dict[str, str]],
+        n: int,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+        top_p: Optional[float] = None,
+        **kwargs: Any,
+    ) -> Tuple[List[str], Optional[float]]:
+        """
+        Generates completions for a given conversation using the asynchronous OpenAI Chat API.
+        :param messages: The list of messages in the conversation.
+        :param n: The number of completions to generate.
+        :param temperature: The temperature parameter for randomness in the output.
+        :param max_tokens: The maximum number of tokens in the generated completion.
+        :param top_p: The top-p parameter for nucleus sampling.
+        :param kwargs: Additional keyword arguments to pass to the OpenAI API.
+        :return: A tuple containing a list of generated completions and the estimated cost.
+        """
+        if self.agent_type.lower() == "operator":
+            # The Operator API has no asynchronous client, the request runs in a thread.
+            return await BaseService.chat_completion_async(self, messages, n, **kwargs)
+
+        return await super().chat_completion_async(
+            messages, n, temperature, max_tokens, top_p, **kwargs
+        )
+
 
 class OpenAIBetaClient:
 
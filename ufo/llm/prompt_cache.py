@@ -0,0 +1,168 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The provider-side prompt caching.
+
+The providers cache the longest prefix of a prompt already seen: OpenAI automatically, Anthropic up to the blocks
+marked with cache_control breakpoints. The prompts of the agents are laid out so that their prefix is byte-stable
+across the steps of a session: the system prompt, with the API descriptions and the static examples, comes first, then
+the retrieved examples and the blackboard, and only then the screenshots and the state of the current step.
+
+The cached tokens reported by the providers are accumulated for the requests of a step and of the process, and
+reported in the step log next to the cost.
+"""
+
+import contextlib
+import contextvars
+import threading
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    PROMPT_CACHE = configs.get("PROMPT_CACHE", True)
+else:
+    PROMPT_CACHE = True
+
+# The Anthropic breakpoint, caching for 5 minutes the prompt up to the marked block.
+CACHE_CONTROL = {"type": "ephemeral"}
+
+
+@dataclass
+class PromptCacheUsage:
+    """
+    The prompt cache usage of a number of requests.
+    """
+
+    requests: int = 0
+    # The prompt tokens, cached or not.
+    prompt_tokens: int = 0
+    # The prompt tokens read from the cache.
+    cached_tokens: int = 0
+    # The prompt tokens written to the cache, only reported by Anthropic.
+    cache_write_tokens: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        The fraction of the prompt tokens read from the cache.
+        """
+        if self.prompt_tokens == 0:
+            return 0.0
+        return self.cached_tokens / self.prompt_tokens
+
+    def add(
+        self, prompt_tokens: int, cached_tokens: int, cache_write_tokens: int = 0
+    ) -> None:
+        """
+        Add the usage of a request.
+        :param prompt_tokens: The prompt tokens, cached or not.
+        :param cached_tokens: The prompt tokens read from the cache.
+        :param cache_write_tokens: The prompt tokens written to the cache.
+        """
+        self.requests += 1
+        self.prompt_tokens += prompt_tokens
+        self.cached_tokens += cached_tokens
+        self.cache_write_tokens += cache_write_tokens
+
+    def to_log(self) -> Dict[str, Any]:
+        """
+        Convert the usage to the entry of the step log.
+        :return: The entry.
+        """
+        return {**asdict(self), "hit_rate": round(self.hit_rate, 4)}
+
+
+# The usage of the requests of the current step, shared with the threads started with its context.
+_step_usage: contextvars.ContextVar[Optional[PromptCacheUsage]] = (
+    contextvars.ContextVar("prompt_cache_step_usage", default=None)
+)
+
+_total_usage = PromptCacheUsage()
+_total_lock = threading.Lock()
+
+
+def record_prompt_cache(
+    prompt_tokens: int, cached_tokens: int, cache_write_tokens: int = 0
+) -> None:
+    """
+    Record the prompt cache usage of a request, in the current step and in the process.
+    :param prompt_tokens: The prompt tokens, cached or not.
+    :param cached_tokens: The prompt tokens read from the cache.
+    :param cache_write_tokens: The prompt tokens written to the cache.
+    """
+    with _total_lock:
+        _total_usage.add(prompt_tokens, cached_tokens, cache_write_tokens)
+        usage = _step_usage.get()
+        if usage is not None:
+            usage.add(prompt_tokens, cached_tokens, cache_write_tokens)
+
+
+@contextlib.contextmanager
+def track_prompt_cache() -> Iterator[PromptCacheUsage]:
+    """
+    Track the prompt cache usage of the requests sent in the block, e.g. a step of an agent.
+    :return: The usage, updated until the end of the block.
+    """
+    usage = PromptCacheUsage()
+    token = _step_usage.set(usage)
+    try:
+        yield usage
+    finally:
+        _step_usage.reset(token)
+
+
+def total_prompt_cache_usage() -> PromptCacheUsage:
+    """
+    Get the prompt cache usage of all the requests of the process.
+    :return: A copy of the usage.
+    """
+    with _total_lock:
+        return PromptCacheUsage(**asdict(_total_usage))
+
+
+def openai_cached_tokens(usage: Any) -> int:
+    """
+    Get the cached prompt tokens of the usage of an OpenAI-compatible response.
+    :param usage: The usage of the response.
+    :return: The cached tokens, 0 if not reported.
+    """
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def add_cache_breakpoints(
+    system_prompt: str, user_content: List[Dict[str, Any]]
+) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Mark the stable prefix of an Anthropic prompt with cache_control breakpoints: the system prompt, and the leading
+    text blocks of the user content, i.e. the retrieved examples and the blackboard texts.
+    :param system_prompt: The system prompt.
+    :param user_content: The blocks of the user content.
+    :return: The system blocks and the user content, marked.
+    """
+    if not PROMPT_CACHE:
+        return system_prompt, user_content
+
+    system = [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+
+    leading_text = 0
+    while (
+        leading_text < len(user_content)
+        and user_content[leading_text].get("type") == "text"
+    ):
+        leading_text += 1
+
+    # Not the whole content, whose last block is the state of the current step.
+    if 0 < leading_text < len(user_content):
+        user_content = list(user_content)
+        user_content[leading_text - 1] = {
+            **user_content[leading_text - 1],
+            "cache_control": CACHE_CONTROL,
+        }
+
+    return system, user_content
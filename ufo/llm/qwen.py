@@ -9,6 +9,10 @@ class QwenService(BaseOpenAIService):
     A service class for Qwen models.
     """
 
+    # Most Qwen series models require stream=True, and still have poor support for the JSON response format.
+    requires_streaming = True
+    response_format = {"type": "text"}
+
     def __init__(self, config, agent_type: str):
         """
         :param config: The configuration.
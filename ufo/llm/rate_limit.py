@@ -0,0 +1,294 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The scheduler of the LLM requests under the rate limits of the deployments.
+
+Every deployment, i.e. an API type, endpoint and model, has a budget of requests and tokens per minute. A request
+reserves its share of the budgets before it is sent, and waits until the budgets allow it. The reservations are made in
+the order of arrival, so that the requests of the concurrent sessions are served fairly, first come first served, from
+threads or event loops alike.
+
+A request rejected by the rate limit of the provider is retried with an exponential backoff with jitter, or after the
+Retry-After delay of the provider. The rejection also pauses the other requests of the deployment and lowers its
+budgets until the requests are accepted again.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, TypeVar
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    RATE_LIMIT_MAX_RETRY = int(configs.get("RATE_LIMIT_MAX_RETRY", 5))
+else:
+    RATE_LIMIT_MAX_RETRY = 5
+
+T = TypeVar("T")
+
+
+class LLMRateLimitError(Exception):
+    """
+    Raised when a request is rejected by the rate limit of the provider.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float] = None) -> None:
+        """
+        Initialize the error.
+        :param message: The message.
+        :param retry_after: The delay in seconds before retrying, given by the provider, if any.
+        """
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_from_headers(headers: Any) -> Optional[float]:
+    """
+    Read the delay before retrying from the headers of a response.
+    :param headers: The headers, a mapping.
+    :return: The delay in seconds, or None.
+    """
+    if not headers:
+        return None
+    for header, scale in (("retry-after-ms", 0.001), ("retry-after", 1.0)):
+        value = headers.get(header)
+        if value is None:
+            continue
+        try:
+            return float(value) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+class _Bucket:
+    """
+    A token bucket where the reservations beyond the capacity are queued as a debt.
+    """
+
+    def __init__(self, per_minute: float) -> None:
+        """
+        Initialize the bucket, full.
+        :param per_minute: The budget per minute, also the capacity.
+        """
+        self.base_rate = per_minute / 60.0
+        self.rate = self.base_rate
+        self.capacity = per_minute
+        self.level = 0.0
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """
+        Reserve an amount of the budget.
+        :param amount: The amount.
+        :param now: The current time.
+        :return: The delay in seconds before the amount is available.
+        """
+        self.level = max(0.0, self.level - (now - self.updated) * self.rate)
+        self.updated = now
+        # A request larger than the capacity waits for the whole bucket.
+        amount = min(amount, self.capacity)
+        delay = max(0.0, (self.level + amount - self.capacity) / self.rate)
+        self.level += amount
+        return delay
+
+
+class DeploymentLimiter:
+    """
+    The budgets of requests and tokens per minute of a deployment. The budgets are halved at every rejection of the
+    provider, down to a tenth, and recover by a twentieth at every accepted request, so that budgets above the actual
+    limits of the provider converge to them.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> None:
+        """
+        Initialize the limiter.
+        :param requests_per_minute: The budget of requests per minute, unlimited if None or 0.
+        :param tokens_per_minute: The budget of tokens per minute, unlimited if None or 0.
+        """
+        self._requests = _Bucket(requests_per_minute) if requests_per_minute else None
+        self._tokens = _Bucket(tokens_per_minute) if tokens_per_minute else None
+        self._paused_until = 0.0
+        self._scale = 1.0
+        self._lock = threading.Lock()
+
+    def reserve(self, tokens: int) -> float:
+        """
+        Reserve a request of a number of tokens.
+        :param tokens: The estimated tokens of the request.
+        :return: The delay in seconds before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(0.0, self._paused_until - now)
+            if self._requests is not None:
+                delay = max(delay, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                delay = max(delay, self._tokens.reserve(tokens, now))
+            return delay
+
+    def _set_scale(self, scale: float) -> None:
+        """
+        Scale the budgets. The lock must be held.
+        :param scale: The fraction of the budgets.
+        """
+        self._scale = scale
+        for bucket in (self._requests, self._tokens):
+            if bucket is not None:
+                bucket.rate = bucket.base_rate * scale
+
+    def rejected(self, pause: float) -> None:
+        """
+        Pause the requests of the deployment and halve its budgets, after a rejection of the provider.
+        :param pause: The pause in seconds.
+        """
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._set_scale(max(0.1, self._scale / 2))
+
+    def accepted(self) -> None:
+        """
+        Recover the budgets after a request accepted by the provider.
+        """
+        if self._scale < 1.0:
+            with self._lock:
+                self._set_scale(min(1.0, self._scale + 0.05))
+
+
+class RateLimitScheduler:
+    """
+    The scheduler of the requests of all the deployments, shared by the sessions of the process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        max_retries: int = RATE_LIMIT_MAX_RETRY,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ) -> None:
+        """
+        Initialize the scheduler.
+        :param max_retries: The largest number of retries of a rate-limited request.
+        :param base_delay: The first backoff delay, in seconds.
+        :param max_delay: The largest backoff delay, in seconds.
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._limiters: Dict[Hashable, DeploymentLimiter] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "RateLimitScheduler":
+        """
+        Get the scheduler of the process.
+        :return: The scheduler.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def limiter(
+        self,
+        deployment: Hashable,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+    ) -> DeploymentLimiter:
+        """
+        Get the limiter of a deployment, created with the budgets at the first request.
+        :param deployment: The key of the deployment.
+        :param requests_per_minute: The budget of requests per minute.
+        :param tokens_per_minute: The budget of tokens per minute.
+        :return: The limiter.
+        """
+        with self._lock:
+            limiter = self._limiters.get(deployment)
+            if limiter is None:
+                limiter = DeploymentLimiter(requests_per_minute, tokens_per_minute)
+                self._limiters[deployment] = limiter
+            return limiter
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Compute the delay before a retry.
+        :param attempt: The number of the retry, from 0.
+        :param retry_after: The delay given by the provider, if any.
+        :return: The delay in seconds.
+        """
+        if retry_after is not None:
+            # Spread the retries of the requests paused together.
+            return retry_after + random.uniform(0, self.base_delay)
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        return random.uniform(delay / 2, delay)
+
+    def call(
+        self,
+        limiter: DeploymentLimiter,
+        tokens: int,
+        request: Callable[[], T],
+    ) -> T:
+        """
+        Send a request within the budgets of the deployment, retrying it if it is rate limited.
+        :param limiter: The limiter of the deployment.
+        :param tokens: The estimated tokens of the request.
+        :param request: The callable sending the request.
+        :return: The response.
+        :raises LLMRateLimitError: If the request is still rate limited after the retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            delay = limiter.reserve(tokens)
+            if delay > 0:
+                time.sleep(delay)
+            try:
+                response = request()
+            except LLMRateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                limiter.rejected(self.backoff(attempt, e.retry_after))
+                continue
+            limiter.accepted()
+            return response
+
+    async def call_async(
+        self,
+        limiter: DeploymentLimiter,
+        tokens: int,
+        request: Callable[[], Awaitable[T]],
+    ) -> T:
+        """
+        Send a request within the budgets of the deployment, retrying it if it is rate limited, without blocking the
+        event loop.
+        :param limiter: The limiter of the deployment.
+        :param tokens: The estimated tokens of the request.
+        :param request: The callable returning the awaitable request.
+        :return: The response.
+        :raises LLMRateLimitError: If the request is still rate limited after the retries.
+        """
+        for attempt in range(self.max_retries + 1):
+            delay = limiter.reserve(tokens)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            try:
+                response = await request()
+            except LLMRateLimitError as e:
+                if attempt == self.max_retries:
+                    raise
+                limiter.rejected(self.backoff(attempt, e.retry_after))
+                continue
+            limiter.accepted()
+            return response
+
@@ -0,0 +1,331 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A persistent, content-addressed cache of the LLM responses.
+
+The responses are keyed by a canonical hash of the request: the agent type, the API type and model, the messages, with
+the base64 data of the images replaced by their hash, the sampling parameters and the number of completions. They are
+stored in a SQLite database, and the least recently used responses are evicted once the database exceeds its size.
+
+The cache has three modes:
+
+- off: the cache is not used.
+- read_through: the cached response is returned if any, otherwise the API is called and its response is cached. A
+  caller validating the responses, e.g. the JSON parsing of the agents, only gets and caches the valid ones, so that
+  its retries call the API again.
+- replay: only the cached responses are returned, and a miss raises an LLMCacheMiss error. It runs a batch of tasks
+  again offline and deterministically.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    LLM_CACHE_MODE = str(configs.get("LLM_CACHE_MODE", "off")).lower()
+    LLM_CACHE_PATH = configs.get("LLM_CACHE_PATH", "cache/llm_response_cache.db")
+    LLM_CACHE_MAX_SIZE_MB = float(configs.get("LLM_CACHE_MAX_SIZE_MB", 1024))
+else:
+    LLM_CACHE_MODE = "off"
+    LLM_CACHE_PATH = "cache/llm_response_cache.db"
+    LLM_CACHE_MAX_SIZE_MB = 1024
+
+
+CACHE_MODES = ("off", "read_through", "replay")
+
+# The strings longer than this and starting with "data:" are hashed in the cache key, e.g. the base64 images.
+_DATA_URL_MIN_LENGTH = 256
+
+
+class LLMCacheMiss(KeyError):
+    """
+    Raised in the replay mode when a request has no cached response.
+    """
+
+    pass
+
+
+class LLMResponseCache:
+    """
+    The SQLite cache of the LLM responses, shared by all the agents of the process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        path: str = LLM_CACHE_PATH,
+        mode: str = LLM_CACHE_MODE,
+        max_size_mb: float = LLM_CACHE_MAX_SIZE_MB,
+    ) -> None:
+        """
+        Open the cache.
+        :param path: The path of the SQLite database, ":memory:" for an in-memory cache.
+        :param mode: The mode, "off", "read_through" or "replay".
+        :param max_size_mb: The largest size of the cached responses, in MB.
+        """
+        if mode not in CACHE_MODES:
+            raise ValueError(
+                f"Unknown LLM cache mode: {mode}, expected one of {CACHE_MODES}."
+            )
+
+        self.path = path
+        self.mode = mode
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._connection = None
+        self._size = 0
+
+        if self.enabled:
+            self._open()
+
+    @classmethod
+    def get_instance(cls) -> "LLMResponseCache":
+        """
+        Get the cache of the configuration.
+        :return: The cache.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the cache is used.
+        :return: False in the off mode.
+        """
+        return self.mode != "off"
+
+    def _open(self) -> None:
+        """
+        Open the database and create the table of the responses.
+        """
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+
+        self._connection = sqlite3.connect(
+            self.path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                agent_type TEXT,
+                model TEXT,
+                response TEXT,
+                cost REAL,
+                size INTEGER,
+                created REAL,
+                accessed REAL
+            )
+            """)
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)"
+        )
+        self._size = self._connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+
+    @staticmethod
+    def _canonical(value: Any) -> Any:
+        """
+        Replace the data URLs of a request with their hash.
+        :param value: The value of the request.
+        :return: The value with the hashed data URLs.
+        """
+        if isinstance(value, str):
+            if len(value) > _DATA_URL_MIN_LENGTH and value.startswith("data:"):
+                header = value.split(",", 1)[0]
+                digest = hashlib.sha256(value.encode("utf-8")).hexdigest()
+                return f"{header},sha256:{digest}"
+            return value
+        if isinstance(value, dict):
+            return {
+                key: LLMResponseCache._canonical(item) for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [LLMResponseCache._canonical(item) for item in value]
+        return value
+
+    @staticmethod
+    def make_key(
+        agent_type: str,
+        agent_configs: Dict[str, Any],
+        messages: List[Dict[str, Any]],
+        n: int,
+        configs: Dict[str, Any],
+    ) -> str:
+        """
+        Compute the key of a request.
+        :param agent_type: The type of the agent, e.g. "APP_AGENT".
+        :param agent_configs: The configuration of the agent, with the API type and model.
+        :param messages: The messages of the request.
+        :param n: The number of completions.
+        :param configs: The configuration, with the sampling parameters.
+        :return: The hexadecimal SHA-256 of the canonical request.
+        """
+        request = {
+            "agent_type": agent_type,
+            "api_type": str(agent_configs.get("API_TYPE", "")).lower(),
+            "model": agent_configs.get("API_MODEL"),
+            "temperature": configs.get("TEMPERATURE"),
+            "top_p": configs.get("TOP_P"),
+            "max_tokens": configs.get("MAX_TOKENS"),
+            "n": n,
+            "messages": LLMResponseCache._canonical(messages),
+        }
+        canonical = json.dumps(
+            request,
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(",", ":"),
+            default=str,
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Tuple[List[Any], float]]:
+        """
+        Get a cached response.
+        :param key: The key of the request.
+        :return: The responses and the cost of the original request, or None on a miss in the read-through mode.
+        :raises LLMCacheMiss: On a miss in the replay mode.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, cost FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE responses SET accessed = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+
+        if row is None:
+            self.misses += 1
+            if self.mode == "replay":
+                raise LLMCacheMiss(
+                    f"No cached LLM response for the request {key} in {self.path}."
+                )
+            return None
+
+        self.hits += 1
+        return json.loads(row[0]), row[1]
+
+    def put(
+        self,
+        key: str,
+        responses: List[Any],
+        cost: Optional[float],
+        agent_type: str = "",
+        model: str = "",
+    ) -> bool:
+        """
+        Cache a response, and evict the least recently used responses beyond the size of the cache. The responses that
+        are not JSON serializable are not cached.
+        :param key: The key of the request.
+        :param responses: The responses.
+        :param cost: The cost of the request.
+        :param agent_type: The type of the agent, for the inspection of the cache.
+        :param model: The model, for the inspection of the cache.
+        :return: Whether the response is cached.
+        """
+        if not self.enabled:
+            return False
+
+        try:
+            response = json.dumps(responses, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return False
+
+        size = len(response.encode("utf-8"))
+        now = time.time()
+
+        with self._lock:
+            previous = self._connection.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, agent_type, model, response, cost, size, now, now),
+            )
+            self._size += size - (previous[0] if previous else 0)
+            self._evict()
+
+        return True
+
+    def _evict(self) -> None:
+        """
+        Evict the least recently used responses until the cache fits its size. The lock must be held.
+        """
+        while self._size > self.max_size:
+            rows = self._connection.execute(
+                "SELECT key, size FROM responses ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self._size = 0
+                return
+            evicted = []
+            for key, size in rows:
+                if self._size <= self.max_size:
+                    break
+                evicted.append((key,))
+                self._size -= size
+            self._connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def __len__(self) -> int:
+        """
+        Count the cached responses.
+        :return: The number of cached responses.
+        """
+        if not self.enabled:
+            return 0
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM responses"
+            ).fetchone()[0]
+
+    @property
+    def size(self) -> int:
+        """
+        The size of the cached responses, in bytes.
+        """
+        return self._size
+
+    def clear(self) -> None:
+        """
+        Remove all the cached responses.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._size = 0
+
+    def close(self) -> None:
+        """
+        Close the database.
+        """
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
@@ -0,0 +1,151 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The registry of the long-lived LLM services.
+
+A service is built once per (agent type, API type, model, configuration) and reused by every request, instead of
+resolving the service class, reading the configuration and creating the client at every call. The clients of the
+services keep their HTTP connection pools alive between the requests. The registry is thread-safe, so that the
+concurrent sessions of a process share the same services.
+"""
+
+import threading
+from typing import Any, Dict, Hashable, Iterable, Optional, Tuple
+
+from ufo.llm.base import BaseService
+from ufo.utils import print_with_color
+
+
+class ServiceRegistry:
+    """
+    The registry of the LLM services, one per (agent type, API type, model, configuration).
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        """
+        Initialize the registry.
+        """
+        self._services: Dict[Hashable, BaseService] = {}
+        self._configs: Dict[int, Dict[str, Any]] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "ServiceRegistry":
+        """
+        Get the registry of the process.
+        :return: The registry.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @staticmethod
+    def _service_key(
+        configs: Dict[str, Any], agent_type: str
+    ) -> Tuple[str, str, str, int]:
+        """
+        Get the key of the service of an agent.
+        :param configs: The configuration.
+        :param agent_type: The type of the agent, e.g. "APP_AGENT".
+        :return: The key of the service.
+        """
+        agent_configs = configs[agent_type]
+        return (
+            agent_type,
+            agent_configs["API_TYPE"].lower(),
+            agent_configs["API_MODEL"].lower(),
+            id(configs),
+        )
+
+    def get(self, configs: Dict[str, Any], agent_type: str) -> BaseService:
+        """
+        Get the service of an agent, building it at the first request.
+        :param configs: The configuration.
+        :param agent_type: The type of the agent, e.g. "APP_AGENT".
+        :return: The service.
+        """
+        key = self._service_key(configs, agent_type)
+
+        service = self._services.get(key)
+        if service is not None:
+            return service
+
+        with self._lock:
+            key_lock = self._locks.setdefault(key, threading.Lock())
+
+        # Only the requests of the same service wait for it to be built.
+        with key_lock:
+            service = self._services.get(key)
+            if service is None:
+                api_type, model = key[1], key[2]
+                service_class = BaseService.get_service(api_type, model)
+                if not service_class:
+                    raise ValueError(
+                        f"API_TYPE {configs[agent_type]['API_TYPE']} not supported"
+                    )
+                service = service_class(configs, agent_type=agent_type)
+                with self._lock:
+                    # Keep the configuration alive so that its id is not reused.
+                    self._configs[id(configs)] = configs
+                    self._services[key] = service
+
+        return service
+
+    def warm_up(
+        self,
+        configs: Dict[str, Any],
+        agent_types: Iterable[str],
+        background: bool = True,
+    ) -> Optional[threading.Thread]:
+        """
+        Build the services of the agents ahead of their first request. A service that cannot be built is skipped, its
+        error is raised again at the first request.
+        :param configs: The configuration.
+        :param agent_types: The types of the agents, e.g. ["HOST_AGENT", "APP_AGENT"].
+        :param background: Whether to build the services in a background thread.
+        :return: The background thread, or None.
+        """
+        agent_types = [
+            agent_type for agent_type in agent_types if agent_type in configs
+        ]
+
+        def build() -> None:
+            for agent_type in agent_types:
+                try:
+                    self.get(configs, agent_type)
+                except Exception as e:
+                    print_with_color(
+                        f"Warning: The LLM service of {agent_type} cannot be warmed up: {e}",
+                        "yellow",
+                    )
+
+        if not background:
+            build()
+            return None
+
+        thread = threading.Thread(target=build, name="llm-service-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def __len__(self) -> int:
+        """
+        Count the services.
+        :return: The number of services.
+        """
+        return len(self._services)
+
+    def reset(self) -> None:
+        """
+        Drop all the services, e.g. after a change of the configuration.
+        """
+        with self._lock:
+            self._services.clear()
+            self._configs.clear()
+            self._locks.clear()
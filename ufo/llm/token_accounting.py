@@ -0,0 +1,388 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The token accounting of the LLM requests, before they are sent.
+
+The text is counted with the tiktoken tokenizer if it is installed, and with 4 characters per token otherwise. The
+images are counted from their dimensions, read from the header of their data URL, with the tiling rules of the
+provider. The prompt of a step is fitted to the token budgets of the step and of the session by trimming its
+components in priority order, by default the blackboard screenshots, the blackboard trajectories, the history of the
+subtasks and the retrieved examples, the oldest or least relevant items first.
+"""
+
+import base64
+import io
+import json
+import math
+import struct
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    TOKEN_BUDGET_PER_STEP = int(configs.get("TOKEN_BUDGET_PER_STEP", 0))
+    TOKEN_BUDGET_PER_SESSION = int(configs.get("TOKEN_BUDGET_PER_SESSION", 0))
+    TOKEN_BUDGET_TRIM_ORDER = configs.get(
+        "TOKEN_BUDGET_TRIM_ORDER",
+        ["blackboard_screenshots", "blackboard_trajectories", "history", "examples"],
+    )
+else:
+    TOKEN_BUDGET_PER_STEP = 0
+    TOKEN_BUDGET_PER_SESSION = 0
+    TOKEN_BUDGET_TRIM_ORDER = [
+        "blackboard_screenshots",
+        "blackboard_trajectories",
+        "history",
+        "examples",
+    ]
+
+# The tokens of the role and separators of every message, and of the priming of the reply.
+_MESSAGE_OVERHEAD = 3
+_REPLY_OVERHEAD = 3
+
+# The tokens of an image whose dimensions cannot be read, e.g. a remote URL.
+_UNKNOWN_IMAGE_TOKENS = 765
+
+# The base64 characters of a data URL decoded to read the dimensions of a JPEG or WebP image from its header.
+_IMAGE_HEADER_CHARS = 64 * 1024
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding() -> Any:
+    """
+    Get the tiktoken encoding, loaded at the first call.
+    :return: The encoding, or None if tiktoken is not installed.
+    """
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+def count_text_tokens(text: str) -> int:
+    """
+    Count the tokens of a text.
+    :param text: The text.
+    :return: The number of tokens.
+    """
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is None:
+        return math.ceil(len(text) / 4)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def image_size(url: str) -> Optional[Tuple[int, int]]:
+    """
+    Read the dimensions of an image from its data URL. The PNG dimensions are read from the first bytes, the other
+    formats are opened with Pillow, from the first bytes if they hold the header, otherwise from the whole image.
+    :param url: The data URL of the image.
+    :return: The width and height, or None if they cannot be read.
+    """
+    if not url.startswith("data:image") or "," not in url:
+        return None
+    header, data = url.split(",", 1)
+
+    try:
+        if header.startswith("data:image/png"):
+            # The width and height follow the signature and the IHDR chunk header.
+            width, height = struct.unpack(">II", base64.b64decode(data[:32])[16:24])
+            return width, height
+
+        from PIL import Image
+
+        if len(data) > _IMAGE_HEADER_CHARS:
+            try:
+                prefix = base64.b64decode(data[:_IMAGE_HEADER_CHARS])
+                with Image.open(io.BytesIO(prefix)) as image:
+                    return image.size
+            except Exception:
+                pass
+
+        with Image.open(io.BytesIO(base64.b64decode(data))) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def image_tokens(width: int, height: int, provider: str = "openai") -> int:
+    """
+    Count the tokens of an image with the tiling rules of a provider.
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :param provider: The API type of the provider, e.g. "openai", "claude", "gemini" or "qwen".
+    :return: The number of tokens.
+    """
+    if provider == "claude":
+        # Resized to 1568 pixels on the long edge, a token per 750 pixels.
+        scale = min(1.0, 1568 / max(width, height))
+        return math.ceil(width * scale * height * scale / 750)
+
+    if provider == "gemini":
+        # 258 tokens for a small image, otherwise per tile of 768 x 768.
+        if width <= 384 and height <= 384:
+            return 258
+        return math.ceil(width / 768) * math.ceil(height / 768) * 258
+
+    if provider == "qwen":
+        # A token per patch of 28 x 28 pixels, within the pixel bounds of the model, and the vision markers.
+        pixels = min(max(width * height, 4 * 28 * 28), 16384 * 28 * 28)
+        scale = math.sqrt(pixels / (width * height))
+        return math.ceil(width * scale / 28) * math.ceil(height * scale / 28) + 2
+
+    # The OpenAI high detail: fitted in 2048 x 2048, the short side scaled to 768, 170 tokens per tile of 512 x 512.
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return math.ceil(width / 512) * math.ceil(height / 512) * 170 + 85
+
+
+def count_image_tokens(url: str, provider: str = "openai") -> int:
+    """
+    Count the tokens of an image.
+    :param url: The URL of the image.
+    :param provider: The API type of the provider.
+    :return: The number of tokens.
+    """
+    size = image_size(url)
+    if size is None:
+        return _UNKNOWN_IMAGE_TOKENS
+    return image_tokens(size[0], size[1], provider)
+
+
+def count_content_tokens(content: Any, provider: str = "openai") -> int:
+    """
+    Count the tokens of the content of a message, a text or a list of text and image parts.
+    :param content: The content.
+    :param provider: The API type of the provider.
+    :return: The number of tokens.
+    """
+    if isinstance(content, str):
+        return count_text_tokens(content)
+
+    tokens = 0
+    for part in content or []:
+        if part.get("type") == "text":
+            tokens += count_text_tokens(part.get("text", ""))
+        elif part.get("type") == "image_url":
+            image_url = part.get("image_url", {})
+            url = image_url.get("url", "") if isinstance(image_url, dict) else image_url
+            tokens += count_image_tokens(url, provider)
+        else:
+            tokens += count_text_tokens(json.dumps(part, ensure_ascii=False))
+    return tokens
+
+
+def count_message_tokens(
+    messages: List[Dict[str, Any]], provider: str = "openai"
+) -> int:
+    """
+    Count the prompt tokens of the messages of a request.
+    :param messages: The messages.
+    :param provider: The API type of the provider.
+    :return: The number of tokens.
+    """
+    tokens = _REPLY_OVERHEAD
+    for message in messages:
+        tokens += _MESSAGE_OVERHEAD + count_content_tokens(
+            message.get("content", ""), provider
+        )
+    return tokens
+
+
+def count_value_tokens(value: Any, provider: str = "openai") -> int:
+    """
+    Count the tokens of a component of a prompt: a text, an image URL, a list of content parts or image URLs, or a
+    value serialized as JSON.
+    :param value: The value.
+    :param provider: The API type of the provider.
+    :return: The number of tokens.
+    """
+    if isinstance(value, str):
+        if value.startswith("data:image"):
+            return count_image_tokens(value, provider)
+        return count_text_tokens(value)
+
+    if isinstance(value, list) and value:
+        if all(isinstance(item, dict) and "type" in item for item in value):
+            return count_content_tokens(value, provider)
+        if all(isinstance(item, str) and item.startswith("data:") for item in value):
+            return sum(count_image_tokens(item, provider) for item in value)
+
+    if not value:
+        return 0
+    return count_text_tokens(json.dumps(value, ensure_ascii=False, default=str))
+
+
+def get_provider(agent_configs: Dict[str, Any]) -> str:
+    """
+    Get the provider of an agent, for the tiling rules of its images.
+    :param agent_configs: The configuration of the agent.
+    :return: The API type of the provider.
+    """
+    return str(agent_configs.get("API_TYPE", "openai")).lower()
+
+
+def estimate_request_tokens(
+    messages: List[Dict[str, Any]], agent_configs: Dict[str, Any], max_tokens: int = 0
+) -> int:
+    """
+    Estimate the tokens of a request charged to the rate limits: the prompt and the completion tokens.
+    :param messages: The messages of the request.
+    :param agent_configs: The configuration of the agent.
+    :param max_tokens: The largest number of completion tokens.
+    :return: The estimated number of tokens.
+    """
+    return count_message_tokens(messages, get_provider(agent_configs)) + max_tokens
+
+
+def step_token_budget(
+    session_tokens: int,
+    per_step: int = TOKEN_BUDGET_PER_STEP,
+    per_session: int = TOKEN_BUDGET_PER_SESSION,
+) -> Optional[int]:
+    """
+    Get the token budget of the prompt of a step.
+    :param session_tokens: The prompt tokens already sent in the session.
+    :param per_step: The budget of a step, unlimited if 0.
+    :param per_session: The budget of the session, unlimited if 0.
+    :return: The budget, or None if unlimited.
+    """
+    budgets = []
+    if per_step > 0:
+        budgets.append(per_step)
+    if per_session > 0:
+        budgets.append(max(0, per_session - session_tokens))
+    return min(budgets) if budgets else None
+
+
+@dataclass
+class TrimmableComponent:
+    """
+    A component of a prompt made of items that can be dropped to fit the budget.
+    """
+
+    # The name of the component, e.g. "history".
+    name: str
+    # The number of items.
+    size: int
+    # Whether the latest items are kept, e.g. the history, or the first ones, e.g. the ranked examples.
+    keep_latest: bool = True
+
+
+@dataclass
+class PromptFit:
+    """
+    A prompt fitted to a token budget.
+    """
+
+    messages: List[Dict[str, Any]]
+    # The estimated prompt tokens.
+    tokens: int
+    # The budget, None if unlimited.
+    budget: Optional[int]
+    # The tokens of the components of the prompt, and of the rest of the prompt, e.g. the system prompt.
+    breakdown: Dict[str, int] = field(default_factory=dict)
+    # The number of items dropped from every trimmed component.
+    trimmed: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def over_budget(self) -> bool:
+        """
+        Whether the prompt still exceeds the budget once all the trimmable components are dropped.
+        """
+        return self.budget is not None and self.tokens > self.budget
+
+    def to_log(self) -> Dict[str, Any]:
+        """
+        Convert the fit to the entry of the request log.
+        :return: The entry.
+        """
+        return {
+            "total": self.tokens,
+            "budget": self.budget,
+            "components": self.breakdown,
+            "trimmed": self.trimmed,
+        }
+
+
+def keep_items(items: List[Any], kept: int, keep_latest: bool = True) -> List[Any]:
+    """
+    Keep a number of the items of a trimmable component.
+    :param items: The items.
+    :param kept: The number of items to keep.
+    :param keep_latest: Whether to keep the latest items or the first ones.
+    :return: The kept items.
+    """
+    if kept >= len(items):
+        return items
+    if kept <= 0:
+        return []
+    return items[-kept:] if keep_latest else items[:kept]
+
+
+def fit_prompt(
+    build: Callable[[Dict[str, int]], Tuple[List[Dict[str, Any]], Dict[str, Any]]],
+    trimmable: List[TrimmableComponent],
+    budget: Optional[int] = None,
+    provider: str = "openai",
+    trim_order: List[str] = TOKEN_BUDGET_TRIM_ORDER,
+) -> PromptFit:
+    """
+    Build a prompt within a token budget, dropping the items of the trimmable components in the trim order.
+    :param build: The callable building the prompt from the number of kept items of every trimmable component, and
+    returning the messages and the components of the prompt by name, for the breakdown.
+    :param trimmable: The trimmable components.
+    :param budget: The token budget, unlimited if None.
+    :param provider: The API type of the provider.
+    :param trim_order: The names of the components in the order they are trimmed, the others are never trimmed.
+    :return: The fitted prompt.
+    """
+    components_by_name = {component.name: component for component in trimmable}
+    kept = {component.name: component.size for component in trimmable}
+
+    messages, components = build(kept)
+    tokens = count_message_tokens(messages, provider)
+
+    for name in trim_order:
+        component = components_by_name.get(name)
+        if component is None:
+            continue
+
+        while budget is not None and tokens > budget and kept[name] > 0:
+            # Drop as many items as the average item covers the excess, then count again.
+            component_tokens = count_value_tokens(components.get(name), provider)
+            per_item = max(1, component_tokens // kept[name])
+            dropped = max(1, math.ceil((tokens - budget) / per_item))
+            kept[name] = max(0, kept[name] - dropped)
+
+            messages, components = build(kept)
+            tokens = count_message_tokens(messages, provider)
+
+    breakdown = {
+        name: count_value_tokens(value, provider) for name, value in components.items()
+    }
+    breakdown["other"] = max(0, tokens - sum(breakdown.values()))
+
+    trimmed = {
+        component.name: component.size - kept[component.name]
+        for component in trimmable
+        if kept[component.name] < component.size
+    }
+
+    return PromptFit(messages, tokens, budget, breakdown, trimmed)
+
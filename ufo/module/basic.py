@@ -17,7 +17,6 @@ For more details definition of the state pattern, please refer to the state.py m
 import json
 import logging
 import os
-import time
 from abc import ABC, abstractmethod
 from typing import Dict, Optional
 
@@ -33,8 +32,11 @@ from ufo.automator.ui_control import ui_tree
 from ufo.automator.ui_control.screenshot import PhotographerFacade
 from ufo.config.config import Config
 from ufo.experience.summarizer import ExperienceSummarizer
+from ufo.llm.service_registry import ServiceRegistry
 from ufo.module.context import Context, ContextNames
 from ufo.trajectory.parser import Trajectory
+from ufo.utils.artifact_sink import ArtifactSink
+from ufo.utils.tracing import record_trace
 
 configs = Config.get_instance().config_data
 
@@ -112,7 +114,9 @@ class BaseRound(ABC):
 
             # If the subtask ends, capture the last snapshot of the application.
             if self.state.is_subtask_end():
-                time.sleep(configs["SLEEP_TIME"])
+                PhotographerFacade.wait_until_settled(
+                    self.application_window, configs["SLEEP_TIME"]
+                )
                 self.capture_last_snapshot(sub_round_id=self.subtask_amount)
                 self.subtask_amount += 1
 
@@ -123,6 +127,9 @@ class BaseRound(ABC):
         if self.application_window is not None:
             self.capture_last_snapshot()
 
+        # Wait for the artifacts of the round to be written before the round ends.
+        ArtifactSink.get_instance().flush()
+
         if self._should_evaluate:
             self.evaluation()
 
@@ -274,7 +281,10 @@ class BaseRound(ABC):
                 )
 
             if configs.get("SAVE_UI_TREE", False):
-                step_ui_tree = ui_tree.UITree(self.application_window)
+                step_ui_tree = ui_tree.UITree(
+                    self.application_window,
+                    incremental=configs.get("UI_TREE_INCREMENTAL", True),
+                )
 
                 ui_tree_path = os.path.join(self.log_path, "ui_trees")
 
@@ -382,31 +392,42 @@ class BaseSession(ABC):
             configs["API_PROMPT"],
         )
 
+        # Build the LLM services of the agents in the background, while the session starts.
+        if configs.get("LLM_SERVICE_WARM_UP", True):
+            ServiceRegistry.get_instance().warm_up(
+                configs, ["HOST_AGENT", "APP_AGENT", "BACKUP_AGENT"]
+            )
+
     def run(self) -> None:
         """
         Run the session.
         """
 
-        while not self.is_finished():
+        # The spans of the steps are exported to the log folder of the session.
+        with record_trace(self.log_path):
+            while not self.is_finished():
 
-            round = self.create_new_round()
-            if round is None:
-                break
-            round.run()
+                round = self.create_new_round()
+                if round is None:
+                    break
+                round.run()
 
-        if self.application_window is not None:
-            self.capture_last_snapshot()
+            if self.application_window is not None:
+                self.capture_last_snapshot()
 
-        if self._should_evaluate and not self.is_error():
-            self.evaluation()
+            # The artifacts are written in the background, wait for them before reading the logs.
+            ArtifactSink.get_instance().flush()
 
-        if configs.get("LOG_TO_MARKDOWN", True):
+            if self._should_evaluate and not self.is_error():
+                self.evaluation()
 
-            file_path = self.log_path
-            trajectory = Trajectory(file_path)
-            trajectory.to_markdown(file_path + "/output.md")
+            if configs.get("LOG_TO_MARKDOWN", True):
 
-        self.print_cost()
+                file_path = self.log_path
+                trajectory = Trajectory(file_path)
+                trajectory.to_markdown(file_path + "/output.md")
+
+            self.print_cost()
 
     @abstractmethod
     def create_new_round(self) -> Optional[BaseRound]:
@@ -725,7 +746,10 @@ class BaseSession(ABC):
                 )
 
             if configs.get("SAVE_UI_TREE", False):
-                step_ui_tree = ui_tree.UITree(self.application_window)
+                step_ui_tree = ui_tree.UITree(
+                    self.application_window,
+                    incremental=configs.get("UI_TREE_INCREMENTAL", True),
+                )
 
                 ui_tree_path = os.path.join(self.log_path, "ui_trees")
 
@@ -39,6 +39,7 @@ class ContextNames(Enum):
     APPLICATION_ROOT_NAME = "APPLICATION_ROOT_NAME"  # The root name of the application
     CONTROL_REANNOTATION = "CONTROL_REANNOTATION"  # The re-annotation of the control provided by the AppAgent
     SESSION_COST = "SESSION_COST"  # The cost of the session
+    SESSION_TOKENS = "SESSION_TOKENS"  # The estimated prompt tokens of the session
     ROUND_COST = "ROUND_COST"  # The cost of all rounds
     ROUND_SUBTASK_AMOUNT = (
         "ROUND_SUBTASK_AMOUNT"  # The amount of subtasks in all rounds
@@ -71,6 +72,7 @@ class ContextNames(Enum):
             or self == ContextNames.CURRENT_ROUND_STEP
             or self == ContextNames.CURRENT_ROUND_SUBTASK_AMOUNT
             or self == ContextNames.ID
+            or self == ContextNames.SESSION_TOKENS
         ):
             return 0
         elif (
@@ -123,6 +125,7 @@ class ContextNames(Enum):
             or self == ContextNames.CURRENT_ROUND_STEP
             or self == ContextNames.ID
             or self == ContextNames.ROUND_SUBTASK_AMOUNT
+            or self == ContextNames.SESSION_TOKENS
         ):
             return int
         elif (
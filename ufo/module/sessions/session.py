@@ -19,6 +19,8 @@ from ufo.module.basic import BaseRound, BaseSession
 from ufo.module.context import ContextNames
 from ufo.module.sessions.plan_reader import PlanReader
 from ufo.trajectory.parser import Trajectory
+from ufo.utils.artifact_sink import ArtifactSink
+from ufo.utils.tracing import record_trace
 from ufo.automator.ui_control.inspector import ControlInspectorFacade
 
 configs = Config.get_instance().config_data
@@ -624,24 +626,29 @@ class OpenAIOperatorSession(Session):
         Run the session.
         """
 
-        while not self.is_finished():
+        # The spans of the steps are exported to the log folder of the session.
+        with record_trace(self.log_path):
+            while not self.is_finished():
 
-            round = self.create_new_round()
-            self.application_window = ControlInspectorFacade().desktop
+                round = self.create_new_round()
+                self.application_window = ControlInspectorFacade().desktop
 
-            if round is None:
-                break
-            round.run()
+                if round is None:
+                    break
+                round.run()
 
-        self.capture_last_snapshot()
+            self.capture_last_snapshot()
 
-        if self._should_evaluate and not self.is_error():
-            self.evaluation()
+            # The artifacts are written in the background, wait for them before reading the logs.
+            ArtifactSink.get_instance().flush()
 
-        if configs.get("LOG_TO_MARKDOWN", True):
+            if self._should_evaluate and not self.is_error():
+                self.evaluation()
 
-            file_path = self.log_path
-            trajectory = Trajectory(file_path)
-            trajectory.to_markdown(file_path + "/output.md")
+            if configs.get("LOG_TO_MARKDOWN", True):
 
-        self.print_cost()
+                file_path = self.log_path
+                trajectory = Trajectory(file_path)
+                trajectory.to_markdown(file_path + "/output.md")
+
+            self.print_cost()
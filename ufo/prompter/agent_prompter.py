@@ -6,6 +6,7 @@ from typing import Any, Dict, List, Optional
 
 from ufo.config.config import Config
 from ufo.prompter.basic import BasicPrompter
+from ufo.prompter.template_cache import PromptTemplateCache, content_digest
 
 configs = Config.get_instance().config_data
 
@@ -31,18 +32,30 @@ class HostAgentPrompter(BasicPrompter):
         """
         super().__init__(is_visual, prompt_template, example_prompt_template)
         self.api_prompt_template = self.load_prompt_template(api_prompt_template)
+        self.api_template_digest = self.prompt_template_digest(api_prompt_template)
 
     def system_prompt_construction(self) -> str:
         """
-        Construct the prompt for app selection.
+        Construct the prompt for app selection. The prompt is memoized for the templates of the prompter.
         return: The prompt for app selection.
         """
-        apis = self.api_prompt_helper(verbose=0)
-        examples = self.examples_prompt_helper()
-
         system_key = "system" if self.is_visual else "system_nonvisual"
 
-        return self.prompt_template[system_key].format(apis=apis, examples=examples)
+        def build() -> str:
+            apis = self.api_prompt_helper(verbose=0)
+            examples = self.examples_prompt_helper()
+
+            return self.prompt_template[system_key].format(apis=apis, examples=examples)
+
+        key = (
+            self.__class__.__name__,
+            system_key,
+            self.is_visual,
+            self.template_digest,
+            self.api_template_digest,
+            self.example_template_digest,
+        )
+        return PromptTemplateCache.get_instance().memoize(key, build)
 
     def user_prompt_construction(
         self,
@@ -200,22 +213,25 @@ class AppAgentPrompter(BasicPrompter):
         self.root_name = root_name
         self.app_prompter = APIPromptLoader(self.root_name)
         self.api_prompt_template = self.load_prompt_template(api_prompt_template)
+        self.api_template_digest = self.prompt_template_digest(api_prompt_template)
 
         self.app_api_prompt_template = None
+        self.app_api_template_digest = ""
 
         if configs.get("USE_APIS", False):
             self.app_api_prompt_template = self.app_prompter.load_api_prompt()
+            self.app_api_template_digest = self.prompt_template_digest(
+                self.app_prompter.prompt_address
+            )
 
     def system_prompt_construction(self, additional_examples: List[str] = []) -> str:
         """
-        Construct the prompt for app selection.
+        Construct the prompt for app selection. The prompt is memoized for the templates of the prompter and the
+        additional examples.
         :param additional_examples: The additional examples added to the prompt.
         return: The prompt for app selection.
         """
 
-        apis = self.api_prompt_helper(verbose=1)
-        examples = self.examples_prompt_helper(additional_examples=additional_examples)
-
         if configs.get("ACTION_SEQUENCE", False):
             system_key = "system_as"
         else:
@@ -223,7 +239,25 @@ class AppAgentPrompter(BasicPrompter):
         if not self.is_visual:
             system_key += "_nonvisual"
 
-        return self.prompt_template[system_key].format(apis=apis, examples=examples)
+        def build() -> str:
+            apis = self.api_prompt_helper(verbose=1)
+            examples = self.examples_prompt_helper(
+                additional_examples=additional_examples
+            )
+
+            return self.prompt_template[system_key].format(apis=apis, examples=examples)
+
+        key = (
+            self.__class__.__name__,
+            system_key,
+            self.is_visual,
+            self.template_digest,
+            self.api_template_digest,
+            self.app_api_template_digest,
+            self.example_template_digest,
+            content_digest(additional_examples) if additional_examples else "",
+        )
+        return PromptTemplateCache.get_instance().memoize(key, build)
 
     def user_prompt_construction(
         self,
@@ -326,11 +360,35 @@ class AppAgentPrompter(BasicPrompter):
 
         return user_content
 
+    def retrieved_examples_content(
+        self, additional_examples: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """
+        Construct the user content of the retrieved examples, kept out of the system prompt so that the system prompt
+        is identical at every step and cached by the providers.
+        :param additional_examples: The retrieved examples.
+        return: The user content, empty if there is no retrieved example.
+        """
+        if not additional_examples:
+            return []
+
+        return [
+            {
+                "type": "text",
+                "text": self.examples_prompt_helper(
+                    header="## Retrieved Response Examples",
+                    additional_examples=additional_examples,
+                    include_static_examples=False,
+                ),
+            }
+        ]
+
     def examples_prompt_helper(
         self,
         header: str = "## Response Examples",
         separator: str = "Example",
         additional_examples: List[Dict[str, Any]] = [],
+        include_static_examples: bool = True,
     ) -> str:
         """
         Construct the prompt for examples.
@@ -338,6 +396,7 @@ class AppAgentPrompter(BasicPrompter):
         :param header: The header of the prompt.
         :param separator: The separator of the prompt.
         :param additional_examples: The additional examples added to the prompt.
+        :param include_static_examples: Whether to include the examples of the prompt template.
         return: The prompt for examples.
         """
 
@@ -352,16 +411,27 @@ class AppAgentPrompter(BasicPrompter):
             {response}"""
 
         if configs.get("ACTION_SEQUENCE", False):
-            for example in additional_examples:
-                example["Response"] = self.action2action_sequence(
-                    example.get("Response", {})
-                )
+            # Convert copies, the retrieved examples are reused when the prompt is built again.
+            additional_examples = [
+                {
+                    **example,
+                    "Response": self.action2action_sequence(
+                        example.get("Response", {})
+                    ),
+                }
+                for example in additional_examples
+            ]
 
-        example_dict = [
-            self.example_prompt_template[key]
-            for key in self.example_prompt_template.keys()
-            if key.startswith("example")
-        ] + additional_examples
+        static_examples = (
+            [
+                self.example_prompt_template[key]
+                for key in self.example_prompt_template.keys()
+                if key.startswith("example")
+            ]
+            if include_static_examples
+            else []
+        )
+        example_dict = static_examples + additional_examples
 
         example_list = []
 
@@ -644,12 +714,20 @@ class APIPromptLoader:
         self.root_name = root_name
         self.api_prompt_key = "class_name"
 
+    @property
+    def prompt_address(self) -> str:
+        """
+        The path of the prompt template for the COM APIs of the app.
+        :return: The path, empty if the app has no API.
+        """
+        return configs["APP_API_PROMPT_ADDRESS"].get(self.root_name, None) or ""
+
     def load_api_prompt(self) -> Dict[str, str]:
         """
         Load the prompt template for COM APIs.
         :return: The prompt template for COM APIs.
         """
-        prompt_address = configs["APP_API_PROMPT_ADDRESS"].get(self.root_name, None)
+        prompt_address = self.prompt_address
 
         if prompt_address:
             return AppAgentPrompter.load_prompt_template(prompt_address, None)
@@ -7,6 +7,7 @@ from typing import Dict, List
 
 import yaml
 
+from ufo.prompter.template_cache import PromptTemplateCache
 from ufo.utils import print_with_color
 
 
@@ -36,33 +37,65 @@ class BasicPrompter(ABC):
         else:
             self.example_prompt_template = ""
 
+        # The digests of the templates, to key the memoized system prompts.
+        self.template_digest = self.prompt_template_digest(prompt_template, is_visual)
+        self.example_template_digest = self.prompt_template_digest(
+            example_prompt_template, is_visual
+        )
+
+    @staticmethod
+    def template_path(template_path: str, is_visual=None) -> str:
+        """
+        Get the path of the prompt template for the visual or nonvisual mode.
+        :param template_path: The path of the prompt template, with a {mode} placeholder.
+        :param is_visual: Whether the request is for visual model, None to use the path as it is.
+        :return: The path of the prompt template.
+        """
+        if is_visual == None:
+            return template_path
+        return template_path.format(mode="visual" if is_visual == True else "nonvisual")
+
     @staticmethod
     def load_prompt_template(template_path: str, is_visual=None) -> Dict[str, str]:
         """
-        Load the prompt template.
+        Load the prompt template. The templates are parsed once per process, see PromptTemplateCache.
         :return: The prompt template.
         """
 
-        if is_visual == None:
-            path = template_path
-        else:
-            path = template_path.format(
-                mode="visual" if is_visual == True else "nonvisual"
-            )
+        path = BasicPrompter.template_path(template_path, is_visual)
 
         if not path:
             return {}
 
         if os.path.exists(path):
             try:
-                prompt = yaml.safe_load(open(path, "r", encoding="utf-8"))
+                prompt = PromptTemplateCache.get_instance().load(path)
             except yaml.YAMLError as exc:
                 print_with_color(f"Error loading prompt template: {exc}", "yellow")
+                prompt = {}
         else:
             raise FileNotFoundError(f"Prompt template not found at {path}")
 
         return prompt
 
+    @staticmethod
+    def prompt_template_digest(template_path: str, is_visual=None) -> str:
+        """
+        Get the digest of a prompt template.
+        :param template_path: The path of the prompt template.
+        :param is_visual: Whether the request is for visual model, None to use the path as it is.
+        :return: The digest, empty if there is no template.
+        """
+        if not template_path:
+            return ""
+        path = BasicPrompter.template_path(template_path, is_visual)
+        if not os.path.exists(path):
+            return ""
+        try:
+            return PromptTemplateCache.get_instance().digest(path)
+        except yaml.YAMLError:
+            return ""
+
     @staticmethod
     def prompt_construction(
         system_prompt: str, user_content: List[Dict[str, str]]
@@ -0,0 +1,143 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The process-wide cache of the prompt templates and of the formatted system prompts.
+
+A YAML template is parsed once per process and reloaded only when its modification time or size changes, instead of
+once per prompter, i.e. for every new agent. Every prompter gets its own copy, so that the templates can be modified
+safely. The system prompts are formatted once per (template, visual mode, API set, example set) and reused at every
+step and by every agent with the same templates.
+"""
+
+import copy
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+import yaml
+
+
+def content_digest(value: Any) -> str:
+    """
+    Compute the digest of a value, e.g. the retrieved examples of a prompt.
+    :param value: The value, serializable as JSON.
+    :return: The hexadecimal SHA-1 of the canonical JSON of the value.
+    """
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+class PromptTemplateCache:
+    """
+    The cache of the prompt templates and of the formatted system prompts, shared by all the prompters of the process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_prompts: int = 256) -> None:
+        """
+        Initialize the cache.
+        :param max_prompts: The largest number of formatted system prompts kept, the least recently used are evicted.
+        """
+        self.max_prompts = max_prompts
+        self.hits = 0
+        self.misses = 0
+
+        # The parsed templates by path: the modification time and size, the digest of the file and the template.
+        self._templates: Dict[str, Tuple[Tuple[int, int], str, Dict[str, Any]]] = {}
+        self._prompts: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "PromptTemplateCache":
+        """
+        Get the cache of the process.
+        :return: The cache.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _entry(self, path: str) -> Tuple[Tuple[int, int], str, Dict[str, Any]]:
+        """
+        Get the cache entry of a template, parsing the file if it is new or modified.
+        :param path: The path of the template.
+        :return: The entry.
+        :raises yaml.YAMLError: If the template cannot be parsed.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        version = (stat.st_mtime_ns, stat.st_size)
+
+        entry = self._templates.get(path)
+        if entry is not None and entry[0] == version:
+            return entry
+
+        with open(path, "rb") as file:
+            data = file.read()
+        template = yaml.safe_load(data.decode("utf-8"))
+        entry = (version, hashlib.sha1(data).hexdigest(), template)
+
+        with self._lock:
+            self._templates[path] = entry
+        return entry
+
+    def load(self, path: str) -> Dict[str, Any]:
+        """
+        Load a template.
+        :param path: The path of the template.
+        :return: A copy of the parsed template.
+        :raises yaml.YAMLError: If the template cannot be parsed.
+        """
+        return copy.deepcopy(self._entry(path)[2])
+
+    def digest(self, path: str) -> str:
+        """
+        Get the digest of a template, to key the prompts formatted from it.
+        :param path: The path of the template, empty for no template.
+        :return: The hexadecimal SHA-1 of the file, empty for no template.
+        """
+        if not path:
+            return ""
+        return self._entry(path)[1]
+
+    def memoize(self, key: Hashable, build: Callable[[], str]) -> str:
+        """
+        Get a formatted prompt, formatting it at the first request.
+        :param key: The key of the prompt, with the digests of the templates and of the examples it is formatted from.
+        :param build: The callable formatting the prompt.
+        :return: The prompt.
+        """
+        with self._lock:
+            prompt = self._prompts.get(key)
+            if prompt is not None:
+                self._prompts.move_to_end(key)
+                self.hits += 1
+                return prompt
+
+        prompt = build()
+
+        with self._lock:
+            self.misses += 1
+            self._prompts[key] = prompt
+            while len(self._prompts) > self.max_prompts:
+                self._prompts.popitem(last=False)
+        return prompt
+
+    def clear(self) -> None:
+        """
+        Drop all the cached templates and prompts.
+        """
+        with self._lock:
+            self._templates.clear()
+            self._prompts.clear()
+            self.hits = 0
+            self.misses = 0
+
@@ -0,0 +1,338 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The process-wide registry of the FAISS vector stores of the retrievers.
+
+A store saved with FAISS.save_local is loaded once per process and shared by all the retrievers, instead of once per
+retriever, i.e. for every new AppAgent in every round and every session of a batch. The docstore, the pickle of the
+documents, is read with the index but only unpickled at the first search.
+
+A store is keyed by its path, and reloaded only when its files change on disk. The retrievers hold a reference to the
+version they loaded: a reload serves the new version to the new retrievers, while the old version is kept until its
+last retriever is released. The stores are written with save_index, which replaces the files atomically, so that a
+store is never loaded from half-written files.
+"""
+
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+import weakref
+from collections.abc import MutableMapping
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+import faiss
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+
+from ufo.rag.retrieval_cache import RetrievalCache, get_query_embedding
+from ufo.utils import print_with_color
+
+# The file names of FAISS.save_local.
+INDEX_NAME = "index"
+
+# The version of a store: the modification time and size of its index and docstore files.
+IndexVersion = Tuple[int, int, int, int]
+
+
+def index_files(path: str) -> Tuple[str, str]:
+    """
+    Get the files of a store.
+    :param path: The folder of the store.
+    :return: The paths of the FAISS index and of the pickled docstore.
+    """
+    return (
+        os.path.join(path, f"{INDEX_NAME}.faiss"),
+        os.path.join(path, f"{INDEX_NAME}.pkl"),
+    )
+
+
+def index_version(path: str) -> IndexVersion:
+    """
+    Get the version of a store.
+    :param path: The folder of the store.
+    :return: The version.
+    :raises FileNotFoundError: If the store does not exist.
+    """
+    index_stat, docstore_stat = (os.stat(file) for file in index_files(path))
+    return (
+        index_stat.st_mtime_ns,
+        index_stat.st_size,
+        docstore_stat.st_mtime_ns,
+        docstore_stat.st_size,
+    )
+
+
+class _LazyPickle:
+    """
+    The docstore and the mapping from the FAISS ids to the docstore ids of a store, unpickled at the first access.
+    The file is read at once, so that the pickle is the one of the loaded index, even if the store is replaced on disk
+    in the meantime, and so that the file is not held open, which would prevent its replacement on Windows.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Initialize the loader.
+        :param path: The path of the pickle.
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self._data: Optional[bytes] = file.read()
+        self._value: Optional[Tuple[Docstore, Dict[int, str]]] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Tuple[Docstore, Dict[int, str]]:
+        """
+        Get the docstore and the mapping, loading them at the first call.
+        :return: The docstore and the mapping.
+        """
+        if self._value is None:
+            with self._lock:
+                if self._value is None:
+                    self._value = pickle.loads(self._data)
+                    self._data = None
+        return self._value
+
+
+class LazyDocstore(Docstore, AddableMixin):
+    """
+    A docstore loaded at the first access.
+    """
+
+    def __init__(self, loader: _LazyPickle) -> None:
+        """
+        Initialize the docstore.
+        :param loader: The loader of the pickle of the store.
+        """
+        self._loader = loader
+
+    @property
+    def _docstore(self) -> Docstore:
+        return self._loader.get()[0]
+
+    @property
+    def _dict(self) -> Dict[str, Any]:
+        return self._docstore._dict
+
+    def search(self, search: str) -> Any:
+        return self._docstore.search(search)
+
+    def add(self, texts: Dict[str, Any]) -> None:
+        self._docstore.add(texts)
+
+    def delete(self, ids: list) -> None:
+        self._docstore.delete(ids)
+
+
+class LazyIdMapping(MutableMapping):
+    """
+    The mapping from the FAISS ids to the docstore ids of a store, loaded at the first access.
+    """
+
+    def __init__(self, loader: _LazyPickle) -> None:
+        """
+        Initialize the mapping.
+        :param loader: The loader of the pickle of the store.
+        """
+        self._loader = loader
+
+    @property
+    def _mapping(self) -> Dict[int, str]:
+        return self._loader.get()[1]
+
+    def __getitem__(self, key: int) -> str:
+        return self._mapping[key]
+
+    def __setitem__(self, key: int, value: str) -> None:
+        self._mapping[key] = value
+
+    def __delitem__(self, key: int) -> None:
+        del self._mapping[key]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._mapping)
+
+    def __len__(self) -> int:
+        return len(self._mapping)
+
+
+@dataclass
+class IndexHandle:
+    """
+    A reference to a version of a store, held by a retriever.
+    """
+
+    path: str
+    version: IndexVersion
+    store: FAISS
+
+
+@dataclass
+class _IndexEntry:
+    """
+    A loaded version of a store, with the number of retrievers holding it.
+    """
+
+    version: IndexVersion
+    store: FAISS
+    refs: int = 0
+
+
+class VectorIndexRegistry:
+    """
+    The registry of the vector stores, shared by all the retrievers of the process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self) -> None:
+        """
+        Initialize the registry.
+        """
+        self.loads = 0
+        self.hits = 0
+
+        # The loaded versions by path, the last loaded one is the current one.
+        self._entries: Dict[str, Dict[IndexVersion, _IndexEntry]] = {}
+        self._current: Dict[str, IndexVersion] = {}
+        self._lock = threading.Lock()
+        self._path_locks: Dict[str, threading.Lock] = {}
+
+    @classmethod
+    def get_instance(cls) -> "VectorIndexRegistry":
+        """
+        Get the registry of the process.
+        :return: The registry.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def _load(self, path: str) -> FAISS:
+        """
+        Load a store, as FAISS.load_local but with the docstore loaded lazily and the query embeddings memoized.
+        :param path: The folder of the store.
+        :return: The store.
+        """
+        index_file, docstore_file = index_files(path)
+        loader = _LazyPickle(docstore_file)
+        return FAISS(
+            get_query_embedding(),
+            faiss.read_index(index_file),
+            LazyDocstore(loader),
+            LazyIdMapping(loader),
+        )
+
+    def acquire(self, path: str, owner: Any = None) -> IndexHandle:
+        """
+        Get the current version of a store, loading it if it is new or changed on disk.
+        :param path: The folder of the store.
+        :param owner: The object holding the reference, released when the object is collected. If None, the reference
+        must be released with release.
+        :return: The handle of the store.
+        :raises FileNotFoundError: If the store does not exist.
+        """
+        path = os.path.abspath(path)
+        version = index_version(path)
+
+        with self._lock:
+            path_lock = self._path_locks.setdefault(path, threading.Lock())
+
+        # Only the retrievers of the same store wait for it to be loaded.
+        with path_lock:
+            with self._lock:
+                entry = self._entries.get(path, {}).get(version)
+
+            if entry is None:
+                print_with_color(f"Loading the vector store from {path}...", "cyan")
+                store = self._load(path)
+                with self._lock:
+                    self.loads += 1
+                    entry = _IndexEntry(version, store)
+                    versions = self._entries.setdefault(path, {})
+                    versions[version] = entry
+                    previous = self._current.get(path)
+                    self._current[path] = version
+                    # The previous version is kept until its last retriever is released.
+                    if (
+                        previous is not None
+                        and previous != version
+                        and versions[previous].refs == 0
+                    ):
+                        del versions[previous]
+                if previous is not None and previous != version:
+                    # The results retrieved from the previous versions are stale.
+                    RetrievalCache.get_instance().invalidate(path)
+            else:
+                with self._lock:
+                    self.hits += 1
+
+            with self._lock:
+                entry.refs += 1
+
+        handle = IndexHandle(path, version, entry.store)
+        if owner is not None:
+            weakref.finalize(owner, self.release, handle)
+        return handle
+
+    def release(self, handle: IndexHandle) -> None:
+        """
+        Release a reference to a store, dropping its version if it is no longer current nor held.
+        :param handle: The handle of the store.
+        """
+        with self._lock:
+            versions = self._entries.get(handle.path, {})
+            entry = versions.get(handle.version)
+            if entry is None:
+                return
+            entry.refs = max(entry.refs - 1, 0)
+            if entry.refs == 0 and self._current.get(handle.path) != handle.version:
+                del versions[handle.version]
+
+    def refs(self, path: str) -> Dict[IndexVersion, int]:
+        """
+        Get the references to the loaded versions of a store.
+        :param path: The folder of the store.
+        :return: The number of references by version.
+        """
+        with self._lock:
+            return {
+                version: entry.refs
+                for version, entry in self._entries.get(
+                    os.path.abspath(path), {}
+                ).items()
+            }
+
+    def clear(self) -> None:
+        """
+        Drop all the stores which are not held by a retriever.
+        """
+        with self._lock:
+            for path, versions in self._entries.items():
+                for version in [v for v, entry in versions.items() if entry.refs == 0]:
+                    del versions[version]
+                if self._current.get(path) not in versions:
+                    self._current.pop(path, None)
+
+
+def save_index(store: FAISS, path: str) -> None:
+    """
+    Save a store as FAISS.save_local, replacing its files atomically, so that the registry never loads a half-written
+    store and reloads the new version.
+    :param store: The store.
+    :param path: The folder of the store.
+    """
+    os.makedirs(path, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=path)
+    try:
+        store.save_local(staging, INDEX_NAME)
+        for staged, target in zip(index_files(staging), index_files(path)):
+            os.replace(staged, target)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
@@ -0,0 +1,227 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The caches of the retrievals of the AppAgent.
+
+The AppAgent retrieves the demonstrations, the experiences and the help documents of its subtask at every step, and
+the subtask rarely changes between the steps. The results of a retrieval are cached by the retriever, the version of
+its vector store, the query, the number of documents and the filter, and dropped when the store is reloaded. The
+embeddings of the queries are memoized on their own, so that a query is embedded once for all the retrievers sharing
+the embedding model.
+"""
+
+import functools
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from ufo.config.config import Config
+from ufo.utils import get_hugginface_embedding
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    RAG_RETRIEVAL_CACHE_SIZE = int(configs.get("RAG_RETRIEVAL_CACHE_SIZE", 256))
+    RAG_QUERY_EMBEDDING_CACHE_SIZE = int(
+        configs.get("RAG_QUERY_EMBEDDING_CACHE_SIZE", 1024)
+    )
+else:
+    RAG_RETRIEVAL_CACHE_SIZE = 256
+    RAG_QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+
+class _LRU:
+    """
+    A thread-safe least recently used mapping.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        """
+        Initialize the mapping.
+        :param max_size: The largest number of entries, 0 to store nothing.
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """
+        Get an entry.
+        :param key: The key.
+        :return: The value, None on a miss.
+        """
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """
+        Store an entry, evicting the least recently used ones beyond the size.
+        :param key: The key.
+        :param value: The value.
+        """
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, predicate) -> None:
+        """
+        Drop the entries whose key matches a predicate.
+        :param predicate: The predicate of the keys.
+        """
+        with self._lock:
+            for key in [key for key in self._entries if predicate(key)]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Drop all the entries.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+class RetrievalCache:
+    """
+    The cache of the retrieval results, shared by all the retrievers of the process.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, max_size: int = RAG_RETRIEVAL_CACHE_SIZE) -> None:
+        """
+        Initialize the cache.
+        :param max_size: The largest number of results kept, 0 to disable the cache.
+        """
+        self._results = _LRU(max_size)
+
+    @classmethod
+    def get_instance(cls) -> "RetrievalCache":
+        """
+        Get the cache of the process.
+        :return: The cache.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    @property
+    def enabled(self) -> bool:
+        """
+        Whether the results are cached.
+        """
+        return self._results.max_size > 0
+
+    @staticmethod
+    def make_key(
+        identity: Hashable,
+        version: Hashable,
+        query: str,
+        top_k: int,
+        filter: Any = None,
+        filter_key: Optional[Hashable] = None,
+    ) -> Optional[Hashable]:
+        """
+        Make the key of a retrieval.
+        :param identity: The identity of the retriever, e.g. the path of its vector store.
+        :param version: The version of the vector store.
+        :param query: The query.
+        :param top_k: The number of documents retrieved.
+        :param filter: The filter of the documents.
+        :param filter_key: The key of a callable filter, identifying the documents it keeps.
+        :return: The key, None if the retrieval cannot be cached, i.e. with a callable filter without a key.
+        """
+        if filter_key is None and filter is not None:
+            if callable(filter):
+                return None
+            filter_key = json.dumps(filter, sort_keys=True, default=str)
+        return (identity, version, query, top_k, filter_key)
+
+    def get(self, key: Hashable) -> Optional[List[Any]]:
+        """
+        Get the results of a retrieval.
+        :param key: The key of the retrieval.
+        :return: A copy of the list of the retrieved documents, None on a miss.
+        """
+        results = self._results.get(key)
+        return list(results) if results is not None else None
+
+    def put(self, key: Hashable, results: List[Any]) -> None:
+        """
+        Store the results of a retrieval.
+        :param key: The key of the retrieval.
+        :param results: The retrieved documents.
+        """
+        self._results.put(key, list(results))
+
+    def invalidate(self, identity: Hashable) -> None:
+        """
+        Drop the results of a retriever, e.g. when its vector store is reloaded.
+        :param identity: The identity of the retriever.
+        """
+        self._results.discard(lambda key: key[0] == identity)
+
+    def clear(self) -> None:
+        """
+        Drop all the results.
+        """
+        self._results.clear()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    An embedding model memoizing the embeddings of the queries. The embeddings of the documents are not cached.
+    """
+
+    def __init__(
+        self, embeddings: Embeddings, max_size: int = RAG_QUERY_EMBEDDING_CACHE_SIZE
+    ) -> None:
+        """
+        Wrap an embedding model.
+        :param embeddings: The embedding model.
+        :param max_size: The largest number of query embeddings kept.
+        """
+        self.embeddings = embeddings
+        self._queries = _LRU(max_size)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self._queries.get(text)
+        if embedding is None:
+            embedding = self.embeddings.embed_query(text)
+            self._queries.put(text, embedding)
+        return list(embedding)
+
+
+@functools.lru_cache(maxsize=5)
+def get_query_embedding(
+    model_name: str = "sentence-transformers/all-mpnet-base-v2",
+) -> CachedQueryEmbeddings:
+    """
+    Get the embedding model of the retrievers, shared with its query embeddings by all the retrievers of the model.
+    :param model_name: The name of the model.
+    :return: The embedding model.
+    """
+    return CachedQueryEmbeddings(get_hugginface_embedding(model_name))
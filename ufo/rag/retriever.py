@@ -1,13 +1,15 @@
 # Copyright (c) Microsoft Corporation.
 # Licensed under the MIT License.
 
+import itertools
 from abc import ABC, abstractmethod
 
-from langchain_community.vectorstores import FAISS
-
 from ufo.config.config import get_offline_learner_indexer_config
 from ufo.rag import web_search
-from ufo.utils import print_with_color, get_hugginface_embedding
+from ufo.rag.index_registry import VectorIndexRegistry
+from ufo.rag.retrieval_cache import RetrievalCache
+from ufo.utils import print_with_color
+from ufo.utils.tracing import span
 
 
 class RetrieverFactory:
@@ -39,6 +41,13 @@ class Retriever(ABC):
     Class to retrieve documents.
     """
 
+    # The path and the version of the vector store loaded from the registry, None for the stores built in memory.
+    index_path = None
+    index_version = None
+
+    # The identities of the retrievers of the stores built in memory, in the retrieval cache.
+    _memory_identities = itertools.count()
+
     def __init__(self) -> None:
         """
         Create a new Retriever.
@@ -56,23 +65,67 @@ class Retriever(ABC):
         """
         pass
 
-    def retrieve(self, query: str, top_k: int, filter=None):
+    def load_indexer(self, path: str):
+        """
+        Load a vector store saved on disk, shared with the other retrievers through the registry.
+        :param path: The path of the vector store.
+        :return: The vector store, held until the retriever is collected.
+        """
+        handle = VectorIndexRegistry.get_instance().acquire(path, owner=self)
+        self.index_path = handle.path
+        self.index_version = handle.version
+        return handle.store
+
+    @property
+    def cache_identity(self):
+        """
+        The identity of the retriever in the retrieval cache: the path of its vector store if loaded from the
+        registry, shared by the retrievers of the store, or a unique identity for a store built in memory.
+        :return: The identity.
+        """
+        if self.index_path is not None:
+            return self.index_path
+        if "_memory_identity" not in self.__dict__:
+            self._memory_identity = ("memory", next(Retriever._memory_identities))
+        return self._memory_identity
+
+    def retrieve(self, query: str, top_k: int, filter=None, filter_key=None):
         """
-        Retrieve the document from the given query.
+        Retrieve the document from the given query. The results are cached until the vector store changes.
         :param query: The query to retrieve the document from.
         :param top_k: The number of documents to retrieve.
         :filter: The filter to apply to the retrieved documents.
+        :filter_key: The key identifying a callable filter in the cache. The retrievals with a callable filter without
+        a key are not cached.
         :return: The document from the given query.
         """
         if not self.indexer:
             return []
 
-        results = self.indexer.similarity_search(query, top_k, filter=filter)
+        cache = RetrievalCache.get_instance()
+        cache_key = None
+        if cache.enabled:
+            cache_key = cache.make_key(
+                self.cache_identity,
+                self.index_version,
+                query,
+                top_k,
+                filter,
+                filter_key,
+            )
+            if cache_key is not None:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
+        with span("retriever.retrieve", retriever=type(self).__name__, top_k=top_k):
+            results = self.indexer.similarity_search(query, top_k, filter=filter)
 
         if not results:
-            return []
-        else:
-            return results
+            results = []
+        if cache_key is not None:
+            cache.put(cache_key, results)
+        return results
 
 
 class OfflineDocRetriever(Retriever):
@@ -116,10 +169,7 @@ class OfflineDocRetriever(Retriever):
             return None
 
         try:
-            db = FAISS.load_local(
-                path, get_hugginface_embedding(), allow_dangerous_deserialization=True
-            )
-            return db
+            return self.load_indexer(path)
         except Exception as e:
             print_with_color(
                 "Warning: Failed to load experience indexer from {path}, error: {error}.".format(
@@ -149,12 +199,7 @@ class ExperienceRetriever(Retriever):
         """
 
         try:
-            db = FAISS.load_local(
-                db_path,
-                get_hugginface_embedding(),
-                allow_dangerous_deserialization=True,
-            )
-            return db
+            return self.load_indexer(db_path)
         except Exception as e:
             print_with_color(
                 "Warning: Failed to load experience indexer from {path}, error: {error}.".format(
@@ -230,12 +275,7 @@ class DemonstrationRetriever(Retriever):
         """
 
         try:
-            db = FAISS.load_local(
-                db_path,
-                get_hugginface_embedding(),
-                allow_dangerous_deserialization=True,
-            )
-            return db
+            return self.load_indexer(db_path)
         except Exception as e:
             print_with_color(
                 "Warning: Failed to load experience indexer from {path}, error: {error}.".format(
@@ -7,7 +7,8 @@ from langchain.text_splitter import HTMLHeaderTextSplitter
 from langchain_community.vectorstores import FAISS
 
 from ufo.config.config import Config
-from ufo.utils import get_hugginface_embedding, print_with_color
+from ufo.rag.retrieval_cache import get_query_embedding
+from ufo.utils import print_with_color
 
 configs = Config.get_instance().config_data
 
@@ -112,6 +113,6 @@ class BingSearchWeb:
         :return: The created indexer.
         """
 
-        db = FAISS.from_documents(documents, get_hugginface_embedding())
+        db = FAISS.from_documents(documents, get_query_embedding())
 
         return db
@@ -155,10 +155,10 @@ def get_hugginface_embedding(
     model_name: str = "sentence-transformers/all-mpnet-base-v2",
 ):
     """
-    Get the Hugging Face embeddings.
+    Get the Hugging Face embeddings, backed by the embedding service shared with the control filters.
     :param model_name: The name of the model.
     :return: The Hugging Face embeddings.
     """
-    from langchain_huggingface import HuggingFaceEmbeddings
+    from ufo.utils.embedding import ServiceEmbeddings, get_embedding_service
 
-    return HuggingFaceEmbeddings(model_name=model_name)
+    return ServiceEmbeddings(get_embedding_service(model_name))
@@ -0,0 +1,230 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A bounded background sink for the artifacts logged at every step, e.g. screenshots, UI trees and request logs.
+
+The agent thread only hands the artifacts over and continues, the files are written by a small pool of writer threads.
+The number of pending artifacts is bounded, so that a slow disk throttles the producer instead of growing the memory.
+Files are written to a temporary file, flushed to the disk and atomically renamed, so that a crash never leaves a
+truncated artifact behind.
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Callable, Iterator, Optional, Set, Union
+
+from ufo.config.config import Config
+from ufo.utils import print_with_color
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    ARTIFACT_SINK_WORKERS = int(configs.get("ARTIFACT_SINK_WORKERS", 2))
+    ARTIFACT_SINK_MAX_PENDING = int(configs.get("ARTIFACT_SINK_MAX_PENDING", 32))
+    ARTIFACT_FSYNC = bool(configs.get("ARTIFACT_FSYNC", True))
+else:
+    ARTIFACT_SINK_WORKERS = 2
+    ARTIFACT_SINK_MAX_PENDING = 32
+    ARTIFACT_FSYNC = True
+
+
+Content = Union[bytes, str, Callable[[], Union[bytes, str]]]
+
+
+class ArtifactSink:
+    """
+    The process-wide background writer of the step artifacts.
+    """
+
+    _instance: Optional["ArtifactSink"] = None
+    _instance_lock = threading.Lock()
+
+    def __init__(
+        self,
+        max_workers: int = ARTIFACT_SINK_WORKERS,
+        max_pending: int = ARTIFACT_SINK_MAX_PENDING,
+        fsync: bool = ARTIFACT_FSYNC,
+    ) -> None:
+        """
+        Initialize the artifact sink.
+        :param max_workers: The number of writer threads for the files.
+        :param max_pending: The maximum number of pending artifacts before the submission blocks.
+        :param fsync: Whether to flush the files to the disk before renaming them into place.
+        """
+        self.fsync = fsync
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, max_workers), thread_name_prefix="artifact_writer"
+        )
+        # Appends to the logs must keep their order, so they are written by a single thread.
+        self._ordered_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="artifact_logger"
+        )
+        self._slots = threading.BoundedSemaphore(max(1, max_pending))
+        self._pending: Set[Future] = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get_instance(cls) -> "ArtifactSink":
+        """
+        Get the shared instance of the artifact sink.
+        :return: The artifact sink.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = ArtifactSink()
+        return cls._instance
+
+    def submit(self, path: str, content: Content) -> Future:
+        """
+        Write the content to the path in the background. Blocks if too many artifacts are pending.
+        :param path: The path of the file.
+        :param content: The bytes or string to write, or a callable producing them in the writer thread.
+        :return: The future of the write.
+        """
+        return self._submit(self._executor, self._write, path, content)
+
+    def submit_stream(self, path: str, writer: Callable[[BinaryIO], None]) -> Future:
+        """
+        Write a file in the background by streaming it, without building its whole content in memory.
+        :param path: The path of the file.
+        :param writer: The function writing the content to the binary file object it receives, in the writer thread.
+        :return: The future of the write.
+        """
+        return self._submit(self._executor, self._write_stream, path, writer)
+
+    def submit_task(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Run a logging task in the background, after all the previously submitted logging tasks.
+        :param func: The task to run, e.g. writing a line to a logger.
+        :return: The future of the task.
+        """
+        return self._submit(self._ordered_executor, func, *args, **kwargs)
+
+    def _submit(
+        self, executor: ThreadPoolExecutor, func: Callable[..., Any], *args, **kwargs
+    ) -> Future:
+        """
+        Submit a job to the executor, holding a slot until the job is done.
+        :param executor: The executor.
+        :param func: The job.
+        :return: The future of the job.
+        """
+        self._slots.acquire()
+
+        try:
+            future = executor.submit(self._run, func, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+
+        with self._lock:
+            self._pending.add(future)
+
+        future.add_done_callback(self._release)
+        return future
+
+    @staticmethod
+    def _run(func: Callable[..., Any], *args, **kwargs) -> Any:
+        """
+        Run the job, reporting instead of raising the error in the writer thread.
+        :param func: The job.
+        """
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            print_with_color(f"Warning: Failed to write the artifact: {e}", "yellow")
+
+    def _release(self, future: Future) -> None:
+        """
+        Release the slot of a finished job.
+        :param future: The future of the job.
+        """
+        with self._lock:
+            self._pending.discard(future)
+        self._slots.release()
+
+    def _write(self, path: str, content: Content) -> None:
+        """
+        Write the content to the path atomically.
+        :param path: The path of the file.
+        :param content: The content to write.
+        """
+        if callable(content):
+            content = content()
+        if isinstance(content, str):
+            content = content.encode("utf-8")
+
+        self.write_atomic(path, content, self.fsync)
+
+    def _write_stream(self, path: str, writer: Callable[[BinaryIO], None]) -> None:
+        """
+        Stream the content to the path atomically.
+        :param path: The path of the file.
+        :param writer: The function writing the content.
+        """
+        with self.open_atomic(path, self.fsync) as file:
+            writer(file)
+
+    @staticmethod
+    def write_atomic(path: str, data: bytes, fsync: bool = True) -> None:
+        """
+        Write the data to a temporary file in the same folder and rename it into place.
+        :param path: The path of the file.
+        :param data: The data to write.
+        :param fsync: Whether to flush the file to the disk before renaming it.
+        """
+        with ArtifactSink.open_atomic(path, fsync) as file:
+            file.write(data)
+
+    @staticmethod
+    @contextmanager
+    def open_atomic(path: str, fsync: bool = True) -> Iterator[BinaryIO]:
+        """
+        Open a temporary file in the same folder for writing, and rename it into place when the writing succeeds.
+        :param path: The path of the file.
+        :param fsync: Whether to flush the file to the disk before renaming it.
+        :return: The binary file object of the temporary file.
+        """
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+
+        fd, temp_path = tempfile.mkstemp(
+            dir=folder, prefix=os.path.basename(path), suffix=".tmp"
+        )
+        try:
+            with os.fdopen(fd, "wb") as file:
+                yield file
+                if fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def flush(self) -> None:
+        """
+        Block until all the submitted artifacts are written.
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                return
+            for future in pending:
+                future.result()
+
+    def shutdown(self) -> None:
+        """
+        Flush the pending artifacts and stop the writer threads.
+        """
+        self.flush()
+        self._executor.shutdown(wait=True)
+        self._ordered_executor.shutdown(wait=True)
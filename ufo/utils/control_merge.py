@@ -0,0 +1,156 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The merge of the UI Automation controls with the controls detected on the screenshot, e.g. by OmniParser.
+
+The rectangles of all the controls are read once into NumPy arrays. The main rectangles are sorted by their left edge,
+so that the candidate overlaps of an additional control are found with a binary search followed by a vectorized filter,
+and the IoU is only computed for the candidates.
+"""
+
+from typing import Any, List, Optional, Sequence
+
+import numpy as np
+
+
+def rectangles_to_array(controls: Sequence[Any]) -> np.ndarray:
+    """
+    Read the rectangles of the controls into an array, calling rectangle() once per control.
+    :param controls: The controls, with a rectangle() method returning an object with left, top, right and bottom.
+    :return: The (N, 4) float array of the rectangles (left, top, right, bottom).
+    """
+    rects = np.zeros((len(controls), 4), dtype=np.float64)
+    for i, control in enumerate(controls):
+        rect = control.rectangle()
+        rects[i] = (rect.left, rect.top, rect.right, rect.bottom)
+    return rects
+
+
+def iou_matrix(rects_a: np.ndarray, rects_b: np.ndarray) -> np.ndarray:
+    """
+    Compute the IoU of every pair of rectangles.
+    :param rects_a: The (M, 4) array of rectangles.
+    :param rects_b: The (N, 4) array of rectangles.
+    :return: The (M, N) array of the IoU. The IoU of two empty rectangles is 0.
+    """
+    left = np.maximum(rects_a[:, None, 0], rects_b[None, :, 0])
+    top = np.maximum(rects_a[:, None, 1], rects_b[None, :, 1])
+    right = np.minimum(rects_a[:, None, 2], rects_b[None, :, 2])
+    bottom = np.minimum(rects_a[:, None, 3], rects_b[None, :, 3])
+
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (rects_a[:, 2] - rects_a[:, 0]) * (rects_a[:, 3] - rects_a[:, 1])
+    area_b = (rects_b[:, 2] - rects_b[:, 0]) * (rects_b[:, 3] - rects_b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - intersection
+
+    return np.divide(
+        intersection, union, out=np.zeros_like(intersection), where=union > 0
+    )
+
+
+class ControlMerger:
+    """
+    The sweep-line index of the main control rectangles, to find the additional controls overlapping them.
+    """
+
+    def __init__(self, main_rects: np.ndarray) -> None:
+        """
+        Build the index.
+        :param main_rects: The (M, 4) array of the main control rectangles.
+        """
+        self.main_rects = np.asarray(main_rects, dtype=np.float64).reshape(-1, 4)
+        self._order = np.argsort(self.main_rects[:, 0], kind="stable")
+        self._sorted_rects = self.main_rects[self._order]
+
+    def candidates(self, rect: np.ndarray) -> np.ndarray:
+        """
+        Find the main controls whose rectangle intersects the rectangle.
+        :param rect: The rectangle (left, top, right, bottom).
+        :return: The indices of the intersecting main controls.
+        """
+        # Only the rectangles starting left of the right edge can intersect.
+        end = np.searchsorted(self._sorted_rects[:, 0], rect[2], side="left")
+        sweep = self._sorted_rects[:end]
+        hits = (
+            (sweep[:, 2] > rect[0]) & (sweep[:, 1] < rect[3]) & (sweep[:, 3] > rect[1])
+        )
+        return self._order[:end][hits]
+
+    def max_iou(self, additional_rects: np.ndarray) -> np.ndarray:
+        """
+        Compute the largest IoU of every additional control with any main control.
+        :param additional_rects: The (N, 4) array of the additional control rectangles.
+        :return: The (N,) array of the largest IoU, 0 for the controls intersecting no main control.
+        """
+        additional_rects = np.asarray(additional_rects, dtype=np.float64).reshape(
+            -1, 4
+        )
+        result = np.zeros(len(additional_rects), dtype=np.float64)
+
+        for i, rect in enumerate(additional_rects):
+            candidates = self.candidates(rect)
+            if len(candidates) > 0:
+                result[i] = iou_matrix(rect[None], self.main_rects[candidates]).max()
+
+        return result
+
+    def overlap_matrix(self, additional_rects: np.ndarray) -> np.ndarray:
+        """
+        Compute the full IoU matrix of the additional controls against the main controls, for debugging.
+        :param additional_rects: The (N, 4) array of the additional control rectangles.
+        :return: The (N, M) array of the IoU.
+        """
+        return iou_matrix(
+            np.asarray(additional_rects, dtype=np.float64).reshape(-1, 4),
+            self.main_rects,
+        )
+
+    def keep_mask(
+        self, additional_rects: np.ndarray, iou_overlap_threshold: float = 0.1
+    ) -> np.ndarray:
+        """
+        Decide which additional controls to keep.
+        :param additional_rects: The (N, 4) array of the additional control rectangles.
+        :param iou_overlap_threshold: The threshold of the IoU overlap to consider two controls as overlapping.
+        :return: The (N,) boolean array, True for the additional controls overlapping no main control.
+        """
+        if len(self.main_rects) == 0:
+            return np.ones(len(additional_rects), dtype=bool)
+
+        if iou_overlap_threshold < 0:
+            # Even the disjoint controls overlap under a negative threshold, the index cannot prune anything.
+            return ~(
+                self.overlap_matrix(additional_rects) > iou_overlap_threshold
+            ).any(axis=1)
+
+        return ~(self.max_iou(additional_rects) > iou_overlap_threshold)
+
+
+def merge_controls(
+    main_control_list: List[Any],
+    additional_control_list: List[Any],
+    iou_overlap_threshold: float = 0.1,
+    main_rects: Optional[np.ndarray] = None,
+    additional_rects: Optional[np.ndarray] = None,
+) -> List[Any]:
+    """
+    Merge two control lists by removing the overlapping controls in the additional control list.
+    :param main_control_list: The main control list. All controls in this list will be kept.
+    :param additional_control_list: The additional control list. The overlapping controls in this list will be removed.
+    :param iou_overlap_threshold: The threshold of the IoU overlap to consider two controls as overlapping.
+    :param main_rects: The rectangles of the main controls, read from the controls if not provided.
+    :param additional_rects: The rectangles of the additional controls, read from the controls if not provided.
+    :return: The merged control list.
+    """
+    if main_rects is None:
+        main_rects = rectangles_to_array(main_control_list)
+    if additional_rects is None:
+        additional_rects = rectangles_to_array(additional_control_list)
+
+    keep = ControlMerger(main_rects).keep_mask(additional_rects, iou_overlap_threshold)
+
+    return main_control_list + [
+        control for control, kept in zip(additional_control_list, keep) if kept
+    ]
+
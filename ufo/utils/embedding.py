@@ -0,0 +1,401 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+The embedding models shared by the retrievers, the control filters and the template selection of the dataflow.
+
+A model is loaded once per process by the EmbeddingModelManager, instead of once by the embeddings of the retrievers,
+once by every control filter and once per task by the template selection. On CPU, a model can run on the ONNX
+runtime (with sentence-transformers 3.2 or later and optimum[onnxruntime]) or with its linear layers quantized to
+int8, falling back to the PyTorch model if the backend is not available.
+
+The texts are embedded in batches by the EmbeddingService, which caches the embeddings in memory and on disk, in a
+SQLite file keyed by the hash of the model, the backend and the text, so that the plans, the control names and the
+documents embedded in a session are not encoded again in the next ones. The file can be deleted at any time.
+"""
+
+import functools
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    EMBEDDING_BACKEND = str(configs.get("EMBEDDING_BACKEND", "torch")).lower()
+    EMBEDDING_BATCH_SIZE = int(configs.get("EMBEDDING_BATCH_SIZE", 32))
+    EMBEDDING_CACHE_PATH = configs.get(
+        "EMBEDDING_CACHE_PATH", "vectordb/cache/embeddings.sqlite"
+    )
+    EMBEDDING_MEMORY_CACHE_SIZE = int(configs.get("EMBEDDING_MEMORY_CACHE_SIZE", 8192))
+else:
+    EMBEDDING_BACKEND = "torch"
+    EMBEDDING_BATCH_SIZE = 32
+    EMBEDDING_CACHE_PATH = "vectordb/cache/embeddings.sqlite"
+    EMBEDDING_MEMORY_CACHE_SIZE = 8192
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "int8")
+
+_SENTENCE_TRANSFORMERS_PREFIX = "sentence-transformers/"
+
+
+def normalize_model_name(model_name: str) -> str:
+    """
+    Normalize the name of a model, so that e.g. "all-MiniLM-L6-v2" and "sentence-transformers/all-MiniLM-L6-v2" share
+    the same instance.
+    :param model_name: The name of the model on the Hugging Face hub, or its local path.
+    :return: The normalized name.
+    """
+    if "/" in model_name or "\\" in model_name or os.path.exists(model_name):
+        return model_name
+    return _SENTENCE_TRANSFORMERS_PREFIX + model_name
+
+
+class EmbeddingModelManager:
+    """
+    The manager of the embedding models, loading every model once per process and backend.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, backend: str = EMBEDDING_BACKEND) -> None:
+        """
+        Initialize the manager.
+        :param backend: The default backend of the models, "torch", "onnx" or "int8".
+        """
+        if backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Embedding backend {backend} not supported")
+        self.backend = backend
+        self.loads = 0
+        self._models: Dict[Tuple[str, str], Any] = {}
+        self._lock = threading.Lock()
+        self._model_locks: Dict[Tuple[str, str], threading.Lock] = {}
+
+    @classmethod
+    def get_instance(cls) -> "EmbeddingModelManager":
+        """
+        Get the manager of the process.
+        :return: The manager.
+        """
+        if cls._instance is None:
+            with cls._instance_lock:
+                if cls._instance is None:
+                    cls._instance = cls()
+        return cls._instance
+
+    def get_model(self, model_name: str, backend: Optional[str] = None) -> Any:
+        """
+        Get a model, loading it at the first call.
+        :param model_name: The name of the model, or its local path.
+        :param backend: The backend, the default backend of the manager if None.
+        :return: The SentenceTransformer model.
+        """
+        key = (normalize_model_name(model_name), backend or self.backend)
+
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                return model
+            model_lock = self._model_locks.setdefault(key, threading.Lock())
+
+        # Only the callers of the same model wait for it to be loaded.
+        with model_lock:
+            with self._lock:
+                model = self._models.get(key)
+            if model is None:
+                model = self._load(*key)
+                with self._lock:
+                    self._models[key] = model
+                    self.loads += 1
+        return model
+
+    @staticmethod
+    def _load(model_name: str, backend: str) -> Any:
+        """
+        Load a model with a backend, falling back to the PyTorch model if the backend is not available.
+        :param model_name: The normalized name of the model.
+        :param backend: The backend.
+        :return: The SentenceTransformer model.
+        """
+        import sentence_transformers
+
+        from ufo.utils import print_with_color
+
+        if backend == "onnx":
+            try:
+                return sentence_transformers.SentenceTransformer(
+                    model_name, backend="onnx"
+                )
+            except Exception as e:
+                # Older sentence-transformers, missing onnxruntime, or a model without an ONNX export.
+                print_with_color(
+                    f"Failed to load {model_name} on the ONNX runtime, using PyTorch: {e}",
+                    "yellow",
+                )
+
+        model = sentence_transformers.SentenceTransformer(model_name)
+
+        if backend == "int8":
+            if model.device.type == "cpu":
+                import torch
+
+                torch.quantization.quantize_dynamic(
+                    model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+                )
+            else:
+                print_with_color(
+                    f"The int8 backend only runs on CPU, {model_name} runs on {model.device}.",
+                    "yellow",
+                )
+        return model
+
+    def loaded(self) -> List[Tuple[str, str]]:
+        """
+        Get the loaded models.
+        :return: The names and backends of the models.
+        """
+        with self._lock:
+            return list(self._models)
+
+
+class EmbeddingStore:
+    """
+    The persistent store of the embeddings, a SQLite table of float32 vectors by key, shared by the processes.
+    """
+
+    # The largest number of keys in a query, under the limit of the SQLite variables.
+    _QUERY_SIZE = 500
+
+    def __init__(self, path: str) -> None:
+        """
+        Open the store, creating it if needed.
+        :param path: The path of the SQLite file.
+        """
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Get the stored embeddings of keys.
+        :param keys: The keys.
+        :return: The embeddings of the stored keys.
+        """
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), self._QUERY_SIZE):
+                chunk = keys[i : i + self._QUERY_SIZE]
+                rows = self._connection.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN ({})".format(
+                        ",".join("?" * len(chunk))
+                    ),
+                    chunk,
+                ).fetchall()
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        Store embeddings.
+        :param embeddings: The embeddings by key.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [
+                    (key, np.asarray(vector, dtype=np.float32).tobytes())
+                    for key, vector in embeddings.items()
+                ],
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM embeddings"
+            ).fetchone()[0]
+
+
+class EmbeddingService:
+    """
+    The service embedding the texts with a shared model, in batches, with the embeddings cached in memory and on disk.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        backend: Optional[str] = None,
+        cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        memory_cache_size: int = EMBEDDING_MEMORY_CACHE_SIZE,
+    ) -> None:
+        """
+        Initialize the service.
+        :param model_name: The name of the model, or its local path.
+        :param backend: The backend of the model, the default backend of the manager if None.
+        :param cache_path: The path of the SQLite file of the embeddings, None or empty to cache them in memory only.
+        :param batch_size: The number of texts encoded at once.
+        :param memory_cache_size: The number of embeddings cached in memory.
+        """
+        self.model_name = normalize_model_name(model_name)
+        self.backend = backend or EmbeddingModelManager.get_instance().backend
+        self.batch_size = batch_size
+        self.memory_cache_size = memory_cache_size
+        self.store = get_embedding_store(cache_path) if cache_path else None
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.encoded = 0
+
+        # The embeddings of different models or backends are not interchangeable.
+        self._namespace = f"{self.model_name}\0{self.backend}\0"
+        self._memory: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def model(self) -> Any:
+        """
+        The model of the service, shared with the other services of the same model and backend.
+        """
+        return EmbeddingModelManager.get_instance().get_model(
+            self.model_name, self.backend
+        )
+
+    def key(self, text: str) -> str:
+        """
+        Get the cache key of a text.
+        :param text: The text.
+        :return: The key, the hash of the model, the backend and the text.
+        """
+        return hashlib.sha256(
+            (self._namespace + text).encode("utf-8", "surrogatepass")
+        ).hexdigest()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, encoding only the texts not cached.
+        :param texts: The texts.
+        :return: The array of the embeddings, one float32 row per text.
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+
+        keys = [self.key(text) for text in texts]
+        embeddings: Dict[str, np.ndarray] = {}
+
+        with self._lock:
+            for key in keys:
+                embedding = self._memory.get(key)
+                if embedding is not None:
+                    self._memory.move_to_end(key)
+                    embeddings[key] = embedding
+            self.hits += sum(1 for key in keys if key in embeddings)
+
+        # The distinct texts missing from the memory, in order.
+        missing = {key: text for key, text in zip(keys, texts) if key not in embeddings}
+
+        found = {}
+        if missing and self.store is not None:
+            found = self.store.get_many(list(missing))
+            embeddings.update(found)
+
+        to_encode = {key: text for key, text in missing.items() if key not in found}
+        encoded = {}
+        if to_encode:
+            vectors = np.asarray(
+                self.model.encode(list(to_encode.values()), batch_size=self.batch_size),
+                dtype=np.float32,
+            )
+            encoded = dict(zip(to_encode, vectors))
+            embeddings.update(encoded)
+            if self.store is not None:
+                self.store.put_many(encoded)
+
+        with self._lock:
+            self.disk_hits += len(found)
+            self.encoded += len(encoded)
+            for key in missing:
+                self._memory[key] = embeddings[key]
+            while len(self._memory) > self.memory_cache_size:
+                self._memory.popitem(last=False)
+
+        return np.stack([embeddings[key] for key in keys])
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """
+        The statistics of the cache of the service.
+        """
+        with self._lock:
+            return {
+                "memory_hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "encoded": self.encoded,
+            }
+
+
+class ServiceEmbeddings(Embeddings):
+    """
+    The langchain embeddings of an embedding service, as the Hugging Face embeddings of langchain.
+    """
+
+    def __init__(self, service: EmbeddingService) -> None:
+        """
+        Wrap an embedding service.
+        :param service: The embedding service.
+        """
+        self.service = service
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        # As the Hugging Face embeddings, so that the vector stores built before are still consistent.
+        texts = [text.replace("\n", " ") for text in texts]
+        return self.service.embed(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_store(path: str) -> EmbeddingStore:
+    """
+    Get the persistent store of the embeddings at a path, shared by the services of the process.
+    :param path: The path of the SQLite file.
+    :return: The store.
+    """
+    return EmbeddingStore(path)
+
+
+@functools.lru_cache(maxsize=16)
+def _get_embedding_service(
+    model_name: str, cache_path: Optional[str]
+) -> EmbeddingService:
+    return EmbeddingService(model_name, cache_path=cache_path)
+
+
+def get_embedding_service(
+    model_name: str = "sentence-transformers/all-mpnet-base-v2",
+    cache_path: Optional[str] = EMBEDDING_CACHE_PATH,
+) -> EmbeddingService:
+    """
+    Get the embedding service of a model, shared by the callers of the process.
+    :param model_name: The name of the model, or its local path.
+    :param cache_path: The path of the SQLite file of the embeddings, None or empty to cache them in memory only.
+    :return: The embedding service.
+    """
+    return _get_embedding_service(normalize_model_name(model_name), cache_path or None)
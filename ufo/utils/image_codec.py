@@ -0,0 +1,255 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Image codecs for the screenshots sent to the LLM.
+
+The codec is selected from the configuration, globally with IMAGE_CODEC or per agent with the IMAGE_CODEC field of the
+agent configuration, e.g. APP_AGENT. PNG, WebP and JPEG are supported. A quality setting applies to the lossy formats,
+and the image is downscaled automatically to fit in a maximum number of pixels and a maximum number of encoded bytes.
+"""
+
+import base64
+import math
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass
+from io import BytesIO
+from typing import Any, Dict, Optional
+
+from PIL import Image
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    DEFAULT_PNG_COMPRESS_LEVEL = int(configs.get("DEFAULT_PNG_COMPRESS_LEVEL", 0))
+else:
+    DEFAULT_PNG_COMPRESS_LEVEL = 6
+
+
+@dataclass(frozen=True)
+class ImageCodecSettings:
+    """
+    The settings of the image codec for the LLM payloads.
+    """
+
+    format: str = "png"
+    quality: int = 85
+    min_quality: int = 50
+    max_bytes: int = 0
+    max_pixels: int = 0
+
+    @classmethod
+    def from_config(cls, agent_type: Optional[str] = None) -> "ImageCodecSettings":
+        """
+        Get the codec settings from the configuration. The settings of the agent override the global settings.
+        :param agent_type: The agent configuration key, e.g. "APP_AGENT", optional.
+        :return: The codec settings.
+        """
+        if configs is None:
+            return cls()
+
+        settings = dict(configs.get("IMAGE_CODEC", {}) or {})
+        if agent_type is not None:
+            settings.update(configs.get(agent_type, {}).get("IMAGE_CODEC", {}) or {})
+
+        return cls(
+            format=str(settings.get("FORMAT", "png")).lower(),
+            quality=int(settings.get("QUALITY", 85)),
+            min_quality=int(settings.get("MIN_QUALITY", 50)),
+            max_bytes=int(settings.get("MAX_BYTES", 0)),
+            max_pixels=int(settings.get("MAX_PIXELS", 0)),
+        )
+
+    @property
+    def is_passthrough(self) -> bool:
+        """
+        Whether a PNG encoding can be sent as it is, without decoding and encoding the image again.
+        :return: True if the settings are the lossless PNG without any budget.
+        """
+        return self.format == "png" and self.max_bytes <= 0 and self.max_pixels <= 0
+
+
+@dataclass
+class EncodedImage:
+    """
+    An image encoded for the LLM, with the settings chosen to fit the budget.
+    """
+
+    data: bytes
+    mime_type: str
+    format: str
+    quality: Optional[int]
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+
+    def to_data_url(self) -> str:
+        """
+        Get the data URL of the encoded image.
+        :return: The data URL.
+        """
+        return f"data:{self.mime_type};base64," + base64.b64encode(self.data).decode(
+            "ascii"
+        )
+
+    def to_log(self) -> Dict[str, Any]:
+        """
+        Get the chosen settings to be recorded in the step log.
+        :return: The settings dictionary.
+        """
+        log = asdict(self)
+        log.pop("data")
+        log["bytes"] = len(self.data)
+        return log
+
+
+class ImageCodec(ABC):
+    """
+    The abstract image codec.
+    """
+
+    format: str = ""
+    mime_type: str = ""
+    lossy: bool = False
+
+    @abstractmethod
+    def encode(self, image: Image.Image, quality: int) -> bytes:
+        """
+        Encode the image.
+        :param image: The image to encode.
+        :param quality: The quality of the lossy formats, from 1 to 100.
+        :return: The encoded bytes.
+        """
+        pass
+
+
+class PNGCodec(ImageCodec):
+    """
+    The lossless PNG codec, using the fast compression level of the screenshots instead of optimize.
+    """
+
+    format = "png"
+    mime_type = "image/png"
+
+    def encode(self, image: Image.Image, quality: int) -> bytes:
+        buffered = BytesIO()
+        image.save(buffered, format="PNG", compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+        return buffered.getvalue()
+
+
+class WebPCodec(ImageCodec):
+    """
+    The WebP codec.
+    """
+
+    format = "webp"
+    mime_type = "image/webp"
+    lossy = True
+
+    def encode(self, image: Image.Image, quality: int) -> bytes:
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        # A low method favours the encoding speed over the last percents of the size.
+        image.save(buffered, format="WEBP", quality=quality, method=2)
+        return buffered.getvalue()
+
+
+class JPEGCodec(ImageCodec):
+    """
+    The JPEG codec.
+    """
+
+    format = "jpeg"
+    mime_type = "image/jpeg"
+    lossy = True
+
+    def encode(self, image: Image.Image, quality: int) -> bytes:
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=quality)
+        return buffered.getvalue()
+
+
+class ImageCodecFactory:
+    """
+    The factory of the image codecs.
+    """
+
+    _codecs = {"png": PNGCodec, "webp": WebPCodec, "jpeg": JPEGCodec, "jpg": JPEGCodec}
+
+    @classmethod
+    def create_codec(cls, codec_format: str) -> ImageCodec:
+        """
+        Create an image codec.
+        :param codec_format: The format of the codec, "png", "webp" or "jpeg".
+        :return: The image codec.
+        """
+        codec_class = cls._codecs.get(codec_format.lower())
+        if codec_class is None:
+            raise ValueError(f"Invalid image codec format: {codec_format}")
+        return codec_class()
+
+
+def _resize(image: Image.Image, scale: float) -> Image.Image:
+    """
+    Downscale the image by the scale factor.
+    :param image: The image.
+    :param scale: The scale factor, smaller than 1.
+    :return: The downscaled image.
+    """
+    width = max(1, int(image.width * scale))
+    height = max(1, int(image.height * scale))
+    return image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+
+def encode_image(
+    image: Image.Image, settings: ImageCodecSettings, max_attempts: int = 6
+) -> EncodedImage:
+    """
+    Encode the image with the codec settings, lowering the quality and the resolution until it fits the budget.
+    The lossy formats are first re-encoded at a lower quality, down to the minimum quality, before downscaling.
+    :param image: The image to encode.
+    :param settings: The codec settings.
+    :param max_attempts: The maximum number of downscaling attempts to fit the byte budget.
+    :return: The encoded image. It may exceed the byte budget if it cannot be reached within the attempts.
+    """
+    codec = ImageCodecFactory.create_codec(settings.format)
+    original_width, original_height = image.size
+
+    # Fit the pixel budget first, it is cheaper than encoding an oversized image.
+    if settings.max_pixels > 0 and image.width * image.height > settings.max_pixels:
+        image = _resize(
+            image, math.sqrt(settings.max_pixels / (image.width * image.height))
+        )
+
+    quality = settings.quality
+    data = codec.encode(image, quality)
+
+    if settings.max_bytes > 0:
+        if codec.lossy:
+            while len(data) > settings.max_bytes and quality > settings.min_quality:
+                quality = max(settings.min_quality, quality - 15)
+                data = codec.encode(image, quality)
+
+        attempts = 0
+        while len(data) > settings.max_bytes and attempts < max_attempts:
+            # The encoded size is roughly proportional to the number of pixels, undershoot a little to converge.
+            image = _resize(image, 0.95 * math.sqrt(settings.max_bytes / len(data)))
+            data = codec.encode(image, quality)
+            attempts += 1
+
+    return EncodedImage(
+        data=data,
+        mime_type=codec.mime_type,
+        format=codec.format,
+        quality=quality if codec.lossy else None,
+        width=image.width,
+        height=image.height,
+        original_width=original_width,
+        original_height=original_height,
+    )
@@ -0,0 +1,446 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+In-memory screenshot frames shared within and across the steps of a session.
+
+A frame holds a captured image together with its PNG encoding. The encoding is computed at most once and is shared
+by the log file written to disk and the base64 payload sent to the LLM. Writing the file is an asynchronous side effect,
+handed over to the artifact sink, so the agent thread never waits on the disk or re-reads a screenshot it has just taken.
+
+The module only depends on PIL, so that it can be benchmarked without Windows:
+
+    python -m ufo.utils.screenshot_frame
+"""
+
+import base64
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from io import BytesIO
+from typing import Dict, Optional, Set
+
+from PIL import Image
+
+from ufo.config.config import Config
+from ufo.utils.artifact_sink import ArtifactSink
+from ufo.utils.image_codec import EncodedImage, ImageCodecSettings, encode_image
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    DEFAULT_PNG_COMPRESS_LEVEL = int(configs.get("DEFAULT_PNG_COMPRESS_LEVEL", 0))
+    SCREENSHOT_FRAME_CACHE_SIZE = int(configs.get("SCREENSHOT_FRAME_CACHE_SIZE", 8))
+else:
+    DEFAULT_PNG_COMPRESS_LEVEL = 6
+    SCREENSHOT_FRAME_CACHE_SIZE = 8
+
+
+class ScreenshotFrame:
+    """
+    A captured screenshot kept in memory with its lazily computed PNG encoding.
+    The image of a frame must be treated as read-only. Copy it before drawing on it.
+    """
+
+    def __init__(self, image: Image.Image, path: Optional[str] = None) -> None:
+        """
+        Initialize the frame.
+        :param image: The captured image.
+        :param path: The path the frame is saved to, optional.
+        """
+        self._image = image
+        self._path = path
+        self._png_bytes: Optional[bytes] = None
+        self._base64: Optional[str] = None
+        self._encoded: Dict[ImageCodecSettings, EncodedImage] = {}
+        self._lock = threading.Lock()
+        self._save_future: Optional[Future] = None
+
+    @property
+    def image(self) -> Image.Image:
+        """
+        Get the image of the frame.
+        :return: The image.
+        """
+        return self._image
+
+    @property
+    def path(self) -> Optional[str]:
+        """
+        Get the path of the frame.
+        :return: The path.
+        """
+        return self._path
+
+    @property
+    def size(self):
+        """
+        Get the size of the frame.
+        :return: The (width, height) of the image.
+        """
+        return self._image.size
+
+    @property
+    def png_bytes(self) -> bytes:
+        """
+        Get the PNG encoding of the frame. The image is encoded only once.
+        :return: The PNG bytes.
+        """
+        with self._lock:
+            if self._png_bytes is None:
+                buffered = BytesIO()
+                self._image.save(
+                    buffered, format="PNG", compress_level=DEFAULT_PNG_COMPRESS_LEVEL
+                )
+                self._png_bytes = buffered.getvalue()
+            return self._png_bytes
+
+    def to_base64(self) -> str:
+        """
+        Get the base64 string of the PNG encoding.
+        :return: The base64 string.
+        """
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.png_bytes).decode("ascii")
+        return self._base64
+
+    def to_data_url(self) -> str:
+        """
+        Get the data URL of the frame as required by the LLM.
+        :return: The data URL.
+        """
+        return "data:image/png;base64," + self.to_base64()
+
+    def encode(self, settings: ImageCodecSettings) -> EncodedImage:
+        """
+        Encode the frame for the LLM with the codec settings. The encoding is cached per settings.
+        The PNG encoding of the log file is reused if the settings allow it.
+        :param settings: The codec settings.
+        :return: The encoded image.
+        """
+        if settings.is_passthrough:
+            return EncodedImage(
+                data=self.png_bytes,
+                mime_type="image/png",
+                format="png",
+                quality=None,
+                width=self._image.width,
+                height=self._image.height,
+                original_width=self._image.width,
+                original_height=self._image.height,
+            )
+
+        encoded = self._encoded.get(settings)
+        if encoded is None:
+            encoded = encode_image(self._image, settings)
+            self._encoded[settings] = encoded
+        return encoded
+
+    def copy_image(self) -> Image.Image:
+        """
+        Get a writable copy of the image.
+        :return: The copied image.
+        """
+        return self._image.copy()
+
+    def save(self) -> None:
+        """
+        Write the PNG encoding of the frame to its path.
+        """
+        if self._path is None:
+            return
+
+        ArtifactSink.write_atomic(self._path, self.png_bytes)
+
+    def wait(self) -> None:
+        """
+        Block until the pending write of the frame is done.
+        """
+        if self._save_future is not None:
+            self._save_future.result()
+
+
+class FrameStore:
+    """
+    A process-wide LRU store of the recently captured frames, keyed by their saving paths.
+    Frames are written to disk by the artifact sink when they are put into the store.
+    """
+
+    _frames: "OrderedDict[str, ScreenshotFrame]" = OrderedDict()
+    _pending: Set[Future] = set()
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(path: str) -> str:
+        """
+        Normalize the path to be used as the key of the store.
+        :param path: The path.
+        :return: The normalized path.
+        """
+        return os.path.normcase(os.path.abspath(path))
+
+    @classmethod
+    def put(cls, image: Image.Image, path: Optional[str] = None) -> ScreenshotFrame:
+        """
+        Put an image into the store and save it to the path in the background.
+        :param image: The image. It must not be modified after being put into the store.
+        :param path: The path to save the image, optional. If not provided, the frame is neither stored nor saved.
+        :return: The frame.
+        """
+        frame = ScreenshotFrame(image, path)
+
+        if path is None:
+            return frame
+
+        with cls._lock:
+            key = cls._normalize(path)
+            cls._frames[key] = frame
+            cls._frames.move_to_end(key)
+            while len(cls._frames) > SCREENSHOT_FRAME_CACHE_SIZE:
+                cls._frames.popitem(last=False)
+
+        # The PNG encoding is computed in the writer thread and shared with the LLM payload.
+        future = ArtifactSink.get_instance().submit(path, lambda: frame.png_bytes)
+        frame._save_future = future
+
+        with cls._lock:
+            cls._pending.add(future)
+
+        future.add_done_callback(cls._discard_pending)
+
+        return frame
+
+    @classmethod
+    def _discard_pending(cls, future: Future) -> None:
+        """
+        Remove a finished write from the pending set.
+        :param future: The finished write.
+        """
+        with cls._lock:
+            cls._pending.discard(future)
+
+    @classmethod
+    def get(cls, path: str) -> Optional[ScreenshotFrame]:
+        """
+        Get the frame saved to the path.
+        :param path: The path.
+        :return: The frame, or None if it is not in the store.
+        """
+        if not path:
+            return None
+
+        with cls._lock:
+            key = cls._normalize(path)
+            frame = cls._frames.get(key)
+            if frame is not None:
+                cls._frames.move_to_end(key)
+            return frame
+
+    @classmethod
+    def exists(cls, path: str) -> bool:
+        """
+        Check whether the image is in the store or on the disk.
+        :param path: The path of the image.
+        :return: True if the image exists, otherwise False.
+        """
+        return cls.get(path) is not None or (bool(path) and os.path.exists(path))
+
+    @classmethod
+    def wait(cls, path: str) -> None:
+        """
+        Block until the image at the path is written to the disk.
+        :param path: The path of the image.
+        """
+        frame = cls.get(path)
+        if frame is not None:
+            frame.wait()
+
+    @classmethod
+    def flush(cls) -> None:
+        """
+        Block until all the pending writes are done.
+        """
+        with cls._lock:
+            pending = list(cls._pending)
+
+        for future in pending:
+            future.result()
+
+    @classmethod
+    def clear(cls) -> None:
+        """
+        Flush the pending writes and drop all the frames.
+        """
+        cls.flush()
+        with cls._lock:
+            cls._frames.clear()
+
+
+def _synthetic_screenshot(width: int, height: int, seed: int) -> Image.Image:
+    """
+    Draw a synthetic application window with flat panels, as a stand-in for a real capture.
+    :param width: The width of the image.
+    :param height: The height of the image.
+    :param seed: The random seed.
+    :return: The synthetic image.
+    """
+    import random
+
+    from PIL import ImageDraw
+
+    rng = random.Random(seed)
+    image = Image.new("RGB", (width, height), (243, 243, 243))
+    draw = ImageDraw.Draw(image)
+    for _ in range(400):
+        left = rng.randint(0, width - 40)
+        top = rng.randint(0, height - 20)
+        draw.rectangle(
+            (left, top, left + rng.randint(20, 300), top + rng.randint(10, 120)),
+            fill=tuple(rng.randint(0, 255) for _ in range(3)),
+            outline=(0, 0, 0),
+        )
+        draw.text((left + 2, top + 2), f"Control {rng.randint(0, 999)}", fill="black")
+    return image
+
+
+def _annotate(image: Image.Image, num_controls: int, seed: int) -> Image.Image:
+    """
+    Paste numbered labels on the image, as the annotation decorator does.
+    :param image: The image to draw on.
+    :param num_controls: The number of labels.
+    :param seed: The random seed.
+    :return: The annotated image.
+    """
+    import random
+
+    from PIL import ImageDraw
+
+    rng = random.Random(seed)
+    draw = ImageDraw.Draw(image)
+    for i in range(num_controls):
+        left = rng.randint(0, image.width - 30)
+        top = rng.randint(0, image.height - 20)
+        draw.rectangle((left, top, left + 28, top + 18), fill="#FFF68F", outline="red")
+        draw.text((left + 3, top + 3), str(i + 1), fill="black")
+    return image
+
+
+def _concat(image1: Image.Image, image2: Image.Image) -> Image.Image:
+    """
+    Concatenate two images horizontally.
+    :param image1: The first image.
+    :param image2: The second image.
+    :return: The concatenated image.
+    """
+    min_height = min(image1.height, image2.height)
+    result = Image.new("RGB", (image1.width + image2.width, min_height))
+    result.paste(image1, (0, 0))
+    result.paste(image2, (image1.width, 0))
+    return result
+
+
+def benchmark(
+    width: int = 3840, height: int = 2160, num_controls: int = 300, steps: int = 3
+) -> None:
+    """
+    Compare the legacy disk round-trip screenshot pipeline of an AppAgent step with the in-memory frame pipeline.
+    The window capture is simulated with synthetic images, so no Windows dependency is needed.
+    :param width: The width of the synthetic window.
+    :param height: The height of the synthetic window.
+    :param num_controls: The number of annotated controls.
+    :param steps: The number of simulated steps.
+    """
+    import tempfile
+    import time
+
+    from PIL import ImageDraw
+
+    def encode_from_path(path: str) -> str:
+        with open(path, "rb") as file:
+            return "data:image/png;base64," + base64.b64encode(file.read()).decode(
+                "ascii"
+            )
+
+    def legacy_step(folder: str, step: int) -> None:
+        clean_path = os.path.join(folder, f"action_step{step}.png")
+        annotated_path = os.path.join(folder, f"action_step{step}_annotated.png")
+        concat_path = os.path.join(folder, f"action_step{step}_concat.png")
+        selected_path = os.path.join(folder, f"action_step{step}_selected_controls.png")
+        last_path = os.path.join(folder, f"action_step{step - 1}_selected_controls.png")
+
+        # Capture and save the clean screenshot.
+        _synthetic_screenshot(width, height, step).save(
+            clean_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL
+        )
+        # The annotation captures the window again.
+        annotated = _annotate(
+            _synthetic_screenshot(width, height, step), num_controls, step
+        )
+        annotated.save(annotated_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+        # Encode the last screenshot from the disk.
+        if os.path.exists(last_path):
+            encode_from_path(last_path)
+        # Re-open both images to concatenate them, then re-read the result to encode it.
+        _concat(Image.open(clean_path), Image.open(annotated_path)).save(
+            concat_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL
+        )
+        encode_from_path(concat_path)
+        # Re-open the clean screenshot to draw the selected control.
+        selected = Image.open(clean_path)
+        ImageDraw.Draw(selected).rectangle((10, 10, 200, 60), outline="red", width=3)
+        selected.save(selected_path, compress_level=DEFAULT_PNG_COMPRESS_LEVEL)
+
+    def frame_step(folder: str, step: int) -> None:
+        clean_path = os.path.join(folder, f"action_step{step}.png")
+        annotated_path = os.path.join(folder, f"action_step{step}_annotated.png")
+        concat_path = os.path.join(folder, f"action_step{step}_concat.png")
+        selected_path = os.path.join(folder, f"action_step{step}_selected_controls.png")
+        last_path = os.path.join(folder, f"action_step{step - 1}_selected_controls.png")
+
+        clean = FrameStore.put(_synthetic_screenshot(width, height, step), clean_path)
+        annotated = FrameStore.put(
+            _annotate(clean.copy_image(), num_controls, step), annotated_path
+        )
+        last = FrameStore.get(last_path)
+        if last is not None:
+            last.to_data_url()
+        FrameStore.put(_concat(clean.image, annotated.image), concat_path).to_data_url()
+        selected = clean.copy_image()
+        ImageDraw.Draw(selected).rectangle((10, 10, 200, 60), outline="red", width=3)
+        FrameStore.put(selected, selected_path)
+
+    def run(step_func) -> tuple:
+        step_time, total_time = 0.0, 0.0
+        with tempfile.TemporaryDirectory() as folder:
+            for step in range(steps):
+                start = time.perf_counter()
+                step_func(folder, step)
+                step_time += time.perf_counter() - start
+                FrameStore.flush()
+                total_time += time.perf_counter() - start
+            FrameStore.clear()
+        return step_time / steps, total_time / steps
+
+    # The synthetic capture itself is paid by both pipelines, so it is reported separately.
+    start = time.perf_counter()
+    _synthetic_screenshot(width, height, 0)
+    capture_time = time.perf_counter() - start
+
+    legacy_step_time, legacy_total = run(legacy_step)
+    frame_step_time, frame_total = run(frame_step)
+
+    print(
+        f"Window {width}x{height}, {num_controls} controls, {steps} steps, "
+        f"PNG compress level {DEFAULT_PNG_COMPRESS_LEVEL}, synthetic capture {capture_time:.3f}s."
+    )
+    print(
+        f"Legacy pipeline: {legacy_step_time:.3f}s blocking per step, {legacy_total:.3f}s including disk writes."
+    )
+    print(
+        f"Frame pipeline:  {frame_step_time:.3f}s blocking per step, {frame_total:.3f}s including disk writes."
+    )
+
+
+if __name__ == "__main__":
+    benchmark()
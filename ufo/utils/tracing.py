@@ -0,0 +1,326 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A lightweight span tracer of the steps of a session, in the model of the OpenTelemetry spans.
+
+The work of a step is covered by nested spans: the methods of the processors, the screenshots and the image encoding
+of the photographer, the COM calls of the control inspector, the retrievers, the LLM requests and their attempts, and
+the commands of the puppeteer. The spans of a session are recorded while it runs, and exported to its log folder as a
+Chrome trace (trace.json, to open in chrome://tracing or https://ui.perfetto.dev) or as OTLP JSON (trace.otlp.json).
+
+Without a recording session, e.g. with TRACE_MODE "off", a span costs a context variable lookup. The current span is
+held in a context variable, so that the spans of the threads started with a copy of the context, e.g. the hedged LLM
+requests, are nested in the span which started them.
+"""
+
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from ufo.config.config import Config
+from ufo.utils import print_with_color
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    TRACE_MODE = str(configs.get("TRACE_MODE", "off")).lower()
+else:
+    TRACE_MODE = "off"
+
+TRACE_FILES = {"chrome": "trace.json", "otlp": "trace.otlp.json"}
+
+
+@dataclass
+class Span:
+    """
+    A span of work, with its start and end in nanoseconds since the epoch.
+    """
+
+    name: str
+    span_id: int
+    parent_id: Optional[int]
+    start_ns: int
+    thread_id: int
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    end_ns: int = 0
+    error: Optional[str] = None
+
+    @property
+    def duration_ns(self) -> int:
+        """
+        The duration of the span.
+        """
+        return self.end_ns - self.start_ns
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """
+        Set an attribute of the span.
+        :param key: The key of the attribute.
+        :param value: The value.
+        """
+        self.attributes[key] = value
+
+
+class _NoopSpan:
+    """
+    The span returned when no session is recorded, ignoring its attributes.
+    """
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+# Stateless, shared by all the spans of the blocks traced while no session is recorded.
+_NOOP_CONTEXT = contextlib.nullcontext(_NOOP_SPAN)
+
+
+class TraceRecorder:
+    """
+    The recorder of the spans of a session.
+    """
+
+    def __init__(self) -> None:
+        """
+        Initialize the recorder.
+        """
+        self.trace_id = int.from_bytes(os.urandom(16), "big")
+        self.spans: List[Span] = []
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def new_span_id(self) -> int:
+        """
+        Get a new span ID, unique in the trace.
+        :return: The span ID.
+        """
+        with self._lock:
+            self._next_id += 1
+            return self._next_id
+
+    def add(self, span: Span) -> None:
+        """
+        Add a finished span.
+        :param span: The span.
+        """
+        with self._lock:
+            self.spans.append(span)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """
+        Convert the spans to the Chrome trace event format, as complete events in microseconds.
+        :return: The trace.
+        """
+        pid = os.getpid()
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start_ns)
+        events = []
+        for span in spans:
+            args = dict(span.attributes)
+            if span.error is not None:
+                args["error"] = span.error
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": span.start_ns / 1000,
+                    "dur": span.duration_ns / 1000,
+                    "pid": pid,
+                    "tid": span.thread_id,
+                    "args": args,
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """
+        Convert the spans to the OTLP JSON format of an export request.
+        :return: The export request.
+        """
+
+        def attributes(values: Dict[str, Any]) -> List[Dict[str, Any]]:
+            converted = []
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    typed = {"boolValue": value}
+                elif isinstance(value, int):
+                    typed = {"intValue": str(value)}
+                elif isinstance(value, float):
+                    typed = {"doubleValue": value}
+                else:
+                    typed = {"stringValue": str(value)}
+                converted.append({"key": key, "value": typed})
+            return converted
+
+        with self._lock:
+            spans = list(self.spans)
+        otlp_spans = []
+        for span in spans:
+            otlp_span = {
+                "traceId": f"{self.trace_id:032x}",
+                "spanId": f"{span.span_id:016x}",
+                "name": span.name,
+                "kind": 1,
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": attributes(
+                    {**span.attributes, "thread.id": span.thread_id}
+                ),
+                "status": (
+                    {"code": 2, "message": span.error}
+                    if span.error is not None
+                    else {"code": 1}
+                ),
+            }
+            if span.parent_id is not None:
+                otlp_span["parentSpanId"] = f"{span.parent_id:016x}"
+            otlp_spans.append(otlp_span)
+
+        return {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": attributes(
+                            {"service.name": "ufo", "process.pid": os.getpid()}
+                        )
+                    },
+                    "scopeSpans": [{"scope": {"name": "ufo"}, "spans": otlp_spans}],
+                }
+            ]
+        }
+
+    def export(self, path: str, mode: str) -> None:
+        """
+        Export the spans to a file.
+        :param path: The path of the file.
+        :param mode: The format, "chrome" or "otlp".
+        """
+        trace = self.to_otlp() if mode == "otlp" else self.to_chrome_trace()
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(trace, file)
+
+
+_recorder: contextvars.ContextVar[Optional[TraceRecorder]] = contextvars.ContextVar(
+    "trace_recorder", default=None
+)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar(
+    "trace_current_span", default=None
+)
+
+
+@contextlib.contextmanager
+def _record_span(
+    recorder: TraceRecorder, name: str, attributes: Dict[str, Any]
+) -> Iterator[Span]:
+    """
+    Record a span, nested in the current span.
+    :param recorder: The recorder of the session.
+    :param name: The name of the span.
+    :param attributes: The attributes of the span.
+    :return: The span, running until the end of the block.
+    """
+    parent = _current_span.get()
+    span = Span(
+        name,
+        recorder.new_span_id(),
+        parent.span_id if parent is not None else None,
+        time.time_ns(),
+        threading.get_ident(),
+        attributes,
+    )
+    start = time.perf_counter_ns()
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        # StopIteration ends the steps with a handled error.
+        if not isinstance(e, (StopIteration, GeneratorExit)):
+            span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        # The end is measured with the monotonic clock.
+        span.end_ns = span.start_ns + time.perf_counter_ns() - start
+        recorder.add(span)
+
+
+def span(name: str, **attributes: Any) -> Any:
+    """
+    Trace a block of work, e.g. with span("llm.attempt", model=model) as current: ...
+    :param name: The name of the span, prefixed with its category, e.g. "inspector.find_control_elements".
+    :param attributes: The attributes of the span.
+    :return: The context manager of the span, a no-op if no session is recorded.
+    """
+    recorder = _recorder.get()
+    if recorder is None:
+        return _NOOP_CONTEXT
+    return _record_span(recorder, name, attributes)
+
+
+def traced(name: Optional[str] = None) -> Callable[[Callable], Callable]:
+    """
+    Decorator to trace the calls of a function.
+    :param name: The name of the spans, the qualified name of the function by default.
+    :return: The decorator.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            recorder = _recorder.get()
+            if recorder is None:
+                return func(*args, **kwargs)
+            with _record_span(recorder, span_name, {}):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def tracing_enabled() -> bool:
+    """
+    Whether the spans are recorded, to skip the preparation of costly attributes.
+    :return: True if a session is recorded.
+    """
+    return _recorder.get() is not None
+
+
+@contextlib.contextmanager
+def record_trace(
+    log_path: Optional[str], mode: str = TRACE_MODE
+) -> Iterator[Optional[TraceRecorder]]:
+    """
+    Record the spans of a session, and export them to its log folder at the end.
+    :param log_path: The log folder of the session, None to keep the spans in memory only.
+    :param mode: The format of the export, "chrome" or "otlp", or "off" to record nothing.
+    :return: The recorder, None if the tracing is off.
+    """
+    if mode not in TRACE_FILES:
+        yield None
+        return
+
+    recorder = TraceRecorder()
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+        if log_path is not None:
+            try:
+                recorder.export(os.path.join(log_path, TRACE_FILES[mode]), mode)
+            except OSError as e:
+                print_with_color(
+                    f"Failed to export the trace to {log_path}: {e}", "yellow"
+                )
+
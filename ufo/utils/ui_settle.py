@@ -0,0 +1,206 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+Wait until the UI settles, instead of sleeping a fixed time after every action and step.
+
+Low-resolution frames of the window are sampled at a fixed interval and compared with the previous frame, either by
+the difference hash (dHash) of the frames or by the mean pixel delta of the downsampled grayscale frames. The wait
+returns once a number of consecutive frames are stable, or at the timeout, which is the fixed sleep it replaces. A
+short minimum wait lets the UI start reacting to the action before the first frame is sampled.
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from ufo.config.config import Config
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    UI_SETTLE_WAIT = configs.get("UI_SETTLE_WAIT", True)
+    UI_SETTLE_METHOD = configs.get("UI_SETTLE_METHOD", "dhash")
+    UI_SETTLE_THRESHOLD = float(configs.get("UI_SETTLE_THRESHOLD", 0.01))
+    UI_SETTLE_INTERVAL = float(configs.get("UI_SETTLE_INTERVAL", 0.1))
+    UI_SETTLE_STABLE_FRAMES = int(configs.get("UI_SETTLE_STABLE_FRAMES", 2))
+    UI_SETTLE_MIN_WAIT = float(configs.get("UI_SETTLE_MIN_WAIT", 0.2))
+else:
+    UI_SETTLE_WAIT = False
+    UI_SETTLE_METHOD = "dhash"
+    UI_SETTLE_THRESHOLD = 0.01
+    UI_SETTLE_INTERVAL = 0.1
+    UI_SETTLE_STABLE_FRAMES = 2
+    UI_SETTLE_MIN_WAIT = 0.2
+
+
+# The size of the difference hash, in bits per side.
+HASH_SIZE = 16
+
+# The size of the downsampled frames compared pixel by pixel.
+PIXEL_SIZE = (64, 36)
+
+
+def difference_hash(image: Image.Image, hash_size: int = HASH_SIZE) -> np.ndarray:
+    """
+    Compute the difference hash of an image: whether every pixel of the downsampled grayscale image is brighter than
+    its right neighbour.
+    :param image: The image.
+    :param hash_size: The number of bits per side of the hash.
+    :return: The (hash_size * hash_size,) boolean array of the hash bits.
+    """
+    pixels = np.asarray(
+        image.convert("L").resize((hash_size + 1, hash_size), Image.BOX),
+        dtype=np.int16,
+    )
+    return (pixels[:, 1:] > pixels[:, :-1]).ravel()
+
+
+def downsample(image: Image.Image, size: Tuple[int, int] = PIXEL_SIZE) -> np.ndarray:
+    """
+    Downsample an image to a small grayscale array.
+    :param image: The image.
+    :param size: The (width, height) of the array.
+    :return: The (height, width) float array of the pixels, between 0 and 1.
+    """
+    pixels = np.asarray(image.convert("L").resize(size, Image.BOX), dtype=np.float32)
+    return pixels / 255.0
+
+
+@dataclass
+class SettleResult:
+    """
+    The result of a wait for the UI to settle.
+    """
+
+    settled: bool
+    elapsed: float
+    frames: int
+
+
+class UISettleDetector:
+    """
+    Detect when consecutive frames of the UI stop changing.
+    """
+
+    def __init__(
+        self,
+        method: str = UI_SETTLE_METHOD,
+        threshold: float = UI_SETTLE_THRESHOLD,
+        interval: float = UI_SETTLE_INTERVAL,
+        stable_frames: int = UI_SETTLE_STABLE_FRAMES,
+        min_wait: float = UI_SETTLE_MIN_WAIT,
+    ) -> None:
+        """
+        Initialize the detector.
+        :param method: The comparison of the frames, "dhash" or "pixel".
+        :param threshold: The largest difference of two stable frames: the fraction of different hash bits for "dhash",
+        the mean pixel delta between 0 and 1 for "pixel".
+        :param interval: The interval between two frames, in seconds.
+        :param stable_frames: The number of consecutive stable frame comparisons to consider the UI settled.
+        :param min_wait: The time to wait before the first frame, in seconds.
+        """
+        if method not in ("dhash", "pixel"):
+            raise ValueError(f"Unknown UI settle method: {method}")
+
+        self.method = method
+        self.threshold = threshold
+        self.interval = interval
+        self.stable_frames = max(1, stable_frames)
+        self.min_wait = min_wait
+
+    def signature(self, image: Image.Image) -> np.ndarray:
+        """
+        Compute the signature of a frame compared between frames.
+        :param image: The frame.
+        :return: The signature.
+        """
+        if self.method == "dhash":
+            return difference_hash(image)
+        return downsample(image)
+
+    def difference(self, signature1: np.ndarray, signature2: np.ndarray) -> float:
+        """
+        Compute the difference between the signatures of two frames.
+        :param signature1: The signature of the first frame.
+        :param signature2: The signature of the second frame.
+        :return: The difference, between 0 and 1.
+        """
+        if signature1.shape != signature2.shape:
+            return 1.0
+        if self.method == "dhash":
+            return float(np.count_nonzero(signature1 != signature2)) / signature1.size
+        return float(np.abs(signature1 - signature2).mean())
+
+    def wait(
+        self,
+        capture: Callable[[], Optional[Image.Image]],
+        timeout: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> SettleResult:
+        """
+        Wait until the UI settles or the timeout expires.
+        :param capture: The callable capturing a frame. A frame of None, or an exception, ends the wait early.
+        :param timeout: The longest wait, in seconds.
+        :param clock: The clock, in seconds.
+        :param sleep: The sleep function.
+        :return: The result of the wait.
+        """
+        start = clock()
+        deadline = start + timeout
+
+        sleep(min(self.min_wait, timeout))
+
+        previous = None
+        stable = 0
+        frames = 0
+
+        while True:
+            try:
+                image = capture()
+            except Exception:
+                image = None
+            if image is None:
+                return SettleResult(False, clock() - start, frames)
+
+            frames += 1
+            signature = self.signature(image)
+            if previous is not None:
+                if self.difference(previous, signature) <= self.threshold:
+                    stable += 1
+                else:
+                    stable = 0
+            previous = signature
+
+            if stable >= self.stable_frames:
+                return SettleResult(True, clock() - start, frames)
+
+            remaining = deadline - clock()
+            if remaining <= 0:
+                return SettleResult(False, clock() - start, frames)
+            sleep(min(self.interval, remaining))
+
+
+def wait_until_settled(
+    capture: Optional[Callable[[], Optional[Image.Image]]],
+    timeout: float,
+    detector: Optional[UISettleDetector] = None,
+) -> SettleResult:
+    """
+    Wait until the UI settles, or sleep for the timeout if the wait is disabled by UI_SETTLE_WAIT or there is nothing
+    to capture.
+    :param capture: The callable capturing a frame, or None.
+    :param timeout: The longest wait, the fixed sleep replaced by the wait, in seconds.
+    :param detector: The detector, created from the configuration if not provided.
+    :return: The result of the wait.
+    """
+    if not UI_SETTLE_WAIT or capture is None:
+        time.sleep(timeout)
+        return SettleResult(False, timeout, 0)
+
+    return (detector or UISettleDetector()).wait(capture, timeout)
+
@@ -0,0 +1,324 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+An order-aware diff of two UI trees, in the nested dictionary format of UITree.
+
+The children of two matched nodes are matched by key: first by control type and name, in order, then the remaining
+children of the same control type are paired by the overlap of their rectangles, e.g. a control renamed in place. The
+longest increasing subsequence of the matched children, in the order of the new tree, is the longest common subsequence
+of the two lists: these children stay in place, and the other matched children are recorded as moved. The added and
+moved children are recorded with their index in the new list of children, so that applying the diff gives exactly the
+new tree, in order. The work is linear in the size of the trees, up to a logarithmic factor for the reordered lists.
+
+All the paths are lists of node IDs in the old tree, the last ID being the node itself. The diff has the keys:
+
+- added: the new subtrees, with the path of their parent followed by their ID, their index and the node.
+- removed: the paths of the removed subtrees.
+- moved: the paths of the moved nodes, with their new index among the children of their parent.
+- modified: the paths of the modified nodes, with the old and new values of the changed fields.
+- remapped: only present if some matched nodes have a new ID, the new ID of every such node by its old ID.
+
+The IDs are not compared as a field: the trees captured without the snapshotter number their nodes in pre-order, so
+one insertion shifts the ID of every later node. The renumbering is recorded once in the remap instead.
+"""
+
+import bisect
+from collections import defaultdict, deque
+from typing import Any, Dict, List, Sequence, Tuple
+
+# The fields of a node compared in the diff. The error field is optional.
+DIFF_FIELDS = (
+    "name",
+    "control_type",
+    "rectangle",
+    "adjusted_rectangle",
+    "relative_rectangle",
+    "level",
+    "error",
+)
+
+# The lowest IoU of the rectangles of two children of the same control type to match them despite different names.
+RECT_MATCH_THRESHOLD = 0.5
+
+
+def empty_diff() -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Create an empty diff.
+    :return: The empty diff.
+    """
+    return {"added": [], "removed": [], "moved": [], "modified": []}
+
+
+def longest_increasing_subsequence(values: Sequence[int]) -> List[int]:
+    """
+    Find a longest strictly increasing subsequence.
+    :param values: The values.
+    :return: The positions of the values in the subsequence.
+    """
+    tails: List[int] = []
+    tail_positions: List[int] = []
+    previous = [-1] * len(values)
+
+    for position, value in enumerate(values):
+        slot = bisect.bisect_left(tails, value)
+        if slot > 0:
+            previous[position] = tail_positions[slot - 1]
+        if slot == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[slot] = value
+            tail_positions[slot] = position
+
+    result = []
+    position = tail_positions[-1] if tail_positions else -1
+    while position >= 0:
+        result.append(position)
+        position = previous[position]
+    return result[::-1]
+
+
+def _rect_iou(rect1: Dict[str, int], rect2: Dict[str, int]) -> float:
+    """
+    Compute the IoU of two rectangles.
+    :param rect1: The first rectangle.
+    :param rect2: The second rectangle.
+    :return: The IoU, 0 if the rectangles are empty.
+    """
+    left = max(rect1["left"], rect2["left"])
+    top = max(rect1["top"], rect2["top"])
+    right = min(rect1["right"], rect2["right"])
+    bottom = min(rect1["bottom"], rect2["bottom"])
+
+    intersection = max(0, right - left) * max(0, bottom - top)
+    area1 = (rect1["right"] - rect1["left"]) * (rect1["bottom"] - rect1["top"])
+    area2 = (rect2["right"] - rect2["left"]) * (rect2["bottom"] - rect2["top"])
+    union = area1 + area2 - intersection
+
+    return intersection / union if union > 0 else 0.0
+
+
+def match_children(
+    children1: List[Dict[str, Any]], children2: List[Dict[str, Any]]
+) -> List[Tuple[int, int]]:
+    """
+    Match the children of two matched nodes.
+    :param children1: The children in the old tree.
+    :param children2: The children in the new tree.
+    :return: The matched pairs of indices (old index, new index), in the order of the new indices.
+    """
+    # Match the children with the same control type and name, in order.
+    candidates = defaultdict(deque)
+    for index, child in enumerate(children1):
+        candidates[(child["control_type"], child["name"])].append(index)
+
+    matches = {}
+    unmatched2 = []
+    for index, child in enumerate(children2):
+        queue = candidates.get((child["control_type"], child["name"]))
+        if queue:
+            matches[index] = queue.popleft()
+        else:
+            unmatched2.append(index)
+
+    # Pair the remaining children of the same control type with the most overlapping rectangles.
+    if unmatched2:
+        unmatched1 = defaultdict(list)
+        for queue in candidates.values():
+            for index in queue:
+                unmatched1[children1[index]["control_type"]].append(index)
+
+        for index in unmatched2:
+            child = children2[index]
+            pool = unmatched1.get(child["control_type"])
+            if not pool:
+                continue
+            best, best_iou = None, RECT_MATCH_THRESHOLD
+            for position, candidate in enumerate(pool):
+                iou = _rect_iou(children1[candidate]["rectangle"], child["rectangle"])
+                if iou >= best_iou:
+                    best, best_iou = position, iou
+            if best is not None:
+                matches[index] = pool.pop(best)
+
+    return sorted(((old, new) for new, old in matches.items()), key=lambda x: x[1])
+
+
+def diff_ui_trees(
+    ui_tree_1: Dict[str, Any], ui_tree_2: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Compute the diff between two UI trees.
+    :param ui_tree_1: The old UI tree.
+    :param ui_tree_2: The new UI tree.
+    :return: The diff, such that apply_ui_tree_diff(ui_tree_1, diff) == ui_tree_2.
+    """
+    diff = empty_diff()
+
+    # A tree that could not be captured has no ID, the whole tree is replaced.
+    if "id" not in ui_tree_1 or "id" not in ui_tree_2:
+        if ui_tree_1 != ui_tree_2:
+            diff["removed"].append({"path": [ui_tree_1.get("id")]})
+            diff["added"].append(
+                {"path": [ui_tree_2.get("id")], "index": 0, "node": ui_tree_2}
+            )
+        return diff
+
+    remapped = {}
+
+    # The roots are always matched, they are the same window.
+    stack = [(ui_tree_1, ui_tree_2, [ui_tree_1["id"]])]
+
+    while stack:
+        node1, node2, path = stack.pop()
+
+        if node1["id"] != node2["id"]:
+            remapped[node1["id"]] = node2["id"]
+
+        changes = {}
+        for diff_field in DIFF_FIELDS:
+            value1 = node1.get(diff_field)
+            value2 = node2.get(diff_field)
+            if value1 != value2:
+                changes[diff_field] = (value1, value2)
+        if changes:
+            diff["modified"].append({"path": path, "changes": changes})
+
+        children1 = node1.get("children", [])
+        children2 = node2.get("children", [])
+        if not children1 and not children2:
+            continue
+
+        matches = match_children(children1, children2)
+
+        matched1 = set()
+        matched2 = set()
+        for old, new in matches:
+            matched1.add(old)
+            matched2.add(new)
+            stack.append(
+                (children1[old], children2[new], path + [children1[old]["id"]])
+            )
+
+        for index, child in enumerate(children1):
+            if index not in matched1:
+                diff["removed"].append({"path": path + [child["id"]]})
+
+        for index, child in enumerate(children2):
+            if index not in matched2:
+                diff["added"].append(
+                    {"path": path + [child["id"]], "index": index, "node": child}
+                )
+
+        # The matched children out of the longest common subsequence have moved.
+        in_place = set(longest_increasing_subsequence([old for old, _ in matches]))
+        for position, (old, new) in enumerate(matches):
+            if position not in in_place:
+                diff["moved"].append(
+                    {"path": path + [children1[old]["id"]], "index": new}
+                )
+
+    if remapped:
+        diff["remapped"] = remapped
+
+    return diff
+
+
+def _copy_tree(node: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy a UI tree, with new dictionaries for the nodes and their rectangles.
+    :param node: The root of the tree.
+    :return: The copy.
+    """
+    copied = {}
+    for key, value in node.items():
+        if key == "children":
+            copied[key] = [_copy_tree(child) for child in value]
+        elif isinstance(value, dict):
+            copied[key] = dict(value)
+        else:
+            copied[key] = value
+    return copied
+
+
+def apply_ui_tree_diff(
+    ui_tree_1: Dict[str, Any], diff: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Apply a diff to a UI tree. The tree is not modified.
+    :param ui_tree_1: The old UI tree.
+    :param diff: The diff from diff_ui_trees or from the incremental UI tree snapshots.
+    :return: The new UI tree.
+    """
+    # Replacing the root replaces the whole tree.
+    for addition in diff.get("added", []):
+        if len(addition["path"]) == 1:
+            return _copy_tree(addition["node"])
+
+    ui_tree_2 = _copy_tree(ui_tree_1)
+
+    id_map = {}
+    parent_map = {}
+    stack = [ui_tree_2]
+    while stack:
+        node = stack.pop()
+        id_map[node["id"]] = node
+        for child in node.get("children", []):
+            parent_map[child["id"]] = node
+            stack.append(child)
+
+    # Detach the removed and moved nodes, then insert the added and moved nodes at their final index, in ascending
+    # order, among the children left in place.
+    detached = defaultdict(set)
+    for removal in diff.get("removed", []):
+        node_id = removal["path"][-1]
+        detached[id(parent_map[node_id])].add(node_id)
+
+    insertions = defaultdict(list)
+    for move in diff.get("moved", []):
+        node_id = move["path"][-1]
+        parent = parent_map[node_id]
+        detached[id(parent)].add(node_id)
+        insertions[move["path"][-2]].append((move["index"], id_map[node_id]))
+
+    for addition in diff.get("added", []):
+        insertions[addition["path"][-2]].append(
+            (addition["index"], _copy_tree(addition["node"]))
+        )
+
+    parents = {id(node): node for node in parent_map.values()}
+    for parent_key, node_ids in detached.items():
+        parent = parents[parent_key]
+        parent["children"] = [
+            child for child in parent["children"] if child["id"] not in node_ids
+        ]
+
+    for parent_id, nodes in insertions.items():
+        children = id_map[parent_id].setdefault("children", [])
+        for index, node in sorted(nodes, key=lambda x: x[0]):
+            children.insert(index, node)
+
+    for modification in diff.get("modified", []):
+        node = id_map[modification["path"][-1]]
+        for diff_field, (_, new_value) in modification["changes"].items():
+            if new_value is None and diff_field == "error":
+                node.pop(diff_field, None)
+            else:
+                node[diff_field] = new_value
+
+    # The added nodes already carry their new IDs, only the nodes of the old tree are renamed.
+    for old_id, new_id in diff.get("remapped", {}).items():
+        id_map[old_id]["id"] = new_id
+
+    return ui_tree_2
+
+
+def diff_size(diff: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Count the entries of a diff.
+    :param diff: The diff.
+    :return: The number of entries of every kind.
+    """
+    return {kind: len(entries) for kind, entries in diff.items()}
+
@@ -0,0 +1,531 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+An incremental snapshotter of the UI tree of a window.
+
+Walking a UI tree costs one round-trip to the UI Automation server per node. The snapshotter keeps the tree of the
+previous step, with every node keyed by its runtime id, or by a hash of its path when the runtime id is not available.
+A subtree is walked again only if the name, control type, bounding rectangle or number of children of its root has
+changed. Otherwise the previous subtree is reused without visiting the nodes below it. A change deep inside an unchanged
+container is therefore only seen at the next full walk, which happens every full_refresh_interval snapshots.
+
+The diff with the previous snapshot is emitted during the walk, in the format of ufo.utils.ui_tree_diff, instead of
+being computed afterwards from two full trees.
+"""
+
+import traceback
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from ufo.config.config import Config
+from ufo.utils.ui_tree_diff import (
+    DIFF_FIELDS,
+    empty_diff,
+    longest_increasing_subsequence,
+)
+
+configs = Config.get_instance().config_data
+
+if configs is not None:
+    UI_TREE_FULL_REFRESH_INTERVAL = int(
+        configs.get("UI_TREE_FULL_REFRESH_INTERVAL", 10)
+    )
+    UI_TREE_REUSE_MIN_LEVEL = int(configs.get("UI_TREE_REUSE_MIN_LEVEL", 2))
+else:
+    UI_TREE_FULL_REFRESH_INTERVAL = 10
+    UI_TREE_REUSE_MIN_LEVEL = 2
+
+
+Rect = Tuple[int, int, int, int]
+
+
+@dataclass
+class UITreeSnapshot:
+    """
+    A snapshot of the UI tree, with its diff from the previous snapshot.
+    """
+
+    tree: Dict[str, Any]
+    diff: Dict[str, List[Dict[str, Any]]]
+    full: bool = False
+    visited: int = 0
+    reused: int = 0
+
+
+@dataclass
+class _NodeRecord:
+    """
+    The record of a node in the previous snapshot.
+    """
+
+    node: Dict[str, Any]
+    signature: Tuple
+    child_keys: List[Hashable]
+
+
+@dataclass
+class _WalkContext:
+    """
+    The state of a walk.
+    """
+
+    window_rect: Rect
+    full: bool
+    records: Dict[Hashable, _NodeRecord] = field(default_factory=dict)
+    diff: Dict[str, List[Dict[str, Any]]] = field(default_factory=empty_diff)
+    visited: int = 0
+    reused: int = 0
+
+
+class UITreeSnapshotter:
+    """
+    The incremental snapshotter of the UI tree of a window. Use get_instance to share one snapshotter per window across
+    the steps.
+    """
+
+    _instances: "OrderedDict[Hashable, UITreeSnapshotter]" = OrderedDict()
+    _max_instances = 8
+
+    def __init__(
+        self,
+        full_refresh_interval: int = UI_TREE_FULL_REFRESH_INTERVAL,
+        reuse_min_level: int = UI_TREE_REUSE_MIN_LEVEL,
+    ) -> None:
+        """
+        Initialize the snapshotter.
+        :param full_refresh_interval: Walk the whole tree every this number of snapshots. 0 to never force a full walk.
+        :param reuse_min_level: The lowest level of the subtrees that can be reused. The levels above are always walked.
+        """
+        self.full_refresh_interval = full_refresh_interval
+        self.reuse_min_level = max(1, reuse_min_level)
+
+        self._records: Dict[Hashable, _NodeRecord] = {}
+        self._root_key: Optional[Hashable] = None
+        self._window_rect: Optional[Rect] = None
+        self._node_counter = 0
+        self._snapshot_counter = 0
+
+    @classmethod
+    def get_instance(cls, root: Any) -> "UITreeSnapshotter":
+        """
+        Get the snapshotter of a window, creating it at the first call.
+        :param root: The window.
+        :return: The snapshotter of the window.
+        """
+        key = getattr(root.element_info, "handle", None) or cls._runtime_id(
+            root.element_info
+        )
+        if key is None:
+            key = id(root)
+
+        if key in cls._instances:
+            cls._instances.move_to_end(key)
+        else:
+            cls._instances[key] = UITreeSnapshotter()
+            while len(cls._instances) > cls._max_instances:
+                cls._instances.popitem(last=False)
+
+        return cls._instances[key]
+
+    def reset(self) -> None:
+        """
+        Forget the previous snapshot. The next snapshot is a full walk.
+        """
+        self._records = {}
+        self._root_key = None
+        self._window_rect = None
+
+    def snapshot(self, root: Any) -> UITreeSnapshot:
+        """
+        Take a snapshot of the UI tree of the window.
+        :param root: The window.
+        :return: The snapshot, with the diff from the previous snapshot.
+        """
+        window_rect = self._rect_tuple(root.element_info.rectangle)
+
+        # A resized window moves the controls inside it, every subtree must be walked again.
+        full = (
+            not self._records
+            or self._size(window_rect) != self._size(self._window_rect)
+            or (
+                self.full_refresh_interval > 0
+                and self._snapshot_counter % self.full_refresh_interval == 0
+            )
+        )
+
+        context = _WalkContext(window_rect=window_rect, full=full)
+        tree, root_key = self._walk(root, 0, {}, None, [], context, report=True)
+
+        # A new window replaces the previous tree entirely.
+        if root_key != self._root_key:
+            if self._root_key is not None:
+                previous_root = self._records[self._root_key].node
+                context.diff["removed"].append({"path": [previous_root["id"]]})
+            context.diff["added"].append(
+                {"path": [tree["id"]], "index": 0, "node": tree}
+            )
+
+        self._records = context.records
+        self._root_key = root_key
+        self._window_rect = window_rect
+        self._snapshot_counter += 1
+
+        return UITreeSnapshot(
+            tree=tree,
+            diff=context.diff,
+            full=full,
+            visited=context.visited,
+            reused=context.reused,
+        )
+
+    def _walk(
+        self,
+        element: Any,
+        level: int,
+        sibling_counts: Dict[Tuple[str, str], int],
+        parent_key: Optional[Hashable],
+        path: List[str],
+        context: _WalkContext,
+        report: bool,
+    ) -> Tuple[Dict[str, Any], Hashable]:
+        """
+        Walk a subtree, reusing the previous subtree if its root is unchanged.
+        :param element: The root element of the subtree.
+        :param level: The level of the element.
+        :param sibling_counts: The number of the previous siblings with each control type and name.
+        :param parent_key: The key of the parent element.
+        :param path: The IDs of the ancestors.
+        :param context: The state of the walk.
+        :param report: Whether to report the changes of the subtree in the diff.
+        :return: The node and its key.
+        """
+        element_info = element.element_info
+        name = element_info.name
+        control_type = element_info.control_type
+        rect = self._rect_tuple(element_info.rectangle)
+
+        ordinal = sibling_counts.get((control_type, name), 0)
+        sibling_counts[(control_type, name)] = ordinal + 1
+        key = self._element_key(element_info, parent_key, control_type, name, ordinal)
+
+        children = element.children()
+        # The rectangle in the signature is relative to the window, so that the subtrees survive a move of the window.
+        window_left, window_top = context.window_rect[:2]
+        signature = (
+            name,
+            control_type,
+            (
+                rect[0] - window_left,
+                rect[1] - window_top,
+                rect[2] - window_left,
+                rect[3] - window_top,
+            ),
+            len(children),
+        )
+
+        previous = self._records.get(key)
+        node_id = previous.node["id"] if previous is not None else self._new_id()
+        node_path = path + [node_id]
+
+        if (
+            previous is not None
+            and not context.full
+            and level >= self.reuse_min_level
+            and previous.signature == signature
+            and previous.node["level"] == level
+        ):
+            return self._reuse(key, node_path, context, report), key
+
+        context.visited += 1
+        node = self._make_node(node_id, name, control_type, rect, level, context)
+
+        report_children = report and previous is not None
+
+        child_sibling_counts = {}
+        child_keys = []
+        for child in children:
+            try:
+                child_node, child_key = self._walk(
+                    child,
+                    level + 1,
+                    child_sibling_counts,
+                    key,
+                    node_path,
+                    context,
+                    report=report_children,
+                )
+                node["children"].append(child_node)
+                child_keys.append(child_key)
+            except Exception as e:
+                node["error"] = traceback.format_exc()
+
+        if report_children:
+            self._report_changes(previous.node, node, node_path, context)
+            self._report_children(previous, node, child_keys, node_path, context)
+
+        context.records[key] = _NodeRecord(node, signature, child_keys)
+
+        return node, key
+
+    def _reuse(
+        self,
+        key: Hashable,
+        path: List[str],
+        context: _WalkContext,
+        report: bool,
+    ) -> Dict[str, Any]:
+        """
+        Reuse a subtree of the previous snapshot. The nodes are shared with the previous snapshot, unless the window
+        has moved and their adjusted rectangles must be computed again.
+        :param key: The key of the root of the subtree.
+        :param path: The IDs of the root and its ancestors.
+        :param context: The state of the walk.
+        :param report: Whether to report the changes of the subtree in the diff.
+        :return: The root node of the subtree.
+        """
+        record = self._records[key]
+        previous_node = record.node
+
+        if context.window_rect == self._window_rect:
+            node = previous_node
+        else:
+            # The window has moved with its content, only the absolute rectangles change.
+            left, top, right, bottom = self._rect_from_dict(previous_node["rectangle"])
+            dx = context.window_rect[0] - self._window_rect[0]
+            dy = context.window_rect[1] - self._window_rect[1]
+            rect = (left + dx, top + dy, right + dx, bottom + dy)
+            node = self._make_node(
+                previous_node["id"],
+                previous_node["name"],
+                previous_node["control_type"],
+                rect,
+                previous_node["level"],
+                context,
+            )
+            if report:
+                self._report_changes(previous_node, node, path, context)
+
+        context.reused += 1
+        context.records[key] = _NodeRecord(node, record.signature, record.child_keys)
+
+        if node is not previous_node:
+            for child_key in record.child_keys:
+                child_node = self._reuse(
+                    child_key,
+                    path + [self._records[child_key].node["id"]],
+                    context,
+                    report,
+                )
+                node["children"].append(child_node)
+            if "error" in previous_node:
+                node["error"] = previous_node["error"]
+        else:
+            self._carry(record.child_keys, context)
+
+        return node
+
+    def _carry(self, keys: List[Hashable], context: _WalkContext) -> None:
+        """
+        Carry the records of the unchanged descendants over to the new snapshot.
+        :param keys: The keys of the children.
+        :param context: The state of the walk.
+        """
+        stack = list(keys)
+        while stack:
+            key = stack.pop()
+            record = self._records[key]
+            context.records[key] = record
+            context.reused += 1
+            stack.extend(record.child_keys)
+
+    def _report_children(
+        self,
+        previous: _NodeRecord,
+        node: Dict[str, Any],
+        child_keys: List[Hashable],
+        path: List[str],
+        context: _WalkContext,
+    ) -> None:
+        """
+        Report the added, removed and moved children of a node in the diff, with the index of the added and moved
+        children so that the diff can be applied in order.
+        :param previous: The record of the node in the previous snapshot.
+        :param node: The node in the new snapshot.
+        :param child_keys: The keys of the children in the new snapshot.
+        :param path: The IDs of the node and its ancestors.
+        :param context: The state of the walk.
+        """
+        previous_positions = {
+            child_key: position
+            for position, child_key in enumerate(previous.child_keys)
+        }
+
+        matched = []
+        for index, (child_key, child) in enumerate(zip(child_keys, node["children"])):
+            position = previous_positions.pop(child_key, None)
+            if position is None:
+                context.diff["added"].append(
+                    {"path": path + [child["id"]], "index": index, "node": child}
+                )
+            else:
+                matched.append((position, index, child["id"]))
+
+        for child_key in previous_positions:
+            removed = self._records[child_key].node
+            context.diff["removed"].append({"path": path + [removed["id"]]})
+
+        # The matched children out of the longest common subsequence have moved.
+        in_place = set(
+            longest_increasing_subsequence([position for position, _, _ in matched])
+        )
+        for i, (_, index, child_id) in enumerate(matched):
+            if i not in in_place:
+                context.diff["moved"].append(
+                    {"path": path + [child_id], "index": index}
+                )
+
+    @staticmethod
+    def _report_changes(
+        previous_node: Dict[str, Any],
+        node: Dict[str, Any],
+        path: List[str],
+        context: _WalkContext,
+    ) -> None:
+        """
+        Report the changed fields of a node in the diff.
+        :param previous_node: The node in the previous snapshot.
+        :param node: The node in the new snapshot.
+        :param path: The IDs of the node and its ancestors.
+        :param context: The state of the walk.
+        """
+        changes = {}
+        for diff_field in DIFF_FIELDS:
+            previous_value = previous_node.get(diff_field)
+            value = node.get(diff_field)
+            if previous_value != value:
+                changes[diff_field] = (previous_value, value)
+
+        if changes:
+            context.diff["modified"].append({"path": path, "changes": changes})
+
+    @staticmethod
+    def _make_node(
+        node_id: str,
+        name: str,
+        control_type: str,
+        rect: Rect,
+        level: int,
+        context: _WalkContext,
+    ) -> Dict[str, Any]:
+        """
+        Make a node in the format of UITree.
+        :param node_id: The ID of the node.
+        :param name: The name of the control.
+        :param control_type: The control type.
+        :param rect: The rectangle of the control.
+        :param level: The level of the node.
+        :param context: The state of the walk.
+        :return: The node, without children.
+        """
+        left, top, right, bottom = rect
+        window_left, window_top, window_right, window_bottom = context.window_rect
+        width = window_right - window_left
+        height = window_bottom - window_top
+
+        return {
+            "id": node_id,
+            "name": name,
+            "control_type": control_type,
+            "rectangle": {"left": left, "top": top, "right": right, "bottom": bottom},
+            "adjusted_rectangle": {
+                "left": left - window_left,
+                "top": top - window_top,
+                "right": right - window_left,
+                "bottom": bottom - window_top,
+            },
+            "relative_rectangle": {
+                "left": float(left - window_left) / width,
+                "top": float(top - window_top) / height,
+                "right": float(right - window_left) / width,
+                "bottom": float(bottom - window_top) / height,
+            },
+            "level": level,
+            "children": [],
+        }
+
+    def _new_id(self) -> str:
+        """
+        Generate a unique ID for a new node. The IDs of the known nodes are kept across the snapshots.
+        :return: The node ID.
+        """
+        node_id = f"node_{self._node_counter}"
+        self._node_counter += 1
+        return node_id
+
+    @classmethod
+    def _element_key(
+        cls,
+        element_info: Any,
+        parent_key: Optional[Hashable],
+        control_type: str,
+        name: str,
+        ordinal: int,
+    ) -> Hashable:
+        """
+        Get the key of an element, its runtime id if available, or else a hash of its path.
+        :param element_info: The element information.
+        :param parent_key: The key of the parent element.
+        :param control_type: The control type.
+        :param name: The name of the control.
+        :param ordinal: The number of the previous siblings with the same control type and name.
+        :return: The key.
+        """
+        runtime_id = cls._runtime_id(element_info)
+        if runtime_id is not None:
+            return runtime_id
+        return hash((parent_key, control_type, name, ordinal))
+
+    @staticmethod
+    def _runtime_id(element_info: Any) -> Optional[Tuple[int, ...]]:
+        """
+        Get the runtime id of an element.
+        :param element_info: The element information.
+        :return: The runtime id, or None if it is not available.
+        """
+        try:
+            runtime_id = element_info.runtime_id
+        except Exception:
+            return None
+        return tuple(runtime_id) if runtime_id else None
+
+    @staticmethod
+    def _rect_tuple(rect: Any) -> Rect:
+        """
+        Convert a rectangle to a tuple.
+        :param rect: The rectangle, with left, top, right and bottom.
+        :return: The tuple (left, top, right, bottom).
+        """
+        return (rect.left, rect.top, rect.right, rect.bottom)
+
+    @staticmethod
+    def _rect_from_dict(rect: Dict[str, int]) -> Rect:
+        """
+        Convert a rectangle of a node to a tuple.
+        :param rect: The rectangle dictionary.
+        :return: The tuple (left, top, right, bottom).
+        """
+        return (rect["left"], rect["top"], rect["right"], rect["bottom"])
+
+    @staticmethod
+    def _size(rect: Optional[Rect]) -> Optional[Tuple[int, int]]:
+        """
+        Get the size of a rectangle.
+        :param rect: The rectangle.
+        :return: The (width, height), or None.
+        """
+        if rect is None:
+            return None
+        return (rect[2] - rect[0], rect[3] - rect[1])
+
@@ -0,0 +1,489 @@
+# Copyright (c) Microsoft Corporation.
+# Licensed under the MIT License.
+
+"""
+A compact, columnar representation of the UI tree.
+
+The nodes are stored in depth-first order as parallel arrays: the rectangles, the levels and the parent indices, with
+the control types and names interned in string tables. The adjusted and relative rectangles are not stored, they are
+computed from the rectangles and the window rectangle. The nested dictionary format of UITree is still available
+through lazy read-only views, and the tree is written by streaming, either as JSON or as a compressed NPZ archive.
+"""
+
+import json
+import os
+from collections.abc import Mapping
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# The keys of a node, in the order of UITree.
+NODE_KEYS = (
+    "id",
+    "name",
+    "control_type",
+    "rectangle",
+    "adjusted_rectangle",
+    "relative_rectangle",
+    "level",
+    "children",
+)
+
+# The supported formats of the UI tree files.
+UI_TREE_FORMATS = ("json", "compact", "npz")
+
+
+class UITreeStore:
+    """
+    The columnar store of a UI tree.
+    """
+
+    def __init__(
+        self,
+        ids: List[str],
+        names: np.ndarray,
+        control_types: np.ndarray,
+        name_table: List[Optional[str]],
+        control_type_table: List[Optional[str]],
+        rects: np.ndarray,
+        levels: np.ndarray,
+        parents: np.ndarray,
+        errors: Optional[Dict[int, str]] = None,
+        root_error: Optional[str] = None,
+    ) -> None:
+        """
+        Initialize the store from its columns. Use from_tree or load to create a store.
+        :param ids: The node IDs.
+        :param names: The indices of the node names in the name table.
+        :param control_types: The indices of the node control types in the control type table.
+        :param name_table: The interned names.
+        :param control_type_table: The interned control types.
+        :param rects: The (N, 4) array of the rectangles (left, top, right, bottom).
+        :param levels: The levels of the nodes.
+        :param parents: The indices of the parent nodes, -1 for the root.
+        :param errors: The errors raised while walking the children of the nodes, by node index.
+        :param root_error: The error raised while walking the root, if the tree could not be captured at all.
+        """
+        self.ids = ids
+        self.names = names
+        self.control_types = control_types
+        self.name_table = name_table
+        self.control_type_table = control_type_table
+        self.rects = rects
+        self.levels = levels
+        self.parents = parents
+        self.errors = errors or {}
+        self.root_error = root_error
+
+        self._children_index = None
+        self._derived_rects = None
+
+    def __len__(self) -> int:
+        """
+        The number of nodes.
+        """
+        return len(self.ids)
+
+    @classmethod
+    def from_tree(cls, tree: Dict[str, Any]) -> "UITreeStore":
+        """
+        Build the store from a UI tree in the nested dictionary format of UITree.
+        :param tree: The UI tree.
+        :return: The store.
+        """
+        if "id" not in tree:
+            return cls._empty(root_error=tree.get("error"))
+
+        ids = []
+        names = []
+        control_types = []
+        rects = []
+        levels = []
+        parents = []
+        errors = {}
+
+        name_index: Dict[Optional[str], int] = {}
+        control_type_index: Dict[Optional[str], int] = {}
+
+        stack = [(tree, -1)]
+        while stack:
+            node, parent = stack.pop()
+            index = len(ids)
+
+            ids.append(node["id"])
+            names.append(name_index.setdefault(node["name"], len(name_index)))
+            control_types.append(
+                control_type_index.setdefault(
+                    node["control_type"], len(control_type_index)
+                )
+            )
+            rect = node["rectangle"]
+            rects.append((rect["left"], rect["top"], rect["right"], rect["bottom"]))
+            levels.append(node["level"])
+            parents.append(parent)
+            if "error" in node:
+                errors[index] = node["error"]
+
+            # Push the children in reverse order, so that they are popped in order.
+            for child in reversed(node.get("children", [])):
+                stack.append((child, index))
+
+        return cls(
+            ids=ids,
+            names=np.array(names, dtype=np.int32),
+            control_types=np.array(control_types, dtype=np.int32),
+            name_table=list(name_index),
+            control_type_table=list(control_type_index),
+            rects=np.array(rects, dtype=np.int64).reshape(-1, 4),
+            levels=np.array(levels, dtype=np.int32),
+            parents=np.array(parents, dtype=np.int32),
+            errors=errors,
+        )
+
+    @classmethod
+    def _empty(cls, root_error: Optional[str] = None) -> "UITreeStore":
+        """
+        Create an empty store.
+        :param root_error: The error raised while walking the root.
+        :return: The empty store.
+        """
+        return cls(
+            ids=[],
+            names=np.zeros(0, dtype=np.int32),
+            control_types=np.zeros(0, dtype=np.int32),
+            name_table=[],
+            control_type_table=[],
+            rects=np.zeros((0, 4), dtype=np.int64),
+            levels=np.zeros(0, dtype=np.int32),
+            parents=np.zeros(0, dtype=np.int32),
+            root_error=root_error,
+        )
+
+    @property
+    def window_rect(self) -> np.ndarray:
+        """
+        The rectangle of the root window.
+        """
+        return self.rects[0]
+
+    def children(self, index: int) -> np.ndarray:
+        """
+        Get the children of a node.
+        :param index: The index of the node.
+        :return: The indices of the children, in order.
+        """
+        if self._children_index is None:
+            # The nodes are in depth-first order, so a stable sort by parent keeps the children in order.
+            order = np.argsort(self.parents, kind="stable")
+            bounds = np.searchsorted(
+                self.parents[order], np.arange(-1, len(self.ids) + 1)
+            )
+            self._children_index = (order, bounds)
+
+        order, bounds = self._children_index
+        return order[bounds[index + 1] : bounds[index + 2]]
+
+    def _rect_columns(self) -> Dict[str, np.ndarray]:
+        """
+        Compute the adjusted and relative rectangles of all the nodes.
+        :return: The dictionary of the adjusted and relative rectangle arrays.
+        """
+        if self._derived_rects is None:
+            window_left, window_top, window_right, window_bottom = (
+                self.window_rect.tolist()
+            )
+            origin = np.array([window_left, window_top, window_left, window_top])
+            size = np.array(
+                [
+                    window_right - window_left,
+                    window_bottom - window_top,
+                    window_right - window_left,
+                    window_bottom - window_top,
+                ],
+                dtype=np.float64,
+            )
+            adjusted = self.rects - origin
+            relative = np.divide(
+                adjusted.astype(np.float64),
+                size,
+                out=np.zeros(adjusted.shape, dtype=np.float64),
+                where=size != 0,
+            )
+            self._derived_rects = {"adjusted": adjusted, "relative": relative}
+
+        return self._derived_rects
+
+    @staticmethod
+    def _rect_dict(values: List[Any]) -> Dict[str, Any]:
+        """
+        Convert a rectangle to its dictionary.
+        :param values: The rectangle (left, top, right, bottom).
+        :return: The rectangle dictionary.
+        """
+        left, top, right, bottom = values
+        return {"left": left, "top": top, "right": right, "bottom": bottom}
+
+    def node_field(self, index: int, key: str) -> Any:
+        """
+        Get a field of a node, in the format of UITree.
+        :param index: The index of the node.
+        :param key: The field.
+        :return: The value of the field.
+        """
+        if key == "id":
+            return self.ids[index]
+        if key == "name":
+            return self.name_table[self.names[index]]
+        if key == "control_type":
+            return self.control_type_table[self.control_types[index]]
+        if key == "rectangle":
+            return self._rect_dict(self.rects[index].tolist())
+        if key == "adjusted_rectangle":
+            return self._rect_dict(self._rect_columns()["adjusted"][index].tolist())
+        if key == "relative_rectangle":
+            return self._rect_dict(self._rect_columns()["relative"][index].tolist())
+        if key == "level":
+            return int(self.levels[index])
+        if key == "children":
+            return [UITreeNodeView(self, child) for child in self.children(index)]
+        if key == "error" and index in self.errors:
+            return self.errors[index]
+        raise KeyError(key)
+
+    def root(self) -> Mapping:
+        """
+        Get the lazy view of the root node, in the format of UITree.
+        :return: The view of the root, or a dictionary with the error if the tree could not be captured.
+        """
+        if len(self.ids) == 0:
+            return {"error": self.root_error} if self.root_error is not None else {}
+        return UITreeNodeView(self, 0)
+
+    def to_tree(self) -> Dict[str, Any]:
+        """
+        Build the nested dictionary format of UITree.
+        :return: The UI tree.
+        """
+        return json.loads("".join(self.iter_json(compact=True)))
+
+    def flatten(self) -> List[Dict[str, Any]]:
+        """
+        Flatten the UI tree into a list in depth-first order, as UITree.flatten_ui_tree.
+        :return: The list of the nodes without their IDs and children.
+        """
+        rects = self.rects.tolist()
+        adjusted = self._rect_columns()["adjusted"].tolist()
+        relative = self._rect_columns()["relative"].tolist()
+
+        return [
+            {
+                "name": self.name_table[name],
+                "control_type": self.control_type_table[control_type],
+                "rectangle": self._rect_dict(rects[i]),
+                "adjusted_rectangle": self._rect_dict(adjusted[i]),
+                "relative_rectangle": self._rect_dict(relative[i]),
+                "level": level,
+            }
+            for i, (name, control_type, level) in enumerate(
+                zip(
+                    self.names.tolist(),
+                    self.control_types.tolist(),
+                    self.levels.tolist(),
+                )
+            )
+        ]
+
+    def iter_json(self, compact: bool = True, chunk_size: int = 512) -> Iterator[str]:
+        """
+        Serialize the UI tree to JSON in the nested format of UITree, chunk by chunk.
+        :param compact: Whether to write compact JSON, or JSON indented by 4 spaces as json.dumps(indent=4).
+        :param chunk_size: The number of nodes per chunk.
+        :return: The iterator of the JSON chunks.
+        """
+        if len(self.ids) == 0:
+            yield json.dumps(
+                self.root(),
+                indent=None if compact else 4,
+                separators=(",", ":") if compact else None,
+            )
+            return
+
+        if not compact:
+            # The indented format is kept for the readers of the legacy logs, it is built node by node.
+            yield json.dumps(self.to_tree(), indent=4)
+            return
+
+        dumps = json.JSONEncoder(separators=(",", ":")).encode
+        rects = self.rects.tolist()
+        adjusted = self._rect_columns()["adjusted"].tolist()
+        relative = self._rect_columns()["relative"].tolist()
+        levels = self.levels.tolist()
+        parents = self.parents.tolist()
+        names = [dumps(name) for name in self.name_table]
+        control_types = [
+            dumps(control_type) for control_type in self.control_type_table
+        ]
+        name_indices = self.names.tolist()
+        control_type_indices = self.control_types.tolist()
+
+        # The rectangles are formatted directly, json.dumps gives the same text for the ints and the finite floats.
+        int_rect = '{"left":%d,"top":%d,"right":%d,"bottom":%d}'
+        float_rect = '{"left":%r,"top":%r,"right":%r,"bottom":%r}'
+
+        def close(index: int) -> str:
+            if index in self.errors:
+                return '],"error":' + dumps(self.errors[index]) + "}"
+            return "]}"
+
+        # The stack of the open nodes, with whether they already have a child.
+        stack: List[List[Any]] = []
+        chunk: List[str] = []
+
+        for i in range(len(self.ids)):
+            while stack and stack[-1][0] != parents[i]:
+                chunk.append(close(stack.pop()[0]))
+            if stack:
+                if stack[-1][1]:
+                    chunk.append(",")
+                stack[-1][1] = True
+
+            chunk.append(
+                '{"id":'
+                + dumps(self.ids[i])
+                + ',"name":'
+                + names[name_indices[i]]
+                + ',"control_type":'
+                + control_types[control_type_indices[i]]
+                + ',"rectangle":'
+                + int_rect % tuple(rects[i])
+                + ',"adjusted_rectangle":'
+                + int_rect % tuple(adjusted[i])
+                + ',"relative_rectangle":'
+                + float_rect % tuple(relative[i])
+                + ',"level":'
+                + str(levels[i])
+                + ',"children":['
+            )
+            stack.append([i, False])
+
+            if len(chunk) >= chunk_size:
+                yield "".join(chunk)
+                chunk = []
+
+        while stack:
+            chunk.append(close(stack.pop()[0]))
+
+        yield "".join(chunk)
+
+    def write_json(self, file: BinaryIO, compact: bool = True) -> None:
+        """
+        Stream the UI tree to a binary file as JSON.
+        :param file: The binary file object.
+        :param compact: Whether to write compact JSON, or JSON indented by 4 spaces.
+        """
+        for chunk in self.iter_json(compact=compact):
+            file.write(chunk.encode("utf-8"))
+
+    def write_npz(self, file: BinaryIO) -> None:
+        """
+        Write the columns of the UI tree to a binary file as a compressed NPZ archive.
+        :param file: The binary file object.
+        """
+        tables = {
+            "ids": self.ids,
+            "name_table": self.name_table,
+            "control_type_table": self.control_type_table,
+            "errors": {str(index): error for index, error in self.errors.items()},
+            "root_error": self.root_error,
+        }
+        np.savez_compressed(
+            file,
+            rects=self.rects,
+            levels=self.levels,
+            parents=self.parents,
+            names=self.names,
+            control_types=self.control_types,
+            tables=np.frombuffer(json.dumps(tables).encode("utf-8"), dtype=np.uint8),
+        )
+
+    def write(self, file: BinaryIO, file_format: str = "compact") -> None:
+        """
+        Write the UI tree to a binary file.
+        :param file: The binary file object.
+        :param file_format: The format, "json" for indented JSON, "compact" for compact JSON or "npz".
+        """
+        if file_format == "npz":
+            self.write_npz(file)
+        elif file_format in ("json", "compact"):
+            self.write_json(file, compact=file_format == "compact")
+        else:
+            raise ValueError(f"Invalid UI tree format: {file_format}")
+
+    @classmethod
+    def load(cls, file_path: str) -> "UITreeStore":
+        """
+        Load a UI tree file, in any of the formats.
+        :param file_path: The path of the file.
+        :return: The store.
+        """
+        if os.path.splitext(file_path)[1].lower() == ".npz":
+            with np.load(file_path, allow_pickle=False) as archive:
+                tables = json.loads(archive["tables"].tobytes().decode("utf-8"))
+                return cls(
+                    ids=tables["ids"],
+                    names=archive["names"],
+                    control_types=archive["control_types"],
+                    name_table=tables["name_table"],
+                    control_type_table=tables["control_type_table"],
+                    rects=archive["rects"],
+                    levels=archive["levels"],
+                    parents=archive["parents"],
+                    errors={
+                        int(index): error for index, error in tables["errors"].items()
+                    },
+                    root_error=tables["root_error"],
+                )
+
+        with open(file_path, "r", encoding="utf-8") as file:
+            return cls.from_tree(json.load(file))
+
+    @staticmethod
+    def file_extension(file_format: str) -> str:
+        """
+        Get the file extension of a format.
+        :param file_format: The format.
+        :return: The file extension, with the dot.
+        """
+        return ".npz" if file_format == "npz" else ".json"
+
+
+class UITreeNodeView(Mapping):
+    """
+    A lazy read-only view of a node of the store, in the nested dictionary format of UITree.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: UITreeStore, index: int) -> None:
+        """
+        Initialize the view.
+        :param store: The store.
+        :param index: The index of the node.
+        """
+        self._store = store
+        self._index = int(index)
+
+    def __getitem__(self, key: str) -> Any:
+        return self._store.node_field(self._index, key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield from NODE_KEYS
+        if self._index in self._store.errors:
+            yield "error"
+
+    def __len__(self) -> int:
+        return len(NODE_KEYS) + (1 if self._index in self._store.errors else 0)
+
+    def __repr__(self) -> str:
+        return f"UITreeNodeView({self['id']!r}, {self['control_type']!r}, {self['name']!r})"
+